@@ -0,0 +1,172 @@
+"""
+Static estimation of the area of generated matcher units, to choose between
+matcher architectures per pattern without running synthesis.
+
+Combinational logic is expressed in gate equivalents, one being a two-input
+gate. Registers are counted in bits, and converted to gate equivalents with
+`REGISTER_BIT_GATES` in totals. Like the logic depth estimation, it works both
+before and after the lowering of `hw_op` and `hw_sum` constructs.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, cast
+
+from xdsl.ir import Block, Operation
+
+from dialects.comb import *
+from dialects.fsm import FsmHwInstance, FsmMachine, FsmState, FsmVariable
+from dialects.hw import HwInstance, HwModule
+from dialects.hw_op import (
+    HwOpHasOperand,
+    HwOpHasResult,
+    HwOpIsOperation,
+    HwOpOperandAmountIs,
+    HwOpOperandTypeIs,
+    HwOpResultTypeIs,
+    HwOperation,
+)
+from dialects.hw_sum import HwSumIs, HwSumType
+from dialects.seq import SeqCompregCe
+
+from analysis.logic_depth import bit_width
+
+import math
+
+# Gate equivalents of a register bit with a clock enable.
+REGISTER_BIT_GATES = 8
+
+
+def _ceil_log2(value: int) -> int:
+    if value <= 1:
+        return 0
+    return math.ceil(math.log2(value))
+
+
+def _result_width(op: Operation) -> int:
+    return bit_width(op.results[0].typ)
+
+
+def _comparator_gates(width: int) -> int:
+    # Bitwise XNOR followed by an AND reduction tree.
+    return 2 * width - 1
+
+
+def _icmp_gates(op: Operation) -> int:
+    icmp = cast(CombICmp, op)
+    width = bit_width(icmp.lhs.typ)
+    if ICmpPredicate(icmp.predicate.value.data) in [
+        ICmpPredicate.EQ,
+        ICmpPredicate.NE,
+        ICmpPredicate.CEQ,
+        ICmpPredicate.CNE,
+        ICmpPredicate.WEQ,
+        ICmpPredicate.WNE,
+    ]:
+        return _comparator_gates(width)
+    # Ordering predicates are a subtraction carry chain.
+    return 3 * width
+
+
+def _opcode_check_gates(op: Operation) -> int:
+    op_type = cast(HwOperation, op.operands[0].typ)
+    return _comparator_gates(op_type.opcode_integer.width.data) + 1
+
+
+def _sum_is_gates(op: Operation) -> int:
+    sum_type = cast(HwSumType, op.operands[0].typ)
+    return _comparator_gates(max(1, _ceil_log2(len(sum_type.cases.data))))
+
+
+AreaModel = dict[type[Operation], Callable[[Operation], int]]
+
+"""
+Default gate equivalents of the constructs emitted by the matcher generators.
+Operations not in the model only move wires around and are free.
+"""
+DEFAULT_AREA_MODEL: AreaModel = {
+    CombAnd: lambda op: (len(op.operands) - 1) * _result_width(op),
+    CombOr: lambda op: (len(op.operands) - 1) * _result_width(op),
+    CombXor: lambda op: (len(op.operands) - 1) * _result_width(op),
+    # A two-input multiplexer is an AND-OR pair per bit, with a shared inverter.
+    CombMux: lambda op: 2 * _result_width(op) + 1,
+    CombICmp: _icmp_gates,
+    # Full adders cost five gates per bit.
+    CombAdd: lambda op: 5 * (len(op.operands) - 1) * _result_width(op),
+    CombSub: lambda op: 6 * _result_width(op),
+    HwSumIs: _sum_is_gates,
+    HwOpHasOperand: _opcode_check_gates,
+    HwOpHasResult: _opcode_check_gates,
+    HwOpIsOperation: _opcode_check_gates,
+    HwOpOperandAmountIs: _opcode_check_gates,
+    HwOpOperandTypeIs: _opcode_check_gates,
+    HwOpResultTypeIs: _opcode_check_gates,
+}
+
+
+@dataclass
+class AreaEstimate:
+    """
+    Area estimation of a matcher unit.
+
+    Field:
+    - register_bits: bits of the registers of the unit, including the modules it
+                     instantiates and the state of its FSM.
+    - logic_gates: gate equivalents of the combinational logic of the unit,
+                   including the modules it instantiates and its FSM.
+    """
+
+    matcher_name: str
+    register_bits: int = 0
+    logic_gates: int = 0
+
+    def total_gates(self) -> int:
+        return self.logic_gates + self.register_bits * REGISTER_BIT_GATES
+
+    def format(self) -> str:
+        report = f"{self.matcher_name}: {self.total_gates()} gate equivalents"
+        report += f" ({self.register_bits} register bits,"
+        report += f" {self.logic_gates} logic gates)"
+        return report
+
+
+def _add_ops(estimate: AreaEstimate, ops: list[Operation], area_model: AreaModel):
+    for op in ops:
+        if isinstance(op, SeqCompregCe):
+            estimate.register_bits += bit_width(op.data.typ)
+        elif isinstance(op, FsmVariable):
+            estimate.register_bits += bit_width(op.results[0].typ)
+        else:
+            estimate.logic_gates += area_model.get(type(op), lambda op: 0)(op)
+
+
+def estimate_area(
+    hw_module: HwModule,
+    fsm: FsmMachine,
+    filler_modules: list[HwModule] | None = None,
+    area_model: AreaModel = DEFAULT_AREA_MODEL,
+) -> AreaEstimate:
+    """
+    Estimates the area of a matcher unit, of the filler modules it instantiates
+    and of its FSM, whose state is encoded in binary.
+    """
+    estimate = AreaEstimate(hw_module.sym_name.data)
+    modules = {x.sym_name.data: x for x in filler_modules or []}
+
+    def add_module(block: Block):
+        _add_ops(estimate, list(block.ops), area_model)
+        for op in block.ops:
+            if isinstance(op, HwInstance):
+                module = modules.get(op.module_name.root_reference.data)
+                if module:
+                    add_module(module.regions[0].blocks[0])
+            elif isinstance(op, FsmHwInstance):
+                if op.machine.root_reference == fsm.sym_name:
+                    add_fsm()
+
+    def add_fsm():
+        states = [x for x in fsm.body.blocks[0].ops if isinstance(x, FsmState)]
+        estimate.register_bits += _ceil_log2(len(states))
+        _add_ops(estimate, list(fsm.walk()), area_model)
+
+    add_module(hw_module.regions[0].blocks[0])
+    return estimate
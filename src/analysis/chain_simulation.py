@@ -0,0 +1,147 @@
+from dataclasses import dataclass
+from typing import Callable
+
+"""
+Cycle-level model of the stream going through a chain of matcher units, to
+compare the stalls of the lock-step chain, where a late unit pauses the whole
+stream, with the decoupled chain, where each unit reads the stream from its
+own FIFO and only pauses itself.
+
+The model only tracks when each unit consumes each operation of the stream.
+Unit `n` starts an attempt on every operation `Ni+n`, and the stream is
+completed for it `window` operations later. Its FSM then decides after an
+amount of cycles given by a latency function of the root, at most the bound
+of `compute_fsm_cycle_bound`. A unit can only consume the root of its next
+attempt once the previous one is decided. Operations are always available at
+the input of the chain, so stalls only come from units running late.
+"""
+
+
+@dataclass
+class ChainSimulation:
+    """
+    Outcome of the simulation of a chain on a stream.
+
+    Field:
+    - stall_cycles: cycles during which the chain did not accept the next
+                    operation of the stream.
+    - total_cycles: cycles until the last unit consumed the last operation.
+    """
+
+    stall_cycles: int
+    total_cycles: int
+
+
+@dataclass
+class ChainComparison:
+    lock_step: ChainSimulation
+    decoupled: ChainSimulation
+    fifo_depth: int
+
+    def format(self) -> str:
+        report = f"lock-step: {self.lock_step.stall_cycles} stall cycles"
+        report += f" ({self.lock_step.total_cycles} cycles)\n"
+        report += f"decoupled (FIFO depth {self.fifo_depth}):"
+        report += f" {self.decoupled.stall_cycles} stall cycles"
+        report += f" ({self.decoupled.total_cycles} cycles)"
+        return report
+
+
+# Latency of the decision of the FSM after the end of the window of the
+# attempt rooted at the provided stream position.
+DecisionLatency = Callable[[int], int]
+
+
+def _decided_at(
+    consumed_at: list[int], root: int, window: int, latency: DecisionLatency
+) -> int:
+    """Cycle at which the attempt on `root` is decided."""
+    return consumed_at[root + window - 1] + latency(root)
+
+
+def simulate_lock_step_chain(
+    unit_count: int, window: int, stream_length: int, latency: DecisionLatency
+) -> ChainSimulation:
+    """
+    Simulates the lock-step chain, in which all units consume the stream at the
+    same time, so a unit that is not done pauses every unit.
+    """
+    assert window <= unit_count
+    consumed_at: list[int] = []
+    for position in range(stream_length):
+        cycle = consumed_at[-1] + 1 if consumed_at else 0
+        if position >= unit_count:
+            previous_root = position - unit_count
+            cycle = max(
+                cycle, _decided_at(consumed_at, previous_root, window, latency)
+            )
+        consumed_at.append(cycle)
+    # Unit `n` sees the stream `n` cycles after the first one.
+    total_cycles = consumed_at[-1] + unit_count if consumed_at else 0
+    return ChainSimulation(consumed_at[-1] - (stream_length - 1), total_cycles)
+
+
+def simulate_decoupled_chain(
+    unit_count: int,
+    window: int,
+    stream_length: int,
+    latency: DecisionLatency,
+    fifo_depth: int,
+) -> ChainSimulation:
+    """
+    Simulates the decoupled chain, in which each unit pops the stream from a
+    FIFO of `fifo_depth` operations, filled by the previous unit as it consumes
+    them. A unit pauses when its FIFO is empty, when the FIFO of the next unit
+    is full, or when the root of its next attempt arrives before its previous
+    attempt is decided.
+    """
+    assert window <= unit_count
+    assert fifo_depth >= 1
+    pushed_at: list[int] = []
+    consumed_at: list[list[int]] = [[] for _ in range(unit_count)]
+    # Operations are consumed in stream order by each unit, and a unit only
+    # waits for room in the FIFO of the next unit behind earlier operations, so
+    # the earliest schedule is built operation by operation.
+    for position in range(stream_length):
+        # An operation enters a FIFO the cycle after the operation `fifo_depth`
+        # ahead of it left it. The stream is the producer of the first FIFO.
+        cycle = pushed_at[-1] + 1 if pushed_at else 0
+        if position >= fifo_depth:
+            cycle = max(cycle, consumed_at[0][position - fifo_depth] + 1)
+        pushed_at.append(cycle)
+
+        for unit in range(unit_count):
+            producer = pushed_at if unit == 0 else consumed_at[unit - 1]
+            cycle = producer[position] + 1
+            if position > 0:
+                cycle = max(cycle, consumed_at[unit][position - 1] + 1)
+            if unit + 1 < unit_count and position >= fifo_depth:
+                cycle = max(cycle, consumed_at[unit + 1][position - fifo_depth] + 1)
+            if position >= unit_count and position % unit_count == unit:
+                previous_root = position - unit_count
+                cycle = max(
+                    cycle,
+                    _decided_at(consumed_at[unit], previous_root, window, latency),
+                )
+            consumed_at[unit].append(cycle)
+
+    stall_cycles = pushed_at[-1] - (stream_length - 1) if pushed_at else 0
+    total_cycles = consumed_at[-1][-1] + 1 if stream_length else 0
+    return ChainSimulation(stall_cycles, total_cycles)
+
+
+def compare_chain_schemes(
+    unit_count: int,
+    window: int,
+    stream_length: int,
+    latency: DecisionLatency,
+    fifo_depth: int,
+) -> ChainComparison:
+    """Simulates the same stream through the lock-step and decoupled chains."""
+    return ChainComparison(
+        simulate_lock_step_chain(unit_count, window, stream_length, latency),
+        simulate_decoupled_chain(
+            unit_count, window, stream_length, latency, fifo_depth
+        ),
+        fifo_depth,
+    )
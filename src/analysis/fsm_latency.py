@@ -0,0 +1,55 @@
+from dataclasses import dataclass
+
+from dialects.fsm import FsmMachine, FsmState, FsmTransition
+
+"""
+Static bound on the amount of cycles a pattern FSM takes to decide.
+
+The FSM waits in a state until the DAG buffer nodes its guards read are
+resolved, then takes one transition per cycle. Once the stream is completed
+for an attempt, every node is resolved, so the FSM decides within as many
+cycles as the longest path of its state graph. This is how late a unit may
+be at the end of its window.
+"""
+
+
+@dataclass
+class FsmHasCycles(Exception):
+    """The state graph of the FSM is not acyclic, so its decision is not bounded."""
+
+    state: str
+
+
+def compute_fsm_cycle_bound(fsm: FsmMachine) -> int:
+    """
+    Computes the maximum amount of transitions the FSM may take from its
+    initial state, which bounds the cycles it needs to decide once all DAG
+    buffer nodes are resolved.
+    """
+    successors: dict[str, list[str]] = dict()
+    for state in fsm.body.blocks[0].ops:
+        if not isinstance(state, FsmState):
+            continue
+        successors[state.sym_name.data] = [
+            x.next_state.root_reference.data
+            for x in state.transitions.ops
+            if isinstance(x, FsmTransition)
+        ]
+
+    longest: dict[str, int] = dict()
+    visiting: set[str] = set()
+
+    def longest_from(state: str) -> int:
+        if state in longest:
+            return longest[state]
+        if state in visiting:
+            raise FsmHasCycles(state)
+        visiting.add(state)
+        length = max(
+            [1 + longest_from(x) for x in successors.get(state, [])], default=0
+        )
+        visiting.remove(state)
+        longest[state] = length
+        return length
+
+    return longest_from(fsm.initial_state.data)
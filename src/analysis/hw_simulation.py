@@ -0,0 +1,374 @@
+from dataclasses import dataclass
+from typing import Callable, cast
+
+from xdsl.ir import Block, BlockArgument, Operation, OpResult, SSAValue
+from xdsl.dialects.builtin import IntegerType, ModuleOp
+
+from dialects.comb import *
+from dialects.fsm import (
+    FsmHwInstance,
+    FsmMachine,
+    FsmOutput,
+    FsmReturn,
+    FsmState,
+    FsmTransition,
+)
+from dialects.hw import HwConstant, HwInstance, HwModule, HwOutput
+from dialects.seq import SeqCompregCe
+
+"""
+Cycle-level simulation of generated hardware, once `hw_op` and `hw_sum`
+constructs are lowered to integers, to check the behavior of matcher units and
+chains without an external RTL simulator.
+
+The hierarchy of instances is flattened into a single netlist, which is
+compiled to a Python function computing the outputs and the next state of the
+design in one cycle. The semantics follow the ones of CIRCT:
+- All registers are driven by a single clock. A register takes its reset value
+  when its reset is set, regardless of its clock enable.
+- FSMs take the first transition of their current state whose guard holds, and
+  go back to their initial state when their reset is set.
+
+Registers power on with their reset value, evaluated with all inputs and
+registers at zero, and FSMs power on in their initial state.
+"""
+
+
+@dataclass
+class UnsupportedSimulationOp(Exception):
+    op: Operation
+
+
+@dataclass
+class CombinationalLoop(Exception):
+    value: SSAValue
+
+
+def _width(value: SSAValue) -> int:
+    typ = value.typ
+    if not isinstance(typ, IntegerType):
+        raise UnsupportedSimulationOp(cast(Operation, value.owner))
+    return typ.width.data
+
+
+def _mask(value: SSAValue) -> int:
+    return (1 << _width(value)) - 1
+
+
+def _signed(value: int, width: int) -> int:
+    return value - (1 << width) if value >> (width - 1) else value
+
+
+_PREDICATES: dict[ICmpPredicate, str] = {
+    ICmpPredicate.EQ: "==",
+    ICmpPredicate.NE: "!=",
+    ICmpPredicate.ULT: "<",
+    ICmpPredicate.ULE: "<=",
+    ICmpPredicate.UGT: ">",
+    ICmpPredicate.UGE: ">=",
+    ICmpPredicate.CEQ: "==",
+    ICmpPredicate.CNE: "!=",
+    ICmpPredicate.WEQ: "==",
+    ICmpPredicate.WNE: "!=",
+}
+
+_SIGNED_PREDICATES: dict[ICmpPredicate, str] = {
+    ICmpPredicate.SLT: "<",
+    ICmpPredicate.SLE: "<=",
+    ICmpPredicate.SGT: ">",
+    ICmpPredicate.SGE: ">=",
+}
+
+
+class _Instance:
+    """Instance of a module or machine in the flattened hierarchy."""
+
+    def __init__(
+        self,
+        body: Block,
+        parent: "_Instance | None" = None,
+        op: HwInstance | FsmHwInstance | None = None,
+    ):
+        self.body = body
+        self.parent = parent
+        self.op = op
+        self.children: dict[Operation, _Instance] = dict()
+
+
+# A net is a value in a given instance.
+_Net = tuple[_Instance, SSAValue]
+
+
+class _Netlist:
+    """Flattening of a design into Python statements, in dependency order."""
+
+    def __init__(self, modules: dict[str, HwModule], machines: dict[str, FsmMachine]):
+        self.modules = modules
+        self.machines = machines
+        self.statements: list[str] = []
+        self.names: dict[tuple[int, int], str] = dict()
+        # Registers and FSM instances, in the order of their state slot.
+        self.stateful: list[tuple[_Instance, Operation]] = []
+        self.slot_of: dict[tuple[int, int], int] = dict()
+
+    def _child(self, instance: _Instance, op: HwInstance | FsmHwInstance) -> _Instance:
+        if op not in instance.children:
+            if isinstance(op, HwInstance):
+                module = self.modules[op.module_name.root_reference.data]
+                body = module.regions[0].blocks[0]
+            else:
+                machine = self.machines[op.machine.root_reference.data]
+                body = machine.body.blocks[0]
+            instance.children[op] = _Instance(body, instance, op)
+        return instance.children[op]
+
+    def _resolve(self, instance: _Instance, value: SSAValue) -> _Net:
+        """Follows module ports to the net actually driving a value."""
+        while True:
+            if isinstance(value, BlockArgument):
+                if value.block != instance.body or not instance.parent:
+                    return instance, value
+                assert instance.op
+                value = instance.op.operands[value.index]
+                instance = instance.parent
+            elif isinstance(value.owner, HwInstance):
+                result = cast(OpResult, value)
+                instance = self._child(instance, result.op)
+                value = HwOutput.get_unique_output(instance.body).operands[result.index]
+            else:
+                return instance, value
+
+    def _slot(self, instance: _Instance, op: Operation) -> int:
+        key = (id(instance), id(op))
+        if key not in self.slot_of:
+            self.slot_of[key] = len(self.stateful)
+            self.stateful.append((instance, op))
+        return self.slot_of[key]
+
+    def _fsm_outputs(self, instance: _Instance) -> list[tuple[int, FsmOutput]]:
+        outputs: list[tuple[int, FsmOutput]] = []
+        for index, state in enumerate(self._fsm_states(instance)):
+            output = state.output.blocks[0].last_op
+            if isinstance(output, FsmOutput):
+                outputs.append((index, output))
+        return outputs
+
+    def _fsm_states(self, instance: _Instance) -> list[FsmState]:
+        return [x for x in instance.body.ops if isinstance(x, FsmState)]
+
+    def _dependencies(self, instance: _Instance, value: SSAValue) -> list[_Net]:
+        if isinstance(value, BlockArgument):
+            return []
+        op = cast(OpResult, value).op
+        if isinstance(op, SeqCompregCe):
+            return []
+        if isinstance(op, FsmHwInstance):
+            machine = self._child(instance, op)
+            return [
+                (machine, output.operands[cast(OpResult, value).index])
+                for _, output in self._fsm_outputs(machine)
+            ]
+        return [(instance, x) for x in op.operands]
+
+    def _expression(
+        self, instance: _Instance, value: SSAValue, operands: list[str]
+    ) -> str:
+        if isinstance(value, BlockArgument):
+            # Only the arguments of the top-level module are not resolved.
+            assert not instance.parent
+            return f"inputs[{value.index}]"
+        op = cast(OpResult, value).op
+        mask = _mask(value)
+        match op:
+            case SeqCompregCe():
+                return f"state[{self._slot(instance, op)}]"
+            case FsmHwInstance():
+                slot = self._slot(instance, op)
+                machine = self._child(instance, op)
+                states = [x for x, _ in self._fsm_outputs(machine)]
+                expression = "0"
+                for state, operand in reversed(list(zip(states, operands))):
+                    expression = (
+                        f"({operand} if state[{slot}] == {state} else {expression})"
+                    )
+                return expression
+            case HwConstant():
+                return str(op.value.value.data & mask)
+            case CombAnd():
+                return " & ".join(operands)
+            case CombOr():
+                return " | ".join(operands)
+            case CombXor():
+                return " ^ ".join(operands)
+            case CombAdd():
+                return f"({' + '.join(operands)}) & {mask}"
+            case CombSub():
+                return f"({operands[0]} - {operands[1]}) & {mask}"
+            case CombMux():
+                return f"{operands[1]} if {operands[0]} else {operands[2]}"
+            case CombExtract():
+                return f"({operands[0]} >> {op.low_bit.value.data}) & {mask}"
+            case CombConcat():
+                concatenated = operands[0]
+                for operand, input in zip(operands[1:], op.operands[1:]):
+                    concatenated = f"({concatenated} << {_width(input)}) | {operand}"
+                return concatenated
+            case CombICmp():
+                predicate = ICmpPredicate(op.predicate.value.data)
+                if predicate in _SIGNED_PREDICATES:
+                    width = _width(op.operands[0])
+                    comparison = _SIGNED_PREDICATES[predicate]
+                    return (
+                        f"int(_signed({operands[0]}, {width}) {comparison}"
+                        f" _signed({operands[1]}, {width}))"
+                    )
+                return f"int({operands[0]} {_PREDICATES[predicate]} {operands[1]})"
+            case _:
+                raise UnsupportedSimulationOp(op)
+
+    def name_of(self, instance: _Instance, value: SSAValue) -> str:
+        """
+        Name of the local variable holding the value of a net, emitting the
+        statements computing it and its dependencies if needed.
+        """
+        root = self._resolve(instance, value)
+        stack = [root]
+        pending: set[tuple[int, int]] = set()
+        while len(stack) != 0:
+            instance, value = stack[-1]
+            key = (id(instance), id(value))
+            if key in self.names:
+                stack.pop()
+                continue
+            dependencies = [
+                self._resolve(*x) for x in self._dependencies(instance, value)
+            ]
+            missing = [
+                x for x in dependencies if (id(x[0]), id(x[1])) not in self.names
+            ]
+            if len(missing) != 0:
+                if key in pending:
+                    raise CombinationalLoop(value)
+                pending.add(key)
+                stack += missing
+                continue
+            stack.pop()
+            pending.discard(key)
+            operands = [self.names[(id(x[0]), id(x[1]))] for x in dependencies]
+            name = f"v{len(self.names)}"
+            self.statements.append(
+                f"    {name} = {self._expression(instance, value, operands)}"
+            )
+            self.names[key] = name
+        return self.names[(id(root[0]), id(root[1]))]
+
+    def next_state_of(self, slot: int) -> str:
+        """Expression of the value of a state slot after the clock edge."""
+        instance, op = self.stateful[slot]
+        if isinstance(op, SeqCompregCe):
+            reset = self.name_of(instance, op.reset)
+            reset_value = self.name_of(instance, op.resetValue)
+            enable = self.name_of(instance, op.clockEnable)
+            input = self.name_of(instance, op.input)
+            return (
+                f"{reset_value} if {reset} else"
+                f" ({input} if {enable} else state[{slot}])"
+            )
+
+        machine_op = cast(FsmHwInstance, op)
+        machine = self._child(instance, machine_op)
+        states = self._fsm_states(machine)
+        index_of = {x.sym_name.data: i for i, x in enumerate(states)}
+        machine_def = self.machines[machine_op.machine.root_reference.data]
+        next_state = str(index_of[machine_def.initial_state.data])
+        for index, state in reversed(list(enumerate(states))):
+            taken = f"state[{slot}]"
+            for transition in reversed(list(state.transitions.blocks[0].ops)):
+                transition = cast(FsmTransition, transition)
+                if len(transition.action.blocks[0].ops) != 0:
+                    raise UnsupportedSimulationOp(transition)
+                target = index_of[transition.next_state.root_reference.data]
+                guard = transition.guard.blocks[0].last_op
+                if not isinstance(guard, FsmReturn):
+                    taken = str(target)
+                    continue
+                guard_name = self.name_of(machine, guard.operand)
+                taken = f"({target} if {guard_name} else {taken})"
+            next_state = f"({taken} if state[{slot}] == {index} else {next_state})"
+        reset = self.name_of(instance, machine_op.reset)
+        initial_state = index_of[machine_def.initial_state.data]
+        return f"{initial_state} if {reset} else {next_state}"
+
+
+class HwSimulation:
+    """
+    Cycle-level simulation of a hardware module, whose instantiated modules and
+    machines are found in the same builtin module.
+    """
+
+    def __init__(self, module: ModuleOp, top_name: str):
+        modules = {x.sym_name.data: x for x in module.ops if isinstance(x, HwModule)}
+        machines = {x.sym_name.data: x for x in module.ops if isinstance(x, FsmMachine)}
+        top = modules[top_name]
+        self.input_names = [x.data for x in top.argNames.data]
+        self.output_names = [x.data for x in top.resultNames.data]
+
+        netlist = _Netlist(modules, machines)
+        body = top.regions[0].blocks[0]
+        root = _Instance(body)
+        outputs = [
+            netlist.name_of(root, x) for x in HwOutput.get_unique_output(body).operands
+        ]
+        next_states: list[str] = []
+        while len(next_states) != len(netlist.stateful):
+            next_states.append(netlist.next_state_of(len(next_states)))
+        reset_values: list[str] = []
+        for instance, op in netlist.stateful:
+            if isinstance(op, SeqCompregCe):
+                reset_values.append(netlist.name_of(instance, op.resetValue))
+            else:
+                reset_values.append(f"state[{netlist.slot_of[(id(instance), id(op))]}]")
+
+        self._cycle = self._compile(
+            netlist.statements,
+            f"[{', '.join(outputs)}], [{', '.join(next_states)}]",
+        )
+        reset_function = self._compile(
+            netlist.statements, f"[], [{', '.join(reset_values)}]"
+        )
+
+        # FSMs power on in their initial state, registers with their reset value.
+        self.state: list[int] = []
+        for instance, op in netlist.stateful:
+            if isinstance(op, FsmHwInstance):
+                machine = machines[op.machine.root_reference.data]
+                states = [
+                    x.sym_name.data
+                    for x in machine.body.blocks[0].ops
+                    if isinstance(x, FsmState)
+                ]
+                self.state.append(states.index(machine.initial_state.data))
+            else:
+                self.state.append(0)
+        _, self.state = reset_function([0] * len(self.input_names), self.state)
+
+    @staticmethod
+    def _compile(
+        statements: list[str], returned: str
+    ) -> Callable[[list[int], list[int]], tuple[list[int], list[int]]]:
+        source = "\n".join(
+            ["def cycle(inputs, state):"] + statements + [f"    return {returned}"]
+        )
+        namespace = {"_signed": _signed}
+        exec(compile(source, "<hw_simulation>", "exec"), namespace)
+        return namespace["cycle"]
+
+    def step(self, inputs: dict[str, int]) -> dict[str, int]:
+        """
+        Computes the outputs of the top module in the current cycle for the
+        provided inputs, missing ones being zero, then clocks the design.
+        """
+        outputs, self.state = self._cycle(
+            [inputs.get(x, 0) for x in self.input_names], self.state
+        )
+        return dict(zip(self.output_names, outputs))
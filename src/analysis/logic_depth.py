@@ -0,0 +1,301 @@
+from dataclasses import dataclass, field
+from typing import Callable, cast
+
+from xdsl.ir import Attribute, Block, Operation, SSAValue
+from xdsl.dialects.builtin import IntegerType
+
+from dialects.comb import *
+from dialects.fsm import FsmHwInstance, FsmMachine, FsmReturn, FsmState, FsmTransition
+from dialects.hw import HwConstant, HwInstance, HwModule, HwOutput
+from dialects.hw_op import (
+    HwOpGetOpcode,
+    HwOpGetOperandOffset,
+    HwOpHasOperand,
+    HwOpHasResult,
+    HwOpIsOperation,
+    HwOpOperandAmountIs,
+    HwOpOperandTypeIs,
+    HwOpResultTypeIs,
+    HwOperation,
+)
+from dialects.hw_sum import HwSumCreate, HwSumGetAs, HwSumIs, HwSumType
+from dialects.seq import SeqCompregCe
+
+import math
+
+"""
+Static estimation of the combinational logic depth of generated matcher units.
+
+Depths are expressed in logic levels, one level being roughly the delay of a
+two-input gate. The estimation works both before and after the lowering of
+`hw_op` and `hw_sum` constructs, so patterns can be tuned for Fmax without
+running synthesis.
+"""
+
+
+def _ceil_log2(value: int) -> int:
+    if value <= 1:
+        return 0
+    return math.ceil(math.log2(value))
+
+
+def bit_width(typ: Attribute) -> int:
+    if isinstance(typ, IntegerType):
+        return typ.width.data
+    if isinstance(typ, HwOperation):
+        return typ.get_bit_width()
+    if isinstance(typ, HwSumType):
+        data_width = max([bit_width(x) for x in typ.cases.data.values()])
+        return _ceil_log2(len(typ.cases.data)) + data_width
+    return 1
+
+
+def _comparator_depth(width: int) -> int:
+    # Bitwise XNOR followed by an AND reduction tree.
+    return 1 + _ceil_log2(width)
+
+
+def _adder_depth(operand_amount: int, width: int) -> int:
+    if operand_amount <= 1:
+        return 0
+    # Carry-save reduction of the operands down to two, each 3:2 compressor
+    # stage costing two levels, followed by a parallel-prefix adder.
+    reduction_levels = 0
+    while operand_amount > 2:
+        operand_amount = math.ceil(2 * operand_amount / 3)
+        reduction_levels += 1
+    return 2 * reduction_levels + 2 + _ceil_log2(width)
+
+
+def _icmp_delay(op: Operation) -> int:
+    icmp = cast(CombICmp, op)
+    width = bit_width(icmp.lhs.typ)
+    predicate = ICmpPredicate(icmp.predicate.value.data)
+    if predicate in [
+        ICmpPredicate.EQ,
+        ICmpPredicate.NE,
+        ICmpPredicate.CEQ,
+        ICmpPredicate.CNE,
+        ICmpPredicate.WEQ,
+        ICmpPredicate.WNE,
+    ]:
+        return _comparator_depth(width)
+    # Ordering predicates are a subtraction carry chain.
+    return 2 + _ceil_log2(width)
+
+
+def _opcode_check_delay(op: Operation) -> int:
+    # HwOp predicates lower to a set of opcode comparisons merged by an OR.
+    op_type = cast(HwOperation, op.operands[0].typ)
+    return _comparator_depth(op_type.opcode_integer.width.data) + 1
+
+
+def _sum_is_delay(op: Operation) -> int:
+    sum_type = cast(HwSumType, op.operands[0].typ)
+    return _comparator_depth(_ceil_log2(len(sum_type.cases.data)))
+
+
+DelayModel = dict[type[Operation], Callable[[Operation], int]]
+
+# Default delay of the constructs emitted by the matcher generator. Operations
+# only moving wires around are free, operations not in the model are counted
+# as a single level.
+DEFAULT_DELAY_MODEL: DelayModel = {
+    HwConstant: lambda op: 0,
+    CombConcat: lambda op: 0,
+    CombExtract: lambda op: 0,
+    CombAnd: lambda op: _ceil_log2(len(op.operands)),
+    CombOr: lambda op: _ceil_log2(len(op.operands)),
+    CombXor: lambda op: max(1, _ceil_log2(len(op.operands))),
+    CombMux: lambda op: 1,
+    CombICmp: _icmp_delay,
+    CombAdd: lambda op: _adder_depth(len(op.operands), bit_width(op.results[0].typ)),
+    CombSub: lambda op: 1 + _adder_depth(2, bit_width(op.results[0].typ)),
+    HwSumCreate: lambda op: 0,
+    HwSumGetAs: lambda op: 0,
+    HwSumIs: _sum_is_delay,
+    HwOpGetOpcode: lambda op: 0,
+    HwOpGetOperandOffset: lambda op: 0,
+    HwOpHasOperand: _opcode_check_delay,
+    HwOpHasResult: _opcode_check_delay,
+    HwOpIsOperation: _opcode_check_delay,
+    HwOpOperandAmountIs: _opcode_check_delay,
+    HwOpOperandTypeIs: _opcode_check_delay,
+    HwOpResultTypeIs: _opcode_check_delay,
+}
+
+# Transition guards deeper than this amount of logic levels are reported.
+TARGET_LOGIC_DEPTH = 24
+
+
+@dataclass
+class CriticalPath:
+    """
+    A combinational path between two sequential elements.
+    `ops` lists the name of the operations along the path, from source to sink.
+    """
+
+    depth: int = 0
+    ops: list[str] = field(default_factory=list)
+
+
+@dataclass
+class GuardDepth:
+    """Logic depth of the guard of the transition from `state` to `next_state`."""
+
+    state: str
+    next_state: str
+    path: CriticalPath
+
+
+@dataclass
+class LogicDepthReport:
+    """
+    Logic depth estimation of a matcher unit.
+
+    Field:
+    - module_path: deepest path between registers of the matcher module itself,
+                   which includes the DAG buffer filler logic.
+    - guards: depth of every transition guard of the pattern FSM, including the
+              depth of the logic feeding the FSM inputs.
+    """
+
+    matcher_name: str
+    module_path: CriticalPath
+    guards: list[GuardDepth]
+
+    def deepest_path(self) -> CriticalPath:
+        paths = [self.module_path] + [x.path for x in self.guards]
+        return max(paths, key=lambda x: x.depth)
+
+    def guards_exceeding(self, target: int) -> list[GuardDepth]:
+        return [x for x in self.guards if x.path.depth > target]
+
+    def format(self, target: int = TARGET_LOGIC_DEPTH) -> str:
+        deepest = self.deepest_path()
+        report = f"{self.matcher_name}: deepest path is {deepest.depth} levels"
+        report += f" ({' -> '.join(deepest.ops)})\n"
+        report += f"  filler logic: {self.module_path.depth} levels\n"
+        for guard in self.guards_exceeding(target):
+            report += (
+                f"  guard {guard.state} -> {guard.next_state} exceeds target"
+                f" ({guard.path.depth} > {target} levels)\n"
+            )
+        return report
+
+
+class _ArrivalTimes:
+    """Propagates arrival times through the operations of nested blocks."""
+
+    delay_model: DelayModel
+    paths: dict[SSAValue, CriticalPath]
+
+    def __init__(self, delay_model: DelayModel):
+        self.delay_model = delay_model
+        self.paths = dict()
+
+    def set_source(self, value: SSAValue, path: CriticalPath):
+        self.paths[value] = path
+
+    def get(self, value: SSAValue) -> CriticalPath:
+        return self.paths.get(value, CriticalPath())
+
+    def walk_block(self, block: Block):
+        for op in block.ops:
+            self.walk_op(op)
+
+    def walk_op(self, op: Operation):
+        # Sequential elements start new paths.
+        if isinstance(op, SeqCompregCe):
+            self.paths[op.data] = CriticalPath(0, [op.register_name.data])
+            return
+        if isinstance(op, FsmHwInstance):
+            for output in op.outputs:
+                self.paths[output] = CriticalPath(0, [op.sym_name.data])
+            return
+        # Filler modules are not looked into, their outputs start new paths.
+        if isinstance(op, HwInstance):
+            for output in op.outputs:
+                self.paths[output] = CriticalPath(0, [op.instance_name.data])
+            return
+        if len(op.results) == 0:
+            return
+
+        deepest_operand = max(
+            [self.get(x) for x in op.operands],
+            key=lambda x: x.depth,
+            default=CriticalPath(),
+        )
+        delay = self.delay_model.get(type(op), lambda op: 1)(op)
+        path = CriticalPath(deepest_operand.depth + delay, deepest_operand.ops)
+        if delay != 0:
+            path.ops = path.ops + [op.name]
+        for result in op.results:
+            self.paths[result] = path
+
+
+def _sinks_of_module(block: Block) -> list[SSAValue]:
+    sinks: list[SSAValue] = []
+    for op in block.ops:
+        if isinstance(op, SeqCompregCe):
+            sinks += [op.input, op.clockEnable, op.reset, op.resetValue]
+        elif isinstance(op, (FsmHwInstance, HwInstance, HwOutput)):
+            sinks += list(op.operands)
+    return sinks
+
+
+def estimate_logic_depth(
+    hw_module: HwModule,
+    fsm: FsmMachine,
+    delay_model: DelayModel = DEFAULT_DELAY_MODEL,
+) -> LogicDepthReport:
+    """
+    Estimates the logic depth of a matcher unit and of the guards of its FSM.
+    The paths feeding FSM inputs are accounted for in the depth of guards.
+    """
+
+    module_block = hw_module.regions[0].blocks[0]
+    module_times = _ArrivalTimes(delay_model)
+    module_times.walk_block(module_block)
+    module_path = max(
+        [module_times.get(x) for x in _sinks_of_module(module_block)],
+        key=lambda x: x.depth,
+        default=CriticalPath(),
+    )
+
+    fsm_block = fsm.body.blocks[0]
+    fsm_times = _ArrivalTimes(delay_model)
+    fsm_instance = next(
+        (
+            x
+            for x in module_block.ops
+            if isinstance(x, FsmHwInstance)
+            and x.machine.root_reference == fsm.sym_name
+        ),
+        None,
+    )
+    if fsm_instance:
+        for arg, input in zip(fsm_block.args, fsm_instance.inputs):
+            fsm_times.set_source(arg, module_times.get(input))
+    fsm_times.walk_block(fsm_block)
+
+    guards: list[GuardDepth] = []
+    for state in fsm_block.ops:
+        if not isinstance(state, FsmState):
+            continue
+        for transition in state.transitions.ops:
+            if not isinstance(transition, FsmTransition):
+                continue
+            guard_block = transition.guard.blocks[0]
+            fsm_times.walk_block(guard_block)
+            if not isinstance(guard_block.last_op, FsmReturn):
+                continue
+            guards.append(
+                GuardDepth(
+                    state.sym_name.data,
+                    transition.next_state.root_reference.data,
+                    fsm_times.get(guard_block.last_op.operand),
+                )
+            )
+
+    return LogicDepthReport(hw_module.sym_name.data, module_path, guards)
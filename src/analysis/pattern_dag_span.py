@@ -1,5 +1,7 @@
-from typing import Tuple
-from xdsl.ir import Region, SSAValue, Block
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Iterator, Tuple, Union, cast
+from xdsl.ir import Region, SSAValue, Block, Use
 
 from dialects.pdl_interp import *
 from dialects.pdl import *
@@ -39,37 +41,175 @@ class DotNamer:
         return self.next_id - 1
 
 
+class SpanLcaIndex:
+    """
+    Binary lifting index over a span tree, answering ancestor and lowest common
+    ancestor queries in logarithmic time. The tree must not change once indexed.
+    """
+
+    # ancestors[span][k] is the ancestor 2^k operand edges above span, if any.
+    ancestors: dict["OperationSpan", list["OperationSpan"]]
+
+    def __init__(self, root: "OperationSpan"):
+        self.ancestors = dict()
+        to_index = [root]
+        while len(to_index) != 0:
+            span = to_index.pop()
+            jumps: list[OperationSpan] = []
+            if span.parent:
+                jumps.append(span.parent.operand_of)
+                while len(self.ancestors[jumps[-1]]) >= len(jumps):
+                    jumps.append(self.ancestors[jumps[-1]][len(jumps) - 1])
+            self.ancestors[span] = jumps
+            to_index += [x.defining_op for x in span.operands.values()]
+
+    def ancestor(self, span: "OperationSpan", distance: int) -> "OperationSpan":
+        """Returns the ancestor `distance` operand edges above `span`."""
+        assert distance <= span.depth
+        jump = 0
+        while distance != 0:
+            if distance & 1:
+                span = self.ancestors[span][jump]
+            distance >>= 1
+            jump += 1
+        return span
+
+    def is_ancestor_of(self, ancestor: "OperationSpan", span: "OperationSpan") -> bool:
+        """Whether `ancestor` is `span` or one of its ancestors."""
+        if ancestor.depth > span.depth:
+            return False
+        return self.ancestor(span, span.depth - ancestor.depth) == ancestor
+
+    def lowest_common_ancestor(
+        self, lhs: "OperationSpan", rhs: "OperationSpan"
+    ) -> "OperationSpan":
+        if lhs.depth > rhs.depth:
+            lhs = self.ancestor(lhs, lhs.depth - rhs.depth)
+        else:
+            rhs = self.ancestor(rhs, rhs.depth - lhs.depth)
+        if lhs == rhs:
+            return lhs
+        # Both spans stay at the same depth, so they have as many ancestors.
+        for jump in reversed(range(len(self.ancestors[lhs]))):
+            if jump >= len(self.ancestors[lhs]):
+                continue
+            if self.ancestors[lhs][jump] != self.ancestors[rhs][jump]:
+                lhs = self.ancestors[lhs][jump]
+                rhs = self.ancestors[rhs][jump]
+        assert lhs.parent
+        return lhs.parent.operand_of
+
+
+class SpanValueKind(Enum):
+    OPERATION = "operation"
+    OPERAND = "operand"
+    OPERAND_TYPE = "operand_type"
+    RESULT = "result"
+    RESULT_TYPE = "result_type"
+    OPERAND_RANGE = "operand_range"
+    OPERAND_TYPE_RANGE = "operand_type_range"
+    RESULT_RANGE = "result_range"
+    RESULT_TYPE_RANGE = "result_type_range"
+
+
+@dataclass(frozen=True, slots=True)
+class SpanValue:
+    """
+    Construct of the span tree a PDL Interp SSA value refers to.
+
+    Field:
+    - span: the operand span for operand kinds, the result span for result kinds,
+            and the operation span otherwise.
+    - index: index of the operand or result, if the value refers to one.
+    """
+
+    kind: SpanValueKind
+    span: Union["OperationSpan", "OperandSpan", "ResultSpan"]
+    index: int | None = None
+
+    def is_operand(self) -> bool:
+        return self.kind in [SpanValueKind.OPERAND, SpanValueKind.OPERAND_TYPE]
+
+    def is_result(self) -> bool:
+        return self.kind in [SpanValueKind.RESULT, SpanValueKind.RESULT_TYPE]
+
+    @property
+    def operation(self) -> "OperationSpan":
+        """The operation span the value is part of."""
+        if isinstance(self.span, OperandSpan):
+            return self.span.operand_of
+        if isinstance(self.span, ResultSpan):
+            return self.span.result_of
+        return self.span
+
+
 class OperationSpanCtx:
     """Utility class mapping a PDL Interp SSA value to its associated construct in a span tree."""
 
-    value_of_operand: dict[SSAValue, "OperandSpan"]
-    type_of_operand: dict[SSAValue, "OperandSpan"]
-    value_of_result: dict[SSAValue, "ResultSpan"]
-    type_of_result: dict[SSAValue, "ResultSpan"]
-    operations: dict[SSAValue, "OperationSpan"]
-    operand_range_of: dict[SSAValue, "OperationSpan"]
-    operand_type_range_of: dict[SSAValue, "OperationSpan"]
-    result_range_of: dict[SSAValue, "OperationSpan"]
-    result_type_range_of: dict[SSAValue, "OperationSpan"]
+    values: dict[SSAValue, SpanValue]
 
     root: "OperationSpan"
+    # Built once the span tree is complete.
+    lca_index: SpanLcaIndex | None
 
     def __init__(self, root: "OperationSpan"):
-        self.value_of_operand = dict()
-        self.type_of_operand = dict()
-        self.value_of_result = dict()
-        self.type_of_result = dict()
-        self.operations = dict()
-        self.operand_range_of = dict()
-        self.operand_type_range_of = dict()
-        self.result_range_of = dict()
-        self.result_type_range_of = dict()
+        self.values = dict()
         self.root = root
+        self.lca_index = None
+
+    def get_lca_index(self) -> SpanLcaIndex:
+        assert self.lca_index
+        return self.lca_index
+
+    def lookup(self, value: SSAValue) -> SpanValue | None:
+        return self.values.get(value)
+
+    def operation_of(self, value: SSAValue) -> "OperationSpan | None":
+        """Operation span of a value referring to an operation, if it does."""
+        span_value = self.values.get(value)
+        if span_value and span_value.kind == SpanValueKind.OPERATION:
+            return span_value.operation
+        return None
+
+    def operand_of(self, value: SSAValue) -> "OperandSpan | None":
+        """Operand span of a value referring to an operand value, if it does."""
+        span_value = self.values.get(value)
+        if span_value and span_value.kind == SpanValueKind.OPERAND:
+            return cast(OperandSpan, span_value.span)
+        return None
+
+    def result_of(self, value: SSAValue) -> "ResultSpan | None":
+        """Result span of a value referring to a result value, if it does."""
+        span_value = self.values.get(value)
+        if span_value and span_value.kind == SpanValueKind.RESULT:
+            return cast(ResultSpan, span_value.span)
+        return None
+
+    def operation_spans(self) -> list["OperationSpan"]:
+        """Operation spans referred to by at least one value."""
+        spans: dict[OperationSpan, None] = dict()
+        for span_value in self.values.values():
+            if span_value.kind == SpanValueKind.OPERATION:
+                spans[span_value.operation] = None
+        return list(spans.keys())
 
 
 class OperationSpan:
     """Represents the use of the data embedded in an operation in the span tree."""
 
+    __slots__ = (
+        "pdl_values",
+        "all_operands_ranges",
+        "all_operand_types_ranges",
+        "all_results_ranges",
+        "all_result_types_ranges",
+        "used",
+        "operands",
+        "results",
+        "parent",
+        "depth",
+    )
+
     pdl_values: list[SSAValue]
     all_operands_ranges: list[SSAValue]
     all_operand_types_ranges: list[SSAValue]
@@ -81,7 +221,12 @@ class OperationSpan:
     operands: dict[int, "OperandSpan"]
     results: dict[int, "ResultSpan"]
 
-    def __init__(self):
+    # Operand span this operation defines, None for the root.
+    parent: "OperandSpan | None"
+    # Amount of operand edges between the root and this operation.
+    depth: int
+
+    def __init__(self, parent: "OperandSpan | None" = None):
         self.pdl_values = []
         self.all_operands_ranges = []
         self.all_operand_types_ranges = []
@@ -90,6 +235,8 @@ class OperationSpan:
         self.used = False
         self.operands = dict()
         self.results = dict()
+        self.parent = parent
+        self.depth = parent.operand_of.depth + 1 if parent else 0
 
     def as_dot(self, namer: DotNamer, self_name: str) -> str:
         as_dot = f'{self_name} [ label="{self_name} (aka {[val.name_hint for val in self.pdl_values]})"]\n'
@@ -101,28 +248,30 @@ class OperationSpan:
 
     def add_value(self, ctx: OperationSpanCtx, value: SSAValue):
         self.pdl_values.append(value)
-        ctx.operations[value] = self
+        ctx.values[value] = SpanValue(SpanValueKind.OPERATION, self)
 
     def add_operand_range(self, ctx: OperationSpanCtx, value: SSAValue):
         self.all_operands_ranges.append(value)
-        ctx.operand_range_of[value] = self
+        ctx.values[value] = SpanValue(SpanValueKind.OPERAND_RANGE, self)
 
     def add_operand_type_range(self, ctx: OperationSpanCtx, value: SSAValue):
         self.all_operand_types_ranges.append(value)
-        ctx.operand_type_range_of[value] = self
+        ctx.values[value] = SpanValue(SpanValueKind.OPERAND_TYPE_RANGE, self)
 
     def add_result_range(self, ctx: OperationSpanCtx, value: SSAValue):
         self.all_results_ranges.append(value)
-        ctx.result_range_of[value] = self
+        ctx.values[value] = SpanValue(SpanValueKind.RESULT_RANGE, self)
 
     def add_result_type_range(self, ctx: OperationSpanCtx, value: SSAValue):
         self.all_result_types_ranges.append(value)
-        ctx.result_type_range_of[value] = self
+        ctx.values[value] = SpanValue(SpanValueKind.RESULT_TYPE_RANGE, self)
 
 
 class OperandSpan:
     """Represents the use of the data embedded in an operand in the span tree."""
 
+    __slots__ = ("pdl_values", "pdl_types", "operand_of", "operand_index", "defining_op")
+
     pdl_values: list[SSAValue]
     pdl_types: list[SSAValue]
 
@@ -135,7 +284,7 @@ class OperandSpan:
         self.pdl_types = []
         self.operand_of = operand_of
         self.operand_index = operand_index
-        self.defining_op = OperationSpan()
+        self.defining_op = OperationSpan(self)
 
     def as_dot(self, namer: DotNamer, user_name: str) -> str:
         operand_name = f"a{namer.get_id()}"
@@ -151,16 +300,20 @@ class OperandSpan:
 
     def add_value(self, ctx: OperationSpanCtx, value: SSAValue):
         self.pdl_values.append(value)
-        ctx.value_of_operand[value] = self
+        ctx.values[value] = SpanValue(SpanValueKind.OPERAND, self, self.operand_index)
 
     def add_type(self, ctx: OperationSpanCtx, value: SSAValue):
         self.pdl_types.append(value)
-        ctx.type_of_operand[value] = self
+        ctx.values[value] = SpanValue(
+            SpanValueKind.OPERAND_TYPE, self, self.operand_index
+        )
 
 
 class ResultSpan:
     """Represents the use of the data embedded in a result in the span tree."""
 
+    __slots__ = ("pdl_values", "pdl_types", "result_of", "result_index")
+
     pdl_values: list[SSAValue]
     pdl_types: list[SSAValue]
 
@@ -183,14 +336,33 @@ class ResultSpan:
 
     def add_value(self, ctx: OperationSpanCtx, value: SSAValue):
         self.pdl_values.append(value)
-        ctx.value_of_result[value] = self
+        ctx.values[value] = SpanValue(SpanValueKind.RESULT, self, self.result_index)
 
     def add_type(self, ctx: OperationSpanCtx, value: SSAValue):
         self.pdl_types.append(value)
-        ctx.type_of_result[value] = self
+        ctx.values[value] = SpanValue(SpanValueKind.RESULT_TYPE, self, self.result_index)
+
+
+@dataclass
+class _WalkFrame:
+    """
+    Walk of the uses of a value. `owner` is the operation span marked as used
+    if the value is used.
+    """
+
+    walker: Callable[[Use, "_WalkFrame"], Union["_WalkFrame", bool]]
+    value: SSAValue
+    owner: OperationSpan
+    span: Union[OperationSpan, "OperandSpan", "ResultSpan"]
+    uses: Iterator[Use]
 
 
 def compute_usage_graph(pdli_region: Region) -> Tuple[OperationSpan, OperationSpanCtx]:
+    """
+    Builds the span tree of the values used by a matcher, starting from its root.
+    Uses are walked with an explicit stack, in the order a recursive walk would
+    visit them, so deep patterns do not hit the recursion limit.
+    """
 
     root_value = pdli_region.blocks[0].args[0]
     root = OperationSpan()
@@ -216,183 +388,200 @@ def compute_usage_graph(pdli_region: Region) -> Tuple[OperationSpan, OperationSp
             operation.results[index].add_value(ctx, result)
         return operation.results[index]
 
-    def walk_operation(value: SSAValue, op_span: OperationSpan) -> bool:
-        used = False
-        for use in value.uses:
-            match use.operation:
-                case PdlInterpAreEqual():
-                    used = True
-                case PdlInterpCheckOperandCount():
-                    used = True
-                case PdlInterpCheckOperationName():
-                    used = True
-                case PdlInterpCheckResultCount():
-                    used = True
-                case PdlInterpGetOperand(index=index, value=operand):
-                    operand_span = add_operand(op_span, operand, index.value.data)
-                    used |= walk_operand(operand, operand_span)
-                case PdlInterpGetOperands(value=operands):
-                    index = (
-                        use.operation.index
-                        if "index" in use.operation.attributes
-                        else None
-                    )
-                    if not isinstance(operands.typ, PdlValueType):
-                        if index and index.value.data != 0:
-                            raise UnsupportedPatternFeature(use)
-                        op_span.add_operand_range(ctx, operands)
-                        used |= walk_operand_range(operands, op_span)
-                        continue
-                    if not index:
-                        raise UnsupportedPatternFeature(use)
-                    operand_span = add_operand(op_span, operands, index.value.data)
-                    used |= walk_operand(operands, operand_span)
-                case PdlInterpGetResult(index=index, value=result):
-                    result_span = add_result(op_span, result, index.value.data)
-                    used |= walk_result(result, result_span)
-                case PdlInterpGetResults(value=results):
-                    index = (
-                        use.operation.index
-                        if "index" in use.operation.attributes
-                        else None
-                    )
-                    if not isinstance(results.typ, PdlValueType):
-                        if index and index.value.data != 0:
-                            raise UnsupportedPatternFeature(use)
-                        op_span.add_result_range(ctx, results)
-                        used |= walk_result_range(results, op_span)
-                        continue
-                    if not index:
+    def frame(
+        walker: Callable[[Use, _WalkFrame], Union[_WalkFrame, bool]],
+        value: SSAValue,
+        owner: OperationSpan,
+        span: Union[OperationSpan, OperandSpan, ResultSpan],
+    ) -> _WalkFrame:
+        return _WalkFrame(walker, value, owner, span, iter(list(value.uses)))
+
+    def walk_operation(use: Use, current: _WalkFrame) -> _WalkFrame | bool:
+        op_span = cast(OperationSpan, current.span)
+        match use.operation:
+            case PdlInterpAreEqual():
+                return True
+            case PdlInterpCheckOperandCount():
+                return True
+            case PdlInterpCheckOperationName():
+                return True
+            case PdlInterpCheckResultCount():
+                return True
+            case PdlInterpGetOperand(index=index, value=operand):
+                operand_span = add_operand(op_span, operand, index.value.data)
+                return frame(walk_operand, operand, op_span, operand_span)
+            case PdlInterpGetOperands(value=operands):
+                index = (
+                    use.operation.index if "index" in use.operation.attributes else None
+                )
+                if not isinstance(operands.typ, PdlValueType):
+                    if index and index.value.data != 0:
                         raise UnsupportedPatternFeature(use)
-                    result_span = add_result(op_span, results, index.value.data)
-                    used |= walk_result(results, result_span)
-                case PdlInterpIsNotNull():
-                    used = True
-                case PdlInterpRecordMatch():
-                    used = True
-                case PdlInterpSwitchOperandCount():
-                    used = True
-                case PdlInterpSwitchOperationName():
-                    used = True
-                case PdlInterpSwitchResultCount():
-                    used = True
-                case _:
-                    raise UnsupportedPatternFeature(use)
-        if used:
-            op_span.used = True
-        return op_span.used
-
-    def walk_operand(value: SSAValue, op_span: OperandSpan) -> bool:
-        used = False
-        for use in value.uses:
-            match use.operation:
-                case PdlInterpAreEqual():
-                    used = True
-                case PdlInterpGetDefiningOp(inputOp=defining_op):
-                    op_span.defining_op.add_value(ctx, defining_op)
-                    used |= walk_operation(defining_op, op_span.defining_op)
-                case PdlInterpGetValueType(result=result):
-                    op_span.add_type(ctx, result)
-                    used |= walk_type(result)
-                case PdlInterpIsNotNull():
-                    used = True
-                case PdlInterpRecordMatch():
-                    used = True
-                case _:
+                    op_span.add_operand_range(ctx, operands)
+                    return frame(walk_operand_range, operands, op_span, op_span)
+                if not index:
                     raise UnsupportedPatternFeature(use)
-        return used
-
-    def walk_result(value: SSAValue, res_span: ResultSpan) -> bool:
-        used = False
-        for use in value.uses:
-            match use.operation:
-                case PdlInterpAreEqual():
-                    used = True
-                case PdlInterpGetDefiningOp(inputOp=defining_op):
-                    res_span.result_of.add_value(ctx, defining_op)
-                    used |= walk_operation(defining_op, res_span.result_of)
-                case PdlInterpGetValueType(result=result):
-                    res_span.add_type(ctx, result)
-                    used |= walk_type(result)
-                case PdlInterpIsNotNull():
-                    used = True
-                case PdlInterpRecordMatch():
-                    used = True
-                case _:
-                    raise UnsupportedPatternFeature(use)
-        return used
-
-    def walk_operand_range(value: SSAValue, op_span: OperationSpan) -> bool:
-        used = False
-        for use in value.uses:
-            match use.operation:
-                case PdlInterpAreEqual():
-                    used = True
-                case PdlInterpExtract(index=index, result=result):
-                    operand_span = add_operand(op_span, result, index.value.data)
-                    used |= walk_operand(result, operand_span)
-                case PdlInterpGetDefiningOp(inputOp=defining_op):
-                    operand_span = add_operand(op_span, None, 0)
-                    operand_span.defining_op.add_value(ctx, defining_op)
-                    used |= walk_operation(defining_op, operand_span.defining_op)
-                case PdlInterpGetValueType(result=result):
-                    op_span.add_operand_type_range(ctx, result)
-                    used |= walk_type_range(result)
-                case PdlInterpIsNotNull():
-                    used = True
-        return used
-
-    def walk_result_range(value: SSAValue, op_span: OperationSpan) -> bool:
-        used = False
-        for use in value.uses:
-            match use.operation:
-                case PdlInterpAreEqual():
-                    used = True
-                case PdlInterpExtract(index=index, result=result):
-                    operand_span = add_result(op_span, result, index.value.data)
-                    used |= walk_result(result, operand_span)
-                case PdlInterpGetDefiningOp(inputOp=defining_op):
-                    op_span.add_value(ctx, defining_op)
-                    used |= walk_operation(defining_op, op_span)
-                case PdlInterpGetValueType(result=result):
-                    op_span.add_result_type_range(ctx, result)
-                    used |= walk_type_range(result)
-                case PdlInterpIsNotNull():
-                    used = True
-        return used
-
-    def walk_type_range(value: SSAValue) -> bool:
-        used = False
-        for use in value.uses:
-            match use.operation:
-                case PdlInterpAreEqual():
-                    used = True
-                case PdlInterpCheckTypes():
-                    used = True
-                case PdlInterpExtract(result=result):
-                    used |= walk_type(result)
-                case PdlInterpIsNotNull():
-                    used = True
-                case PdlInterpSwitchTypes():
-                    used = True
-        return used
-
-    def walk_type(value: SSAValue) -> bool:
-        used = False
-        for use in value.uses:
-            match use.operation:
-                case PdlInterpAreEqual():
-                    used = True
-                case PdlInterpCheckType():
-                    used = True
-                case PdlInterpIsNotNull():
-                    used = True
-                case PdlInterpSwitchType():
-                    used = True
-                case _:
+                operand_span = add_operand(op_span, operands, index.value.data)
+                return frame(walk_operand, operands, op_span, operand_span)
+            case PdlInterpGetResult(index=index, value=result):
+                result_span = add_result(op_span, result, index.value.data)
+                return frame(walk_result, result, op_span, result_span)
+            case PdlInterpGetResults(value=results):
+                index = (
+                    use.operation.index if "index" in use.operation.attributes else None
+                )
+                if not isinstance(results.typ, PdlValueType):
+                    if index and index.value.data != 0:
+                        raise UnsupportedPatternFeature(use)
+                    op_span.add_result_range(ctx, results)
+                    return frame(walk_result_range, results, op_span, op_span)
+                if not index:
                     raise UnsupportedPatternFeature(use)
-        return used
+                result_span = add_result(op_span, results, index.value.data)
+                return frame(walk_result, results, op_span, result_span)
+            case PdlInterpIsNotNull():
+                return True
+            case PdlInterpRecordMatch():
+                return True
+            case PdlInterpSwitchOperandCount():
+                return True
+            case PdlInterpSwitchOperationName():
+                return True
+            case PdlInterpSwitchResultCount():
+                return True
+            case _:
+                raise UnsupportedPatternFeature(use)
+
+    def walk_operand(use: Use, current: _WalkFrame) -> _WalkFrame | bool:
+        op_span = cast(OperandSpan, current.span)
+        match use.operation:
+            case PdlInterpAreEqual():
+                return True
+            case PdlInterpGetDefiningOp(inputOp=defining_op):
+                op_span.defining_op.add_value(ctx, defining_op)
+                return frame(
+                    walk_operation, defining_op, op_span.defining_op, op_span.defining_op
+                )
+            case PdlInterpGetValueType(result=result):
+                op_span.add_type(ctx, result)
+                return frame(walk_type, result, current.owner, op_span)
+            case PdlInterpIsNotNull():
+                return True
+            case PdlInterpRecordMatch():
+                return True
+            case _:
+                raise UnsupportedPatternFeature(use)
+
+    def walk_result(use: Use, current: _WalkFrame) -> _WalkFrame | bool:
+        res_span = cast(ResultSpan, current.span)
+        match use.operation:
+            case PdlInterpAreEqual():
+                return True
+            case PdlInterpGetDefiningOp(inputOp=defining_op):
+                res_span.result_of.add_value(ctx, defining_op)
+                return frame(
+                    walk_operation, defining_op, res_span.result_of, res_span.result_of
+                )
+            case PdlInterpGetValueType(result=result):
+                res_span.add_type(ctx, result)
+                return frame(walk_type, result, current.owner, res_span)
+            case PdlInterpIsNotNull():
+                return True
+            case PdlInterpRecordMatch():
+                return True
+            case _:
+                raise UnsupportedPatternFeature(use)
+
+    def walk_operand_range(use: Use, current: _WalkFrame) -> _WalkFrame | bool:
+        op_span = cast(OperationSpan, current.span)
+        match use.operation:
+            case PdlInterpAreEqual():
+                return True
+            case PdlInterpExtract(index=index, result=result):
+                operand_span = add_operand(op_span, result, index.value.data)
+                return frame(walk_operand, result, op_span, operand_span)
+            case PdlInterpGetDefiningOp(inputOp=defining_op):
+                operand_span = add_operand(op_span, None, 0)
+                operand_span.defining_op.add_value(ctx, defining_op)
+                return frame(
+                    walk_operation,
+                    defining_op,
+                    operand_span.defining_op,
+                    operand_span.defining_op,
+                )
+            case PdlInterpGetValueType(result=result):
+                op_span.add_operand_type_range(ctx, result)
+                return frame(walk_type_range, result, op_span, op_span)
+            case PdlInterpIsNotNull():
+                return True
+        return False
 
-    walk_operation(root_value, root)
+    def walk_result_range(use: Use, current: _WalkFrame) -> _WalkFrame | bool:
+        op_span = cast(OperationSpan, current.span)
+        match use.operation:
+            case PdlInterpAreEqual():
+                return True
+            case PdlInterpExtract(index=index, result=result):
+                operand_span = add_result(op_span, result, index.value.data)
+                return frame(walk_result, result, op_span, operand_span)
+            case PdlInterpGetDefiningOp(inputOp=defining_op):
+                op_span.add_value(ctx, defining_op)
+                return frame(walk_operation, defining_op, op_span, op_span)
+            case PdlInterpGetValueType(result=result):
+                op_span.add_result_type_range(ctx, result)
+                return frame(walk_type_range, result, op_span, op_span)
+            case PdlInterpIsNotNull():
+                return True
+        return False
 
+    def walk_type_range(use: Use, current: _WalkFrame) -> _WalkFrame | bool:
+        match use.operation:
+            case PdlInterpAreEqual():
+                return True
+            case PdlInterpCheckTypes():
+                return True
+            case PdlInterpExtract(result=result):
+                return frame(walk_type, result, current.owner, current.span)
+            case PdlInterpIsNotNull():
+                return True
+            case PdlInterpSwitchTypes():
+                return True
+        return False
+
+    def walk_type(use: Use, current: _WalkFrame) -> _WalkFrame | bool:
+        match use.operation:
+            case PdlInterpAreEqual():
+                return True
+            case PdlInterpCheckType():
+                return True
+            case PdlInterpIsNotNull():
+                return True
+            case PdlInterpSwitchType():
+                return True
+            case _:
+                raise UnsupportedPatternFeature(use)
+
+    stack = [frame(walk_operation, root_value, root, root)]
+    while len(stack) != 0:
+        current = stack[-1]
+        use = next(current.uses, None)
+        if not use:
+            stack.pop()
+            continue
+        walked = current.walker(use, current)
+        if isinstance(walked, _WalkFrame):
+            stack.append(walked)
+        elif walked:
+            current.owner.used = True
+
+    # An operation is used if one of its operands leads to a used operation.
+    for op_span in ctx.operation_spans():
+        if not op_span.used:
+            continue
+        user = op_span.parent
+        while user and not user.operand_of.used:
+            user.operand_of.used = True
+            user = user.operand_of.parent
+
+    ctx.lca_index = SpanLcaIndex(root)
     return root, ctx
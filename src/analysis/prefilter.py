@@ -0,0 +1,117 @@
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from analysis.root_checks import (
+    MayMatch,
+    NeverMatches,
+    RootCheck,
+    RootCondition,
+    RootDecision,
+    RootEither,
+    RootHasOperand,
+    RootHasResult,
+    RootIsOperation,
+    RootOperandAmountIs,
+)
+from encoder import OperationContext, OperationInfo
+
+"""
+Software model of the root prefilter placed in front of matcher chains.
+
+An operation is a candidate root if the root checks of at least one pattern
+may succeed on it. As root checks only depend on the operation kind, the set
+of candidates is computed once from the operation context, and the hit rate
+of the prefilter on a workload can be estimated without simulating hardware.
+"""
+
+
+def _holds(condition: RootCondition, op_name: str, op_info: OperationInfo) -> bool:
+    match condition:
+        case RootIsOperation(op_name=expected_name):
+            return op_name == expected_name
+        case RootOperandAmountIs(amount=amount):
+            return len(op_info.operand_types) == amount
+        case RootHasOperand(index=index):
+            return index < len(op_info.operand_types)
+        case RootHasResult():
+            return op_info.result_type is not None
+
+
+def may_be_root(decision: RootDecision, op_name: str, op_info: OperationInfo) -> bool:
+    """Evaluates the root checks of a pattern on an operation kind."""
+    match decision:
+        case MayMatch():
+            return True
+        case NeverMatches():
+            return False
+        case RootCheck(condition=condition, if_true=if_true, if_false=if_false):
+            if _holds(condition, op_name, op_info):
+                return may_be_root(if_true, op_name, op_info)
+            return may_be_root(if_false, op_name, op_info)
+        case RootEither(options=options):
+            return any(may_be_root(x, op_name, op_info) for x in options)
+    return True
+
+
+def candidate_root_operations(
+    decisions: list[RootDecision], op_ctx: OperationContext
+) -> set[str]:
+    """Operations of the context that may be the root of one of the patterns."""
+    return {
+        op_name
+        for op_name, op_info in op_ctx.operations.items()
+        if any(may_be_root(x, op_name, op_info) for x in decisions)
+    }
+
+
+@dataclass
+class PrefilterHitRate:
+    """
+    Amount of operations of a workload going through the prefilter.
+
+    Field:
+    - unknown_operations: operations of the workload missing from the context,
+                          which are never candidates.
+    """
+
+    total: int = 0
+    candidates: int = 0
+    candidates_by_operation: dict[str, int] = field(default_factory=dict)
+    unknown_operations: set[str] = field(default_factory=set)
+
+    def hit_rate(self) -> float:
+        if self.total == 0:
+            return 0.0
+        return self.candidates / self.total
+
+    def format(self) -> str:
+        report = f"prefilter: {self.candidates}/{self.total} candidate roots"
+        report += f" ({100 * self.hit_rate():.1f}%)\n"
+        for op_name, count in sorted(
+            self.candidates_by_operation.items(), key=lambda x: -x[1]
+        ):
+            report += f"  {op_name}: {count}\n"
+        if len(self.unknown_operations) != 0:
+            report += f"  unknown operations: {sorted(self.unknown_operations)}\n"
+        return report
+
+
+def estimate_prefilter_hit_rate(
+    candidates: set[str], op_ctx: OperationContext, workload: Iterable[str]
+) -> PrefilterHitRate:
+    """
+    Estimates which part of a workload, given as a stream of operation names,
+    the prefilter lets through to the matcher units.
+    """
+    stats = PrefilterHitRate()
+    for op_name in workload:
+        stats.total += 1
+        if not op_name in op_ctx.operations:
+            stats.unknown_operations.add(op_name)
+            continue
+        if op_name in candidates:
+            stats.candidates += 1
+            stats.candidates_by_operation[op_name] = (
+                stats.candidates_by_operation.get(op_name, 0) + 1
+            )
+    return stats
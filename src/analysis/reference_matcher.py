@@ -0,0 +1,241 @@
+from dataclasses import dataclass, field
+from typing import Callable, cast
+
+from xdsl.ir import Block, Region, SSAValue
+from xdsl.dialects.builtin import IntegerAttr
+
+from dialects.pdl_interp import *
+
+from encoder import OperationContext
+from utils import UnsupportedPatternFeature
+
+"""
+Software reference of the matching done by matcher units, to check generated
+hardware against it on a stream of operations.
+
+Operations of the stream are identified by their position. Operations are
+pushed to the stream after the operations using their result, so an operand
+with an offset of `o` is defined by the operation `o + 1` positions after its
+user. A matching attempt only sees the operations its visibility function
+accepts, like a unit only sees the operations of its window: a definition
+that is not visible is null.
+"""
+
+
+@dataclass
+class StreamOperation:
+    """
+    Operation of a stream.
+
+    Field:
+    - name: name of the operation, which must be in the operation context.
+    - operand_offsets: offset of each operand of the operation.
+    """
+
+    name: str
+    operand_offsets: list[int] = field(default_factory=list)
+
+
+@dataclass
+class ReferenceMatch:
+    """
+    Match recorded by an attempt.
+
+    Field:
+    - pattern_index: index of the matched pattern.
+    - bound_offsets: offset in the stream between the root and each value bound
+                     by the match, zero for values that are not located in the
+                     stream.
+    """
+
+    pattern_index: int
+    bound_offsets: list[int]
+
+
+# Whether the operation at the provided position is visible to the attempt
+# rooted at the first position.
+Visibility = Callable[[int, int], bool]
+
+
+def window_visibility(window: int) -> Visibility:
+    """Visibility of attempts seeing the `window` operations from their root."""
+    return lambda root, position: position - root < window
+
+
+def wide_window_visibility(window: int, stream_width: int) -> Visibility:
+    """
+    Visibility of attempts receiving `stream_width` operations per cycle, from
+    the first position of the stream on, which see all the operations of the
+    cycle providing the last operation of their window.
+    """
+    return lambda root, position: (
+        position // stream_width <= (root + window - 1) // stream_width
+    )
+
+
+# A value is the position of its defining operation and the index of the result.
+_Value = tuple[int, int]
+
+
+def match_root(
+    pdli_region: Region,
+    stream: list[StreamOperation],
+    root: int,
+    op_ctx: OperationContext,
+    visibility: Visibility,
+) -> ReferenceMatch | None:
+    """
+    Runs the matcher of `pdli_region` on the operation of the stream at `root`,
+    and returns the match it records if any.
+    """
+
+    def visible(position: int) -> int | None:
+        if position >= len(stream) or not visibility(root, position):
+            return None
+        return position
+
+    def operand_count(position: int) -> int:
+        return len(op_ctx.operations[stream[position].name].operand_types)
+
+    def result_count(position: int) -> int:
+        return 1 if op_ctx.operations[stream[position].name].result_type else 0
+
+    values: dict[SSAValue, int | _Value | None] = {pdli_region.blocks[0].args[0]: root}
+
+    def operation_of(value: SSAValue) -> int:
+        return cast(int, values[value])
+
+    def offset_of(value: SSAValue) -> int:
+        match values[value]:
+            case int(position):
+                return position - root
+            case (position, _):
+                return cast(int, position) - root
+            case _:
+                return 0
+
+    block: Block = pdli_region.blocks[0]
+    while True:
+        for op in block.ops:
+            match op:
+                case PdlInterpGetOperand(index=index, inputOp=input_op):
+                    position = operation_of(input_op)
+                    operand = index.value.data
+                    offsets = stream[position].operand_offsets
+                    values[op.value] = None
+                    if operand < operand_count(position):
+                        values[op.value] = (position + offsets[operand] + 1, 0)
+                case PdlInterpGetResult(index=index, inputOp=input_op):
+                    values[op.value] = (operation_of(input_op), index.value.data)
+                case PdlInterpGetDefiningOp(value=value):
+                    defined = values[value]
+                    values[op.inputOp] = (
+                        visible(cast(_Value, defined)[0]) if defined else None
+                    )
+                case _ if op is not block.last_op:
+                    raise UnsupportedPatternFeature(op)
+
+        successor: Block
+        match block.last_op:
+            case PdlInterpFinalize():
+                return None
+            case PdlInterpRecordMatch(inputs=inputs) as record_match:
+                return ReferenceMatch(
+                    record_match.get_pattern_index(), [offset_of(x) for x in inputs]
+                )
+            case PdlInterpBranch(dest=dest):
+                successor = dest
+            case PdlInterpIsNotNull(
+                value=value, true_dest=true_dest, false_dest=false_dest
+            ):
+                successor = true_dest if values[value] is not None else false_dest
+            case PdlInterpAreEqual(
+                lhs=lhs, rhs=rhs, true_dest=true_dest, false_dest=false_dest
+            ):
+                successor = true_dest if values[lhs] == values[rhs] else false_dest
+            case PdlInterpCheckOperationName(
+                op_name=op_name,
+                input_op=input_op,
+                true_dest=true_dest,
+                false_dest=false_dest,
+            ):
+                name = stream[operation_of(input_op)].name
+                successor = true_dest if name == op_name.data else false_dest
+            case PdlInterpCheckOperandCount(
+                count=count,
+                compare_at_least=compare_at_least,
+                input_op=input_op,
+                true_dest=true_dest,
+                false_dest=false_dest,
+            ):
+                amount = operand_count(operation_of(input_op))
+                expected = count.value.data
+                holds = amount >= expected if compare_at_least else amount == expected
+                successor = true_dest if holds else false_dest
+            case PdlInterpCheckResultCount(
+                count=count,
+                compare_at_least=compare_at_least,
+                input_op=input_op,
+                true_dest=true_dest,
+                false_dest=false_dest,
+            ):
+                amount = result_count(operation_of(input_op))
+                expected = count.value.data
+                holds = amount >= expected if compare_at_least else amount == expected
+                successor = true_dest if holds else false_dest
+            case PdlInterpSwitchOperationName(
+                case_values=case_values,
+                input_op=input_op,
+                default_dest=default_dest,
+                cases=cases,
+            ):
+                name = stream[operation_of(input_op)].name
+                names = [x.data for x in case_values.data]
+                successor = cases[names.index(name)] if name in names else default_dest
+            case PdlInterpSwitchOperandCount(
+                case_values=case_values,
+                input_op=input_op,
+                default_dest=default_dest,
+                cases=cases,
+            ):
+                amount = operand_count(operation_of(input_op))
+                counts = [cast(IntegerAttr, x).value.data for x in case_values.data]
+                successor = (
+                    cases[counts.index(amount)] if amount in counts else default_dest
+                )
+            case PdlInterpSwitchResultCount(
+                case_values=case_values,
+                input_op=input_op,
+                default_dest=default_dest,
+                cases=cases,
+            ):
+                amount = result_count(operation_of(input_op))
+                counts = [cast(IntegerAttr, x).value.data for x in case_values.data]
+                successor = (
+                    cases[counts.index(amount)] if amount in counts else default_dest
+                )
+            case _:
+                raise UnsupportedPatternFeature(block.last_op)
+        block = successor
+
+
+def match_stream(
+    pdli_region: Region,
+    stream: list[StreamOperation],
+    roots: list[int],
+    op_ctx: OperationContext,
+    visibility: Visibility,
+) -> list[ReferenceMatch | None]:
+    """Runs the matcher of `pdli_region` on each of the provided roots."""
+    return [match_root(pdli_region, stream, x, op_ctx, visibility) for x in roots]
+
+
+def count_matches(
+    matches: list[ReferenceMatch | None], pattern_count: int
+) -> list[int]:
+    """Amount of matches of each pattern."""
+    counts = [0] * pattern_count
+    for match in matches:
+        if match:
+            counts[match.pattern_index] += 1
+    return counts
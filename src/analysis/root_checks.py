@@ -0,0 +1,242 @@
+from dataclasses import dataclass
+from typing import Union
+
+from xdsl.ir import Block, Region, SSAValue
+from xdsl.dialects.builtin import IntegerAttr, StringAttr
+
+from dialects.pdl_interp import (
+    PdlInterpCheckOperandCount,
+    PdlInterpCheckResultCount,
+    PdlInterpFinalize,
+    PdlInterpIsNotNull,
+    PdlInterpRecordMatch,
+    PdlInterpSwitchOperandCount,
+    PdlInterpSwitchOperationName,
+    PdlInterpSwitchResultCount,
+)
+from analysis.pattern_dag_span import OperationSpanCtx
+
+"""
+Extraction of the checks of a PDL-Interp matcher that only depend on the root.
+
+The root is available as soon as a matching attempt starts, so these checks can
+be decided before the rest of the DAG is gathered. The extracted decision tree
+tells, given the root operation alone, whether the pattern may still match.
+"""
+
+
+@dataclass(frozen=True)
+class RootIsOperation:
+    op_name: str
+
+
+@dataclass(frozen=True)
+class RootOperandAmountIs:
+    amount: int
+
+
+@dataclass(frozen=True)
+class RootHasOperand:
+    index: int
+
+
+@dataclass(frozen=True)
+class RootHasResult:
+    pass
+
+
+RootCondition = Union[RootIsOperation, RootOperandAmountIs, RootHasOperand, RootHasResult]
+
+
+@dataclass(frozen=True)
+class MayMatch:
+    """The pattern may match, depending on operations other than the root."""
+
+    pass
+
+
+@dataclass(frozen=True)
+class NeverMatches:
+    pass
+
+
+@dataclass(frozen=True)
+class RootCheck:
+    condition: RootCondition
+    if_true: "RootDecision"
+    if_false: "RootDecision"
+
+
+@dataclass(frozen=True)
+class RootEither:
+    """
+    The pattern may match if any of the options may match. Used when the
+    matcher takes a decision that does not only depend on the root.
+    """
+
+    options: tuple["RootDecision", ...]
+
+
+RootDecision = Union[MayMatch, NeverMatches, RootCheck, RootEither]
+
+
+def _check(
+    condition: RootCondition, if_true: RootDecision, if_false: RootDecision
+) -> RootDecision:
+    if if_true == if_false:
+        return if_true
+    return RootCheck(condition, if_true, if_false)
+
+
+def _either(options: list[RootDecision]) -> RootDecision:
+    kept: list[RootDecision] = []
+    for option in options:
+        if isinstance(option, MayMatch):
+            return option
+        if not isinstance(option, NeverMatches) and not option in kept:
+            kept.append(option)
+    if len(kept) == 0:
+        return NeverMatches()
+    if len(kept) == 1:
+        return kept[0]
+    return RootEither(tuple(kept))
+
+
+def compute_root_decision(
+    pdli_region: Region, dag_span_ctx: OperationSpanCtx
+) -> RootDecision:
+    """
+    Computes the decision tree of the checks on the root that lead to a
+    `record_match` in the provided matcher region.
+    """
+    decisions: dict[Block, RootDecision] = dict()
+    in_progress: set[Block] = set()
+
+    def is_root(value: SSAValue) -> bool:
+        return dag_span_ctx.operation_of(value) == dag_span_ctx.root
+
+    def walk_block(block: Block) -> RootDecision:
+        if block in decisions:
+            return decisions[block]
+        if block in in_progress:
+            # Cycles are not analyzed, assume they can lead to a match.
+            return MayMatch()
+        in_progress.add(block)
+        decision = walk_terminator(block)
+        in_progress.remove(block)
+        decisions[block] = decision
+        return decision
+
+    def walk_terminator(block: Block) -> RootDecision:
+        match block.last_op:
+            case PdlInterpFinalize():
+                return NeverMatches()
+            case PdlInterpRecordMatch():
+                return MayMatch()
+            case PdlInterpIsNotNull(
+                value=value, true_dest=true_dest, false_dest=false_dest
+            ):
+                if is_root(value):
+                    return walk_block(true_dest)
+                span_value = dag_span_ctx.lookup(value)
+                if span_value and span_value.operation == dag_span_ctx.root:
+                    if span_value.is_operand():
+                        assert span_value.index is not None
+                        return _check(
+                            RootHasOperand(span_value.index),
+                            walk_block(true_dest),
+                            walk_block(false_dest),
+                        )
+                    if span_value.is_result():
+                        return _check(
+                            RootHasResult(),
+                            walk_block(true_dest),
+                            walk_block(false_dest),
+                        )
+            case PdlInterpCheckOperandCount(
+                count=count,
+                compare_at_least=compare_at_least,
+                input_op=input_op,
+                true_dest=true_dest,
+                false_dest=false_dest,
+            ) if is_root(input_op):
+                if compare_at_least and count.value.data <= 0:
+                    return walk_block(true_dest)
+                condition = (
+                    RootHasOperand(count.value.data - 1)
+                    if compare_at_least
+                    else RootOperandAmountIs(count.value.data)
+                )
+                return _check(
+                    condition, walk_block(true_dest), walk_block(false_dest)
+                )
+            case PdlInterpSwitchOperandCount(
+                input_op=input_op,
+                case_values=case_values,
+                cases=cases,
+                default_dest=default_dest,
+            ) if is_root(input_op):
+                decision = walk_block(default_dest)
+                for case, case_dest in reversed(list(zip(case_values.data, cases))):
+                    assert isinstance(case, IntegerAttr)
+                    decision = _check(
+                        RootOperandAmountIs(case.value.data),
+                        walk_block(case_dest),
+                        decision,
+                    )
+                return decision
+            case PdlInterpSwitchOperationName(
+                input_op=input_op,
+                case_values=case_values,
+                cases=cases,
+                default_dest=default_dest,
+            ) if is_root(input_op):
+                decision = walk_block(default_dest)
+                for case, case_dest in reversed(list(zip(case_values.data, cases))):
+                    assert isinstance(case, StringAttr)
+                    decision = _check(
+                        RootIsOperation(case.data), walk_block(case_dest), decision
+                    )
+                return decision
+            case PdlInterpCheckResultCount(
+                count=count,
+                compare_at_least=compare_at_least,
+                input_op=input_op,
+                true_dest=true_dest,
+                false_dest=false_dest,
+            ) if is_root(input_op):
+                # Operations have at most one result.
+                if count.value.data == 0 and compare_at_least:
+                    return walk_block(true_dest)
+                if count.value.data > 1:
+                    return walk_block(false_dest)
+                if count.value.data == 0:
+                    return _check(
+                        RootHasResult(), walk_block(false_dest), walk_block(true_dest)
+                    )
+                return _check(
+                    RootHasResult(), walk_block(true_dest), walk_block(false_dest)
+                )
+            case PdlInterpSwitchResultCount(
+                input_op=input_op,
+                case_values=case_values,
+                cases=cases,
+                default_dest=default_dest,
+            ) if is_root(input_op):
+                target_of: dict[int, Block] = dict()
+                for case, case_dest in zip(case_values.data, cases):
+                    assert isinstance(case, IntegerAttr)
+                    target_of.setdefault(case.value.data, case_dest)
+                return _check(
+                    RootHasResult(),
+                    walk_block(target_of.get(1, default_dest)),
+                    walk_block(target_of.get(0, default_dest)),
+                )
+            case _:
+                pass
+
+        # The decision does not only depend on the root, any successor may be taken.
+        assert block.last_op
+        return _either([walk_block(x) for x in block.last_op.successors])
+
+    return walk_block(pdli_region.blocks[0])
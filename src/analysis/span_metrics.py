@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+
+from analysis.pattern_dag_span import OperationSpan, OperationSpanCtx
+from encoder import EncodingContext
+
+"""
+Static cost of the span tree of a pattern.
+
+The span tree fixes the amount of DAG buffer registers of a matcher unit and
+how far in the stream its operations may be located. Reporting it ahead of
+hardware generation shows which patterns are expensive, and which ones cannot
+fit in the `N` operations a matcher unit is given for an attempt.
+"""
+
+
+@dataclass
+class SpanMetrics:
+    """
+    Cost of the span tree of a pattern.
+
+    Field:
+    - depth: maximum amount of operand edges between the root and a DAG buffer node.
+    - dag_buffer_nodes: amount of DAG buffer nodes, one per used operation of the
+                        tree, the root included.
+    - register_bits: bits of DAG buffer registers, before the operand offsets the
+                     FSM does not read are pruned.
+    - min_stream_distance: minimum distance in the stream between the root and
+                           its deepest DAG buffer node.
+    - max_stream_distance: maximum distance in the stream between the root and
+                           a DAG buffer node, given the width of operand offsets.
+    """
+
+    depth: int
+    dag_buffer_nodes: int
+    register_bits: int
+    min_stream_distance: int
+    max_stream_distance: int
+
+    def may_exceed(self, bound: int) -> bool:
+        """Whether a DAG may span over more than `bound` operations, root included."""
+        return self.max_stream_distance + 1 > bound
+
+    def never_fits(self, bound: int) -> bool:
+        """
+        Whether the deepest DAG buffer node is always outside of the `bound`
+        operations given to an attempt, in which case it is never found.
+        """
+        return self.min_stream_distance + 1 > bound
+
+    def format(self, bound: int) -> str:
+        report = f"depth {self.depth}, {self.dag_buffer_nodes} DAG buffer nodes"
+        report += f" ({self.register_bits} register bits), stream distance"
+        report += f" {self.min_stream_distance}..{self.max_stream_distance}"
+        if self.never_fits(bound):
+            report += f", never fits in N = {bound}"
+        elif self.may_exceed(bound):
+            report += f", may exceed N = {bound}"
+        return report
+
+
+def _used_spans(span: OperationSpan) -> list[OperationSpan]:
+    spans = [span]
+    for operand in span.operands.values():
+        if operand.defining_op.used:
+            spans += _used_spans(operand.defining_op)
+    return spans
+
+
+def compute_span_metrics(
+    dag_span_ctx: OperationSpanCtx, enc_ctx: EncodingContext
+) -> SpanMetrics:
+    """Computes the cost of the span tree built by `compute_usage_graph`."""
+    spans = _used_spans(dag_span_ctx.root)
+    depth = max(x.depth for x in spans)
+
+    # Nodes are sums of unknown, located_at, found and never, the largest
+    # variant being the operation with all its operand offsets.
+    found_width = (
+        enc_ctx.opcode_width + enc_ctx.max_operand_amount * enc_ctx.operand_offset_width
+    )
+    node_width = 2 + max(enc_ctx.operand_offset_width, found_width)
+
+    # Operands are located strictly before their user. An operand offset of `o`
+    # designates the operation `o + 1` positions away.
+    max_edge_distance = 2**enc_ctx.operand_offset_width
+
+    return SpanMetrics(
+        depth,
+        len(spans),
+        len(spans) * node_width,
+        depth,
+        depth * max_edge_distance,
+    )
@@ -0,0 +1,128 @@
+from xdsl.ir import MLContext
+from xdsl.dialects.arith import Arith
+from xdsl.dialects.builtin import Builtin, i32
+from xdsl.parser import Parser
+from xdsl.pattern_rewriter import PatternRewriteWalker, GreedyRewritePatternApplier
+
+from dialects.pdl_interp import PdlInterp
+from dialects.pdl import Pdl
+
+from encoder import EncodingContext, OperationContext, OperationInfo
+from lowering.pdli_to_matcher_unit import generate_matcher_unit
+from lowering.pdli_switchify import SwitchifyPdlInterp
+
+"""
+Measures the time taken to generate the matcher unit of deep synthetic
+patterns, to keep hardware generation fast on large span trees.
+
+The pattern of depth `d` follows the first operand of its root `d` times, and
+checks the defining operation of the second operand at every level, for a
+total of `2d + 1` DAG buffer nodes.
+
+Usage: python bench_generation.py [--depth D...] [--repeat R]
+"""
+
+MIN_PYTHON = (3, 10)
+
+import argparse
+import sys
+import time
+
+if sys.version_info < MIN_PYTHON:
+    sys.exit("Python %s.%s or later is required.\n" % MIN_PYTHON)
+
+arg_parser = argparse.ArgumentParser(description="Matcher unit generation time.")
+arg_parser.add_argument(
+    "--depth", type=int, nargs="+", default=[4, 8, 16, 32], help="pattern depths"
+)
+arg_parser.add_argument(
+    "--repeat", type=int, default=3, help="generations per depth, best is kept"
+)
+args = arg_parser.parse_args()
+
+enc_ctx = EncodingContext(4, 4, 2)
+op_ctx = OperationContext(
+    {
+        "bench.node": OperationInfo(0, [i32, i32], i32),
+        "bench.leaf": OperationInfo(1, [], i32),
+    }
+)
+
+context = MLContext()
+
+context.register_dialect(Arith)
+context.register_dialect(Builtin)
+context.register_dialect(Pdl)
+context.register_dialect(PdlInterp)
+
+
+def synthetic_pattern(depth: int) -> str:
+    """PDL Interp source of the synthetic pattern of the provided depth."""
+    lines = [
+        '"builtin.module"() ({',
+        '  "pdl_interp.func"() ({',
+        "  ^bb0(%arg0: !pdl.operation):",
+        '    "pdl_interp.check_operation_name"(%arg0)[^level0, ^fail]'
+        ' {name = "bench.node"} : (!pdl.operation) -> ()',
+        "  ^fail:",
+        '    "pdl_interp.finalize"() : () -> ()',
+    ]
+    current = "%arg0"
+    for level in range(depth):
+        node = f"%node{level}"
+        leaf = f"%leaf{level}"
+        next_node = "^match" if level + 1 == depth else f"^level{level + 1}"
+        lines += [
+            f"  ^level{level}:",
+            f'    %lhs{level} = "pdl_interp.get_operand"({current}) {{index = 0 : i32}}'
+            " : (!pdl.operation) -> !pdl.value",
+            f'    {node} = "pdl_interp.get_defining_op"(%lhs{level})'
+            " : (!pdl.value) -> !pdl.operation",
+            f'    "pdl_interp.is_not_null"({node})[^node{level}, ^fail]'
+            " : (!pdl.operation) -> ()",
+            f"  ^node{level}:",
+            f'    "pdl_interp.check_operation_name"({node})[^rhs{level}, ^fail]'
+            ' {name = "bench.node"} : (!pdl.operation) -> ()',
+            f"  ^rhs{level}:",
+            f'    %rhs{level} = "pdl_interp.get_operand"({current}) {{index = 1 : i32}}'
+            " : (!pdl.operation) -> !pdl.value",
+            f'    {leaf} = "pdl_interp.get_defining_op"(%rhs{level})'
+            " : (!pdl.value) -> !pdl.operation",
+            f'    "pdl_interp.is_not_null"({leaf})[^leaf{level}, ^fail]'
+            " : (!pdl.operation) -> ()",
+            f"  ^leaf{level}:",
+            f'    "pdl_interp.check_operation_name"({leaf})[{next_node}, ^fail]'
+            ' {name = "bench.leaf"} : (!pdl.operation) -> ()',
+        ]
+        current = node
+    lines += [
+        "  ^match:",
+        '    "pdl_interp.record_match"(%arg0)[^fail] {benefit = 1 : i16,'
+        ' generatedOps = [], rewriter = @rewriters::@bench, rootKind = "bench.node"}'
+        " : (!pdl.operation) -> ()",
+        '  }) {sym_name = "matcher", function_type = (!pdl.operation) -> ()}'
+        " : () -> ()",
+        "}) : () -> ()",
+    ]
+    return "\n".join(lines)
+
+
+for depth in args.depth:
+    source = synthetic_pattern(depth)
+    best = float("inf")
+    for _ in range(args.repeat):
+        # Generation mutates the matcher, so it is parsed again every time.
+        pdl_interp_data = Parser(context, source).parse_module()
+        PatternRewriteWalker(
+            GreedyRewritePatternApplier([SwitchifyPdlInterp()]),
+            walk_regions_first=True,
+            apply_recursively=True,
+            walk_reverse=False,
+        ).rewrite_module(pdl_interp_data)
+        matcher_func = pdl_interp_data.regions[0].ops.first
+        start = time.perf_counter()
+        generate_matcher_unit(
+            matcher_func.regions[0], enc_ctx, op_ctx, "bench_unit"  # type: ignore
+        )
+        best = min(best, time.perf_counter() - start)
+    print(f"depth {depth} ({2 * depth + 1} DAG buffer nodes): {best * 1000:.1f} ms")
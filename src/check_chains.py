@@ -0,0 +1,718 @@
+from dataclasses import replace
+from typing import Callable, cast
+
+from xdsl.ir import MLContext, Operation, Region
+from xdsl.dialects.arith import Arith
+from xdsl.dialects.builtin import Builtin, ModuleOp, i32
+from xdsl.parser import Parser
+from xdsl.pattern_rewriter import (
+    GreedyRewritePatternApplier,
+    PatternRewriteWalker,
+    RewritePattern,
+)
+
+from dialects.hw_sum import HwSumType
+from dialects.pdl_interp import (
+    PdlInterp,
+    PdlInterpCheckOperationName,
+    PdlInterpFunc,
+    PdlInterpSwitchOperationName,
+)
+from dialects.pdl import Pdl
+from dialects.seq import SeqCompregCe
+
+from analysis.fsm_latency import compute_fsm_cycle_bound
+from analysis.hw_simulation import (
+    CombinationalLoop,
+    HwSimulation,
+    UnsupportedSimulationOp,
+)
+from analysis.pattern_dag_span import compute_usage_graph
+from analysis.prefilter import candidate_root_operations
+from analysis.reference_matcher import (
+    ReferenceMatch,
+    StreamOperation,
+    Visibility,
+    count_matches,
+    match_root,
+    wide_window_visibility,
+    window_visibility,
+)
+from analysis.root_checks import compute_root_decision
+from encoder import EncodingContext, OperationContext, OperationInfo
+from lowering.int_hw_op import LowerIntegerHwOperation
+from lowering.int_hw_sum import LowerIntegerHwSum
+from lowering.matcher_chain import (
+    MatcherChain,
+    ParallelChains,
+    generate_decoupled_chain,
+    generate_matcher_chain,
+    generate_parallel_chains,
+    generate_prefilter,
+)
+from lowering.pdli_to_matcher_unit import (
+    MatcherUnit,
+    MatcherUnitOptions,
+    generate_matcher_unit,
+    match_status_sum_type,
+)
+from lowering.pdli_merge import merge_matchers
+from lowering.pdli_to_window_matcher import generate_window_matcher
+from lowering.pdli_switchify import SwitchifyPdlInterp
+
+"""
+Checks generated matcher units and chains against the software reference of
+`analysis.reference_matcher`, by simulating them on a random stream of blocks.
+
+Each chain mode is run on the whole stream, and the match count of the chain
+is compared to the amount of roots the reference matches with the window the
+chain gives to attempts. Matcher units are also driven alone, one attempt per
+root, and their result and bound offsets are compared to the ones of the
+reference for each root, so all gatherer variants, with and without shared
+DAG buffer nodes, are checked to agree. As the checked pattern compares two
+operands defined by operations the gatherer stores, units sharing equal nodes
+must also have fewer DAG buffer registers than units that do not. In the
+`merged` mode, the matcher of a second pattern is merged with the one of the
+checked pattern, and the pattern index of each match is compared to the one of
+the first pattern matching the root on its own.
+
+Usage: python check_chains.py [--units N] [--blocks B] [--chains K]
+                              [--seed S] [--mode M...]
+"""
+
+MIN_PYTHON = (3, 10)
+
+import argparse
+import random
+import sys
+
+if sys.version_info < MIN_PYTHON:
+    sys.exit("Python %s.%s or later is required.\n" % MIN_PYTHON)
+
+# Cycles the stream may stay paused before the chain is considered deadlocked.
+STALL_LIMIT = 1000
+
+COUNTER_WIDTH = 16
+
+# The left operand of the left operand of the root must be the right operand of
+# the root, whose definition the gatherer may store in a single node when
+# sharing equal nodes. The compared values are at different depths, so checking
+# their equality needs the exact stream offset of each.
+PATTERN_SOURCE = """
+"builtin.module"() ({
+  "pdl_interp.func"() ({
+  ^bb0(%arg0: !pdl.operation):
+    "pdl_interp.check_operation_name"(%arg0)[^bb2, ^bb1] {name = "bench.node"} \
+: (!pdl.operation) -> ()
+  ^bb1:
+    "pdl_interp.finalize"() : () -> ()
+  ^bb2:
+    %0 = "pdl_interp.get_operand"(%arg0) {index = 0 : i32} \
+: (!pdl.operation) -> !pdl.value
+    %1 = "pdl_interp.get_defining_op"(%0) : (!pdl.value) -> !pdl.operation
+    "pdl_interp.is_not_null"(%1)[^bb3, ^bb1] : (!pdl.operation) -> ()
+  ^bb3:
+    "pdl_interp.check_operation_name"(%1)[^bb4, ^bb1] {name = "bench.node"} \
+: (!pdl.operation) -> ()
+  ^bb4:
+    %2 = "pdl_interp.get_operand"(%1) {index = 0 : i32} \
+: (!pdl.operation) -> !pdl.value
+    %3 = "pdl_interp.get_operand"(%arg0) {index = 1 : i32} \
+: (!pdl.operation) -> !pdl.value
+    "pdl_interp.are_equal"(%2, %3)[^bb5, ^bb1] : (!pdl.value, !pdl.value) -> ()
+  ^bb5:
+    %4 = "pdl_interp.get_defining_op"(%3) : (!pdl.value) -> !pdl.operation
+    "pdl_interp.is_not_null"(%4)[^bb6, ^bb1] : (!pdl.operation) -> ()
+  ^bb6:
+    "pdl_interp.check_operation_name"(%4)[^bb7, ^bb1] {name = "bench.node"} \
+: (!pdl.operation) -> ()
+  ^bb7:
+    %5 = "pdl_interp.get_defining_op"(%2) : (!pdl.value) -> !pdl.operation
+    "pdl_interp.check_operand_count"(%5)[^bb8, ^bb1] {count = 2 : i32} \
+: (!pdl.operation) -> ()
+  ^bb8:
+    %6 = "pdl_interp.get_operand"(%1) {index = 1 : i32} \
+: (!pdl.operation) -> !pdl.value
+    "pdl_interp.record_match"(%2, %6, %arg0)[^bb1] {benefit = 1 : i16, \
+generatedOps = [], rewriter = @rewriters::@bench, rootKind = "bench.node"} \
+: (!pdl.value, !pdl.value, !pdl.operation) -> ()
+  }) {sym_name = "matcher", function_type = (!pdl.operation) -> ()} : () -> ()
+}) : () -> ()
+"""
+
+# Pattern merged with the previous one in the `merged` mode. Its root has the
+# same name, so the merged matcher checks it once, and roots matching both
+# patterns are reported as matching the first one.
+LEAF_PATTERN_SOURCE = """
+"builtin.module"() ({
+  "pdl_interp.func"() ({
+  ^bb0(%arg0: !pdl.operation):
+    "pdl_interp.check_operation_name"(%arg0)[^bb2, ^bb1] {name = "bench.node"} \
+: (!pdl.operation) -> ()
+  ^bb1:
+    "pdl_interp.finalize"() : () -> ()
+  ^bb2:
+    %0 = "pdl_interp.get_operand"(%arg0) {index = 1 : i32} \
+: (!pdl.operation) -> !pdl.value
+    %1 = "pdl_interp.get_defining_op"(%0) : (!pdl.value) -> !pdl.operation
+    "pdl_interp.is_not_null"(%1)[^bb3, ^bb1] : (!pdl.operation) -> ()
+  ^bb3:
+    "pdl_interp.check_operation_name"(%1)[^bb4, ^bb1] {name = "bench.leaf"} \
+: (!pdl.operation) -> ()
+  ^bb4:
+    %2 = "pdl_interp.get_operand"(%arg0) {index = 0 : i32} \
+: (!pdl.operation) -> !pdl.value
+    "pdl_interp.record_match"(%2, %arg0)[^bb1] {benefit = 1 : i16, \
+generatedOps = [], rewriter = @rewriters::@leaf, rootKind = "bench.node"} \
+: (!pdl.value, !pdl.operation) -> ()
+  }) {sym_name = "matcher", function_type = (!pdl.operation) -> ()} : () -> ()
+}) : () -> ()
+"""
+
+MERGED_SOURCES = [PATTERN_SOURCE, LEAF_PATTERN_SOURCE]
+
+BLOCK_OP = "bench.block"
+
+MODES = [
+    "static",
+    "recycle",
+    "prefiltered",
+    "double_buffered",
+    "decoupled",
+    "wide_2",
+    "wide_4",
+    "parallel",
+    "window_matcher",
+    "single_unit",
+    "units",
+    "sharing",
+    "merged",
+]
+
+arg_parser = argparse.ArgumentParser(description="Matcher chain simulation check.")
+arg_parser.add_argument("--units", type=int, default=4, help="matcher units")
+arg_parser.add_argument(
+    "--blocks", type=int, default=40, help="random blocks in the stream"
+)
+arg_parser.add_argument(
+    "--chains", type=int, default=2, help="chains of the parallel mode"
+)
+arg_parser.add_argument("--seed", type=int, default=0, help="random seed")
+arg_parser.add_argument(
+    "--mode", choices=MODES, nargs="+", default=MODES, help="modes to check"
+)
+args = arg_parser.parse_args()
+
+enc_ctx = EncodingContext(4, 4, 2)
+op_ctx = OperationContext(
+    {
+        "bench.node": OperationInfo(0, [i32, i32], i32),
+        "bench.leaf": OperationInfo(1, [], i32),
+        BLOCK_OP: OperationInfo(2, [], None),
+    }
+)
+
+context = MLContext()
+
+context.register_dialect(Arith)
+context.register_dialect(Builtin)
+context.register_dialect(Pdl)
+context.register_dialect(PdlInterp)
+
+
+def parse_matcher_func(source: str = PATTERN_SOURCE) -> PdlInterpFunc:
+    """
+    Matcher of a pattern. Generation mutates the matcher, so it is parsed again
+    for every generation.
+    """
+    pdl_interp_data = Parser(context, source).parse_module()
+    PatternRewriteWalker(
+        GreedyRewritePatternApplier([SwitchifyPdlInterp()]),
+        walk_regions_first=True,
+        apply_recursively=True,
+        walk_reverse=False,
+    ).rewrite_module(pdl_interp_data)
+    return cast(PdlInterpFunc, pdl_interp_data.regions[0].ops.first)
+
+
+def parse_matcher(sources: list[str] | None = None) -> Region:
+    """
+    Matcher of the checked pattern, or of the patterns of `sources`, merged with
+    `merge_matchers` if there are several.
+    """
+    if sources is None:
+        sources = [PATTERN_SOURCE]
+    if len(sources) == 1:
+        return parse_matcher_func(sources[0]).regions[0]
+    return merge_matchers([parse_matcher_func(x) for x in sources]).regions[0]
+
+
+def match_patterns(
+    sources: list[str], stream: list[StreamOperation], visibility: Visibility
+) -> list[ReferenceMatch | None]:
+    """
+    Reference match of each root of the stream. Each pattern is run with its own
+    matcher, the first one matching giving the pattern index, so the matchers
+    merged by `merge_matchers` are checked too.
+    """
+    matchers = [parse_matcher_func(x).regions[0] for x in sources]
+    matches: list[ReferenceMatch | None] = []
+    for root in range(len(stream)):
+        match = None
+        for pattern_index, matcher in enumerate(matchers):
+            pattern_match = match_root(matcher, stream, root, op_ctx, visibility)
+            if pattern_match:
+                match = ReferenceMatch(pattern_index, pattern_match.bound_offsets)
+                break
+        matches.append(match)
+    return matches
+
+
+def random_block(generator: random.Random, length: int) -> list[StreamOperation]:
+    """
+    Block of `length` operations ending with its identifier. Operands are
+    defined in the same block, and the right operand of an operation is often
+    the left operand of its left operand.
+    """
+    block = [StreamOperation(BLOCK_OP)] * length
+    for position in reversed(range(length - 1)):
+        max_offset = min(length - 3 - position, 2**enc_ctx.operand_offset_width - 1)
+        if max_offset < 0 or generator.random() < 0.25:
+            block[position] = StreamOperation("bench.leaf")
+            continue
+        lhs = generator.randint(0, min(max_offset, 2))
+        rhs = generator.randint(0, max_offset)
+        lhs_op = block[position + lhs + 1]
+        if lhs_op.operand_offsets and generator.random() < 0.5:
+            rhs = min(lhs + lhs_op.operand_offsets[0] + 1, max_offset)
+        block[position] = StreamOperation("bench.node", [lhs, rhs])
+    return block
+
+
+def padding_block(length: int) -> list[StreamOperation]:
+    """Block of `length` operations which are never roots."""
+    return [StreamOperation("bench.leaf")] * (length - 1) + [StreamOperation(BLOCK_OP)]
+
+
+def random_stream(
+    generator: random.Random, block_count: int, padding_blocks: int, padding: int
+) -> list[StreamOperation]:
+    """
+    Stream of random blocks, followed by `padding_blocks` blocks of `padding`
+    operations so the attempts on the last roots complete. Blocks have a
+    length multiple of four, so they can be received several per cycle.
+    """
+    stream: list[StreamOperation] = []
+    for _ in range(block_count):
+        stream += random_block(generator, 4 * generator.randint(2, 5))
+    for _ in range(padding_blocks):
+        stream += padding_block(4 * ((padding + 3) // 4))
+    return stream
+
+
+def encode(op: StreamOperation) -> int:
+    """Encoding of the operation in the `HwOperation` type of `enc_ctx`."""
+    encoded = op_ctx.operations[op.name].opcode
+    for index, offset in enumerate(op.operand_offsets):
+        position = enc_ctx.opcode_width + index * enc_ctx.operand_offset_width
+        encoded |= offset << position
+    return encoded
+
+
+def lower(modules: list[Operation]) -> ModuleOp:
+    """Builtin module of the provided modules, with integer `hw_op` and `hw_sum`."""
+    module = ModuleOp(modules)
+    patterns: list[RewritePattern] = [
+        LowerIntegerHwOperation(op_ctx),
+        LowerIntegerHwSum(),
+    ]
+    for pattern in patterns:
+        PatternRewriteWalker(
+            GreedyRewritePatternApplier([pattern]),
+            walk_regions_first=True,
+            apply_recursively=True,
+            walk_reverse=False,
+        ).rewrite_module(module)
+    module.verify()
+    return module
+
+
+def simulate_chain(
+    simulation: HwSimulation,
+    stream: list[StreamOperation],
+    stream_width: int,
+    drain_cycles: int,
+) -> list[int] | None:
+    """
+    Pushes the stream through a chain, then lets it decide for `drain_cycles`
+    cycles, and returns its match counts, or None if it deadlocked.
+    """
+    simulation.step({"reset": 1})
+    position = 0
+    stalled_cycles = 0
+    while position < len(stream):
+        ops = stream[position : position + stream_width]
+        inputs = {
+            "stream_valid": 1,
+            "is_block_end": int(ops[0].name == BLOCK_OP),
+            "input_op": encode(ops[0]),
+        }
+        for index in range(1, stream_width):
+            inputs[f"input_op_{index}"] = encode(ops[index])
+        if simulation.step(inputs)["is_stream_paused"]:
+            stalled_cycles += 1
+            if stalled_cycles > STALL_LIMIT:
+                return None
+            continue
+        stalled_cycles = 0
+        position += stream_width
+    outputs: dict[str, int] = dict()
+    for _ in range(drain_cycles):
+        outputs = simulation.step({})
+    return [outputs[x] for x in simulation.output_names if x.startswith("match_count")]
+
+
+def check_chain(
+    mode: str,
+    generate: Callable[[], MatcherChain | ParallelChains],
+    stream: list[StreamOperation],
+    visibility: Visibility,
+    stream_width: int = 1,
+    sources: list[str] | None = None,
+) -> bool:
+    """
+    Compares the match counts of a chain with the ones of the reference, for the
+    checked pattern or the patterns of `sources`.
+    """
+    if sources is None:
+        sources = [PATTERN_SOURCE]
+    chain = generate()
+    simulation = HwSimulation(lower(chain.modules()), chain.top.sym_name.data)
+    unit = chain.unit if isinstance(chain, MatcherChain) else chain.chain.unit
+    drain_cycles = 64 * args.units + 4 * compute_fsm_cycle_bound(unit.fsm)
+    counts = simulate_chain(simulation, stream, stream_width, drain_cycles)
+
+    matches = match_patterns(sources, stream, visibility)
+    expected = [x % 2**COUNTER_WIDTH for x in count_matches(matches, len(sources))]
+    if counts is None:
+        print(f"{mode}: deadlock")
+        return False
+    if counts != expected:
+        print(f"{mode}: {counts} matches, expected {expected}")
+        return False
+    print(f"{mode}: ok, {counts} matches")
+    return True
+
+
+def decode_match_result(
+    unit: MatcherUnit, match_result: int
+) -> tuple[bool, int | None]:
+    """
+    Whether the attempt is decided, and the index of the pattern it matched if
+    any. The data of `success` is a dummy bit if the unit has a single pattern.
+    """
+    status_sum_type = match_status_sum_type(unit.pattern_count)
+    variant_width = (len(status_sum_type.cases.data) - 1).bit_length()
+    variant = match_result & (2**variant_width - 1)
+    if variant == status_sum_type.get_variant_id("success"):
+        return True, (match_result >> variant_width if unit.pattern_count > 1 else 0)
+    return variant != status_sum_type.get_variant_id("unknown"), None
+
+
+def check_unit(
+    label: str,
+    options: MatcherUnitOptions,
+    stream: list[StreamOperation],
+    sources: list[str] | None = None,
+) -> bool:
+    """
+    Drives a matcher unit alone, giving each root of the stream an attempt of
+    `args.units` operations, and compares each result with the reference, for
+    the checked pattern or the patterns of `sources`. Bound offsets of patterns
+    binding fewer values than others are padded with zeros.
+    """
+    if sources is None:
+        sources = [PATTERN_SOURCE]
+    window = args.units
+    unit = generate_matcher_unit(
+        parse_matcher(sources), enc_ctx, op_ctx, "unit", options
+    )
+    simulation = HwSimulation(lower(unit.modules()), "unit")
+    cycle_bound = compute_fsm_cycle_bound(unit.fsm)
+    visibility = window_visibility(window)
+    references = match_patterns(sources, stream, visibility)
+
+    for root in range(len(stream) - window + 1):
+        for distance in range(window):
+            outputs = simulation.step(
+                {
+                    "input_op": encode(stream[root + distance]),
+                    "new_sequence": int(distance == 0),
+                    "stream_completed": int(distance == window - 1),
+                }
+            )
+        for _ in range(cycle_bound + 2):
+            outputs = simulation.step({"is_stream_paused": 1, "stream_completed": 1})
+            if decode_match_result(unit, outputs["match_result"])[0]:
+                break
+
+        reference = references[root]
+        is_decided, pattern_index = decode_match_result(unit, outputs["match_result"])
+        bound_offsets = [
+            outputs[x] for x in simulation.output_names if x.startswith("bound_offset")
+        ]
+        if is_decided and reference is None and pattern_index is None:
+            continue
+        if (
+            is_decided
+            and reference is not None
+            and pattern_index == reference.pattern_index
+            and bound_offsets
+            == reference.bound_offsets
+            + [0] * (len(bound_offsets) - len(reference.bound_offsets))
+        ):
+            continue
+        result = f"{pattern_index} {bound_offsets}" if is_decided else "undecided"
+        print(f"units ({label}): root {root} got {result}, expected {reference}")
+        return False
+    print(f"units ({label}): ok")
+    return True
+
+
+def dag_buffer_registers(unit: MatcherUnit) -> int:
+    """Registers of the DAG buffer nodes of a unit, holding a located or found op."""
+    return len(
+        [
+            x
+            for x in unit.hw_module.walk()
+            if isinstance(x, SeqCompregCe) and isinstance(x.data.typ, HwSumType)
+        ]
+    )
+
+
+def check_sharing(label: str, options: MatcherUnitOptions) -> bool:
+    """Checks sharing equal nodes removes DAG buffer registers of the pattern."""
+    unit = generate_matcher_unit(parse_matcher(), enc_ctx, op_ctx, "unit", options)
+    shared_options = replace(options, share_equal_nodes=True)
+    shared_unit = generate_matcher_unit(
+        parse_matcher(), enc_ctx, op_ctx, "unit", shared_options
+    )
+    registers = dag_buffer_registers(unit)
+    shared_registers = dag_buffer_registers(shared_unit)
+    if shared_registers >= registers:
+        print(
+            f"sharing ({label}): {shared_registers} registers when sharing,"
+            f" {registers} otherwise"
+        )
+        return False
+    print(f"sharing ({label}): ok, {shared_registers} registers instead of {registers}")
+    return True
+
+
+def check_merged_root(sources: list[str]) -> bool:
+    """
+    Checks the merged matcher of patterns sharing a root name checks that name
+    once, the checks of each pattern carrying on with the ones of the next.
+    """
+    region = parse_matcher(sources)
+    root = region.blocks[0].args[0]
+    root_checks = [
+        x
+        for x in region.walk()
+        if isinstance(x, PdlInterpCheckOperationName | PdlInterpSwitchOperationName)
+        and x.operands[0] == root
+    ]
+    if len(root_checks) != 1:
+        print(f"merged: root name checked {len(root_checks)} times")
+        return False
+    return True
+
+
+generator = random.Random(args.seed)
+units = args.units
+# The last root of a chain reaches its unit after at most `N` cycles of up to
+# four operations, then needs the rest of its window.
+padding = 5 * units + 8
+stream = random_stream(generator, args.blocks, args.chains, padding)
+narrow_visibility = window_visibility(units)
+
+
+def chain_of(
+    recycle_units: bool = False,
+    options: MatcherUnitOptions | None = None,
+    unit_count: int = units,
+    prefiltered: bool = False,
+    sources: list[str] | None = None,
+) -> Callable[[], MatcherChain]:
+    def generate() -> MatcherChain:
+        prefilter = None
+        if prefiltered:
+            pdli_region = parse_matcher(sources)
+            _, dag_span_ctx = compute_usage_graph(pdli_region)
+            decision = compute_root_decision(pdli_region, dag_span_ctx)
+            candidates = candidate_root_operations([decision], op_ctx)
+            prefilter = generate_prefilter(candidates, enc_ctx, "prefilter")
+        unit = generate_matcher_unit(
+            parse_matcher(sources), enc_ctx, op_ctx, "unit", options
+        )
+        return generate_matcher_chain(
+            unit,
+            unit_count,
+            "chain",
+            recycle_units,
+            counter_width=COUNTER_WIDTH,
+            prefilter=prefilter,
+        )
+
+    return generate
+
+
+def wide_chain_of(stream_width: int) -> Callable[[], MatcherChain]:
+    def generate() -> MatcherChain:
+        options = MatcherUnitOptions(stream_width=stream_width)
+        unit = generate_matcher_unit(parse_matcher(), enc_ctx, op_ctx, "unit", options)
+        return generate_matcher_chain(unit, units, "chain", counter_width=COUNTER_WIDTH)
+
+    return generate
+
+
+def decoupled_chain() -> MatcherChain:
+    unit = generate_matcher_unit(parse_matcher(), enc_ctx, op_ctx, "unit")
+    return generate_decoupled_chain(unit, units, "chain", counter_width=COUNTER_WIDTH)
+
+
+def parallel_chains() -> ParallelChains:
+    return generate_parallel_chains(chain_of()(), args.chains, "chains")
+
+
+def window_matcher_chain() -> MatcherChain:
+    unit = generate_window_matcher(parse_matcher(), enc_ctx, "unit", units)
+    return generate_matcher_chain(unit, units, "chain", counter_width=COUNTER_WIDTH)
+
+
+unit_options = {
+    "gatherer": MatcherUnitOptions(report_bound_offsets=True),
+    "shared": MatcherUnitOptions(share_equal_nodes=True, report_bound_offsets=True),
+    "accumulated": MatcherUnitOptions(
+        accumulate_offsets=True, report_bound_offsets=True
+    ),
+    "shared accumulated": MatcherUnitOptions(
+        accumulate_offsets=True, share_equal_nodes=True, report_bound_offsets=True
+    ),
+    "absolute": MatcherUnitOptions(absolute_positions=True, report_bound_offsets=True),
+    "filler modules": MatcherUnitOptions(
+        filler_modules=True, share_equal_nodes=True, report_bound_offsets=True
+    ),
+}
+
+
+# Filler modules are left out, their registers are in the modules they instantiate.
+sharing_options = {
+    "gatherer": MatcherUnitOptions(),
+    "accumulated": MatcherUnitOptions(accumulate_offsets=True),
+    "absolute": MatcherUnitOptions(absolute_positions=True),
+    "double buffered": MatcherUnitOptions(double_buffered=True),
+}
+
+
+def check_mode(mode: str) -> bool:
+    """Runs the checks of a mode, all of them even if one fails."""
+    match mode:
+        case "static":
+            return check_chain(mode, chain_of(), stream, narrow_visibility)
+        case "recycle":
+            return check_chain(mode, chain_of(True), stream, narrow_visibility)
+        case "prefiltered":
+            return all(
+                [
+                    check_chain(
+                        f"{mode} (recycle: {recycle_units})",
+                        chain_of(recycle_units, prefiltered=True),
+                        stream,
+                        narrow_visibility,
+                    )
+                    for recycle_units in [False, True]
+                ]
+            )
+        case "double_buffered":
+            options = MatcherUnitOptions(double_buffered=True)
+            return check_chain(
+                mode, chain_of(options=options), stream, narrow_visibility
+            )
+        case "decoupled":
+            return check_chain(mode, decoupled_chain, stream, narrow_visibility)
+        case "wide_2" | "wide_4":
+            stream_width = int(mode.split("_")[1])
+            if stream_width > units:
+                print(f"{mode}: skipped, wider than the chain")
+                return True
+            # Wide chains give attempts `N - W + 1` operations by default.
+            visibility = wide_window_visibility(units - stream_width + 1, stream_width)
+            return check_chain(
+                mode, wide_chain_of(stream_width), stream, visibility, stream_width
+            )
+        case "parallel":
+            return check_chain(mode, parallel_chains, stream, narrow_visibility)
+        case "window_matcher":
+            return check_chain(mode, window_matcher_chain, stream, narrow_visibility)
+        case "single_unit":
+            single_window = window_visibility(1)
+            return all(
+                [
+                    check_chain(
+                        f"{mode} (recycle: {recycle_units})",
+                        chain_of(recycle_units, unit_count=1),
+                        stream,
+                        single_window,
+                    )
+                    for recycle_units in [False, True]
+                ]
+            )
+        case "units":
+            return all(
+                [
+                    check_unit(label, options, stream)
+                    for label, options in unit_options.items()
+                ]
+            )
+        case "sharing":
+            return all(
+                [
+                    check_sharing(label, options)
+                    for label, options in sharing_options.items()
+                ]
+            )
+        case "merged":
+            return all(
+                [
+                    check_merged_root(MERGED_SOURCES),
+                    check_chain(
+                        mode,
+                        chain_of(sources=MERGED_SOURCES),
+                        stream,
+                        narrow_visibility,
+                        sources=MERGED_SOURCES,
+                    ),
+                ]
+                + [
+                    check_unit(f"{mode} {label}", options, stream, MERGED_SOURCES)
+                    for label, options in unit_options.items()
+                ]
+            )
+        case _:
+            raise ValueError(f"unknown mode {mode}")
+
+
+# A mode that cannot be simulated fails, but the other modes are still checked.
+failed_modes: list[str] = []
+for mode in args.mode:
+    try:
+        if not check_mode(mode):
+            failed_modes.append(mode)
+    except (UnsupportedSimulationOp, CombinationalLoop) as error:
+        print(f"{mode}: cannot be simulated, {error}")
+        failed_modes.append(mode)
+
+if len(failed_modes) != 0:
+    print(f"failed: {', '.join(failed_modes)}")
+    sys.exit(1)
@@ -4,10 +4,12 @@ from xdsl.irdl import (
     irdl_op_definition,
     IRDLOperation,
     var_operand_def,
+    var_result_def,
     result_def,
     attr_def,
     region_def,
     VarOperand,
+    VarOpResult,
 )
 from xdsl.ir import (
     Dialect,
@@ -23,6 +25,7 @@ from xdsl.dialects.builtin import (
     StringAttr,
     ArrayAttr,
     SymbolNameAttr,
+    SymbolRefAttr,
     IntegerAttr,
     IntegerType,
     FunctionType,
@@ -122,4 +125,37 @@ class HwModule(IRDLOperation):
         )
 
 
-Hw = Dialect([HwConstant, HwModule, HwOutput], [])
+@irdl_op_definition
+class HwInstance(IRDLOperation):
+    name = "hw.instance"
+
+    instance_name: StringAttr = attr_def(StringAttr, attr_name="instanceName")
+    module_name: SymbolRefAttr = attr_def(SymbolRefAttr, attr_name="moduleName")
+    argNames: ArrayAttr[StringAttr] = attr_def(ArrayAttr[StringAttr])
+    resultNames: ArrayAttr[StringAttr] = attr_def(ArrayAttr[StringAttr])
+    parameters: ArrayAttr = attr_def(ArrayAttr)
+    inputs: VarOperand = var_operand_def()
+    outputs: VarOpResult = var_result_def()
+
+    @staticmethod
+    def new(instance_name: str, module: HwModule, inputs: list[SSAValue]):
+        return HwInstance.create(
+            operands=inputs,
+            result_types=list(module.function_type.outputs.data),
+            attributes={
+                "instanceName": StringAttr(instance_name),
+                "moduleName": SymbolRefAttr(module.sym_name),
+                "argNames": module.argNames,
+                "resultNames": module.resultNames,
+                "parameters": ArrayAttr([]),
+            },
+        )
+
+    def verify_(self) -> None:
+        if len(self.inputs) != len(self.argNames.data):
+            raise VerifyException("inconsistent amount of inputs")
+        if len(self.outputs) != len(self.resultNames.data):
+            raise VerifyException("inconsistent amount of outputs")
+
+
+Hw = Dialect([HwConstant, HwModule, HwOutput, HwInstance], [])
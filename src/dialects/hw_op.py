@@ -17,6 +17,7 @@ from xdsl.ir import (
     SSAValue,
 )
 from xdsl.dialects.builtin import (
+    ArrayAttr,
     IntegerAttr,
     IntegerType,
     StringAttr,
@@ -34,19 +35,29 @@ class HwOperation(ParametrizedAttribute):
     opcode_integer: ParameterDef[IntegerType]
     operand_offset_integer: ParameterDef[IntegerType]
     max_operand_amount: ParameterDef[IntegerAttr]
+    # Operands whose offset is part of the representation, in storage order.
+    stored_operands: ParameterDef[ArrayAttr[IntegerAttr]]
 
     @staticmethod
     def from_widths(
-        opcode_width: int, operand_offset_width: int, max_operand_amount: int
+        opcode_width: int,
+        operand_offset_width: int,
+        max_operand_amount: int,
+        stored_operands: list[int] | None = None,
     ):
         assert opcode_width.bit_length() <= 32
         assert operand_offset_width.bit_length() <= 32
         assert max_operand_amount.bit_length() <= 32
+        if stored_operands is None:
+            stored_operands = list(range(max_operand_amount))
         return HwOperation(
             [
                 IntegerType(opcode_width),
                 IntegerType(operand_offset_width),
                 IntegerAttr.from_int_and_width(max_operand_amount, 32),
+                ArrayAttr(
+                    [IntegerAttr.from_int_and_width(x, 32) for x in stored_operands]
+                ),
             ]
         )
 
@@ -58,13 +69,35 @@ class HwOperation(ParametrizedAttribute):
             enc_ctx.max_operand_amount,
         )
 
+    def verify(self) -> None:
+        stored_operands = self.get_stored_operands()
+        if len(set(stored_operands)) != len(stored_operands):
+            raise VerifyException("operand offsets stored more than once")
+        if any(x >= self.max_operand_amount.value.data for x in stored_operands):
+            raise VerifyException("stored operand outside max range")
+
+    def get_stored_operands(self) -> list[int]:
+        return [x.value.data for x in self.stored_operands.data]
+
+    def pruned(self, stored_operands: list[int]) -> "HwOperation":
+        """
+        Returns the representation of the same operations that only stores
+        the offsets of the provided operands.
+        """
+        return HwOperation.from_widths(
+            self.opcode_integer.width.data,
+            self.operand_offset_integer.width.data,
+            self.max_operand_amount.value.data,
+            [x for x in self.get_stored_operands() if x in stored_operands],
+        )
+
     def get_bit_width(self) -> int:
         width = 0
         width += self.opcode_integer.width.data  # operation opcode
-        max_op_amount = self.max_operand_amount.value.data
+        stored_amount = len(self.stored_operands.data)
         width += (
-            max_op_amount * self.operand_offset_integer.width.data
-        )  # each operand's offset
+            stored_amount * self.operand_offset_integer.width.data
+        )  # each stored operand's offset
         return width
 
 
@@ -103,6 +136,41 @@ class HwOpGetOperandOffset(IRDLOperation):
             raise VerifyException("trying to get operand offset as the wrong type")
         if op_type.max_operand_amount.value.data <= self.operand.value.data:
             raise VerifyException("trying to fetch operand outside max range")
+        if not self.operand.value.data in op_type.get_stored_operands():
+            raise VerifyException("trying to fetch operand that is not stored")
+
+
+@irdl_op_definition
+class HwOpPrune(IRDLOperation):
+    """
+    Drops the operand offsets that are not stored in the representation
+    of the result type.
+    """
+
+    name = "hw_op.prune"
+
+    op: Operand = operand_def(HwOperation)
+    output: OpResult = result_def(HwOperation)
+
+    @staticmethod
+    def from_operand(op: SSAValue, stored_operands: list[int]):
+        return HwOpPrune.create(
+            operands=[op],
+            result_types=[cast(HwOperation, op.typ).pruned(stored_operands)],
+        )
+
+    def verify_(self) -> None:
+        op_type = cast(HwOperation, self.op.typ)
+        output_type = cast(HwOperation, self.output.typ)
+        if (
+            op_type.opcode_integer != output_type.opcode_integer
+            or op_type.operand_offset_integer != output_type.operand_offset_integer
+            or op_type.max_operand_amount != output_type.max_operand_amount
+        ):
+            raise VerifyException("pruning cannot change the encoding of operations")
+        stored_operands = op_type.get_stored_operands()
+        if not all(x in stored_operands for x in output_type.get_stored_operands()):
+            raise VerifyException("trying to keep an operand that is not stored")
 
 
 @irdl_op_definition
@@ -133,12 +201,12 @@ class HwOpOperandTypeIs(IRDLOperation):
 
     op: Operand = operand_def(HwOperation)
     operand: IntegerAttr = attr_def(IntegerAttr)
-    expected_type: IntegerAttr = attr_def(IntegerAttr)
+    expected_type: Attribute = attr_def(Attribute)
     output: OpResult = result_def(i1)
 
     @staticmethod
     def from_operand(op: SSAValue, operand: int, expected_type: Attribute):
-        return HwOpHasOperand.create(
+        return HwOpOperandTypeIs.create(
             operands=[op],
             result_types=[i1],
             attributes={
@@ -200,7 +268,7 @@ class HwOpResultTypeIs(IRDLOperation):
 
     @staticmethod
     def from_operand(op: SSAValue, expected_type: Attribute):
-        return HwOpHasResult.create(
+        return HwOpResultTypeIs.create(
             operands=[op],
             result_types=[i1],
             attributes={"expected_type": expected_type},
@@ -217,7 +285,7 @@ class HwOpIsOperation(IRDLOperation):
 
     @staticmethod
     def from_operand(op: SSAValue, op_name: str):
-        return HwOpHasResult.create(
+        return HwOpIsOperation.create(
             operands=[op],
             result_types=[i1],
             attributes={"op_name": StringAttr(op_name)},
@@ -225,6 +293,16 @@ class HwOpIsOperation(IRDLOperation):
 
 
 HwOp = Dialect(
-    [HwOpGetOpcode, HwOpGetOperandOffset, HwOpHasOperand],
+    [
+        HwOpGetOpcode,
+        HwOpGetOperandOffset,
+        HwOpPrune,
+        HwOpHasOperand,
+        HwOpOperandTypeIs,
+        HwOpOperandAmountIs,
+        HwOpHasResult,
+        HwOpResultTypeIs,
+        HwOpIsOperation,
+    ],
     [HwOperation],
 )
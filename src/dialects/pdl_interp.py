@@ -402,10 +402,19 @@ class PdlInterpRecordMatch(IRDLOperation):
     benefit: IntegerAttr = attr_def(IntegerAttr)
     inputs: VarOperand = var_operand_def(AnyPdlType)
     matched_ops: Operand = operand_def(PdlOperationType)
+    # Index of the matched pattern among the patterns of a merged matcher.
+    pattern_index: IntegerAttr | None = opt_attr_def(
+        IntegerAttr, attr_name="patternIndex"
+    )
 
     dest: Successor = successor_def()
     traits = frozenset([IsTerminator()])
 
+    def get_pattern_index(self) -> int:
+        if not self.pattern_index:
+            return 0
+        return self.pattern_index.value.data
+
 
 @irdl_op_definition
 class PdlInterpReplace(IRDLOperation):
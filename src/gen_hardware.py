@@ -6,7 +6,7 @@ from xdsl.parser import ModuleOp, Parser
 from xdsl.pattern_rewriter import PatternRewriteWalker, GreedyRewritePatternApplier
 from subprocess import Popen, PIPE
 
-from dialects.pdl_interp import PdlInterp
+from dialects.pdl_interp import PdlInterp, PdlInterpFunc
 from dialects.pdl import Pdl
 from dialects.fsm import Fsm
 from dialects.hw import Hw
@@ -15,24 +15,71 @@ from dialects.hw_sum import HwSum
 from dialects.comb import Comb
 
 from analysis.pattern_dag_span import compute_usage_graph, DotNamer
+from analysis.logic_depth import TARGET_LOGIC_DEPTH, estimate_logic_depth
+from analysis.area import estimate_area
 from encoder import EncodingContext, OperationContext, OperationInfo
+from lowering.pdli_merge import merge_matchers
 from lowering.pdli_to_matcher_unit import generate_matcher_unit
+from lowering.pdli_to_window_matcher import generate_window_matcher
 from lowering.int_hw_sum import LowerIntegerHwSum
 from lowering.int_hw_op import LowerIntegerHwOperation
-from lowering.pdli_switchify import SwitchifyPdlInterp
+from lowering.pdli_switchify import (
+    MergeSwitchCascades,
+    SwitchifyPdlInterp,
+    remove_unreachable_blocks,
+)
 
 from utils import UnsupportedPatternFeature
 
+"""
+Generates the matcher unit of one or several patterns and prints it.
+
+Usage: python gen_hardware.py [--report] [--target-depth D] [PATTERN ...]
+
+Patterns default to `rewrites/redundant_or.pdll`. Matchers of several patterns
+are merged into a single matcher, earlier patterns having priority, and the
+unit reports the index of the matched pattern in that order. Patterns may only
+use operations of the operation context.
+
+With `--report`, the logic depth of the unit and the area of the unit and of
+a window matcher of the same pattern are estimated and printed to stderr.
+"""
+
 MIN_PYTHON = (3, 10)
 
 MLIR_PDLL = "./mlir-pdll"
 MLIR_OPT = "./mlir-opt"
 
+# Operations given to an attempt of the window matcher the generated matcher
+# unit is compared to.
+WINDOW_MATCHER_WINDOW = 8
+
+import argparse
 import sys
 
 if sys.version_info < MIN_PYTHON:
     sys.exit("Python %s.%s or later is required.\n" % MIN_PYTHON)
 
+arg_parser = argparse.ArgumentParser(description="Matcher unit of PDLL patterns.")
+arg_parser.add_argument(
+    "patterns",
+    nargs="*",
+    default=["rewrites/redundant_or.pdll"],
+    help="PDLL files to match",
+)
+arg_parser.add_argument(
+    "--report",
+    action="store_true",
+    help="estimate logic depth and area and compare with a window matcher",
+)
+arg_parser.add_argument(
+    "--target-depth",
+    type=int,
+    default=TARGET_LOGIC_DEPTH,
+    help="logic levels above which transition guards are reported",
+)
+args = arg_parser.parse_args()
+
 context = MLContext()
 
 context.register_dialect(Arith)
@@ -45,31 +92,44 @@ context.register_dialect(HwSum)
 context.register_dialect(HwOp)
 context.register_dialect(Comb)
 
-mlir_opt_process = Popen(
-    [MLIR_OPT, "-mlir-print-op-generic", "--convert-pdl-to-pdl-interp"],
-    stdin=PIPE,
-    stdout=PIPE,
-)
-mlir_pdll_process = Popen(
-    [MLIR_PDLL, "rewrites/redundant_or.pdll", "-x=mlir"], stdout=mlir_opt_process.stdin
-)
-
-mlir_opt_process.stdin.close()  # de-duplicate stdin handle # type: ignore
-pdl_interp_src = mlir_opt_process.stdout.read().decode()  # type: ignore
 
-pdl_interp_parser = Parser(context, pdl_interp_src)
-pdl_interp_data = pdl_interp_parser.parse_module()
-
-walker = PatternRewriteWalker(
-    GreedyRewritePatternApplier([SwitchifyPdlInterp()]),
-    walk_regions_first=True,
-    apply_recursively=True,
-    walk_reverse=False,
-)
-
-walker.rewrite_module(pdl_interp_data)
-
-matcher_func = pdl_interp_data.regions[0].ops.first
+def load_matcher(pattern_file: str) -> PdlInterpFunc:
+    mlir_opt_process = Popen(
+        [MLIR_OPT, "-mlir-print-op-generic", "--convert-pdl-to-pdl-interp"],
+        stdin=PIPE,
+        stdout=PIPE,
+    )
+    mlir_pdll_process = Popen(
+        [MLIR_PDLL, pattern_file, "-x=mlir"], stdout=mlir_opt_process.stdin
+    )
+    mlir_opt_process.stdin.close()  # de-duplicate stdin handle # type: ignore
+    pdl_interp_src = mlir_opt_process.stdout.read().decode()  # type: ignore
+    mlir_pdll_process.wait()
+
+    pdl_interp_data = Parser(context, pdl_interp_src).parse_module()
+    walker = PatternRewriteWalker(
+        GreedyRewritePatternApplier([SwitchifyPdlInterp()]),
+        walk_regions_first=True,
+        apply_recursively=True,
+        walk_reverse=False,
+    )
+    walker.rewrite_module(pdl_interp_data)
+    # Cascades of checks on a same value are only switches once all are
+    # switchified.
+    walker = PatternRewriteWalker(
+        GreedyRewritePatternApplier([MergeSwitchCascades()]),
+        walk_regions_first=True,
+        apply_recursively=True,
+        walk_reverse=False,
+    )
+    walker.rewrite_module(pdl_interp_data)
+    matcher_func = pdl_interp_data.regions[0].ops.first
+    remove_unreachable_blocks(matcher_func.regions[0])  # type: ignore
+    return matcher_func  # type: ignore
+
+
+matchers = [load_matcher(x) for x in args.patterns]
+matcher_func = matchers[0] if len(matchers) == 1 else merge_matchers(matchers)
 
 ssa_name = 0
 for block in matcher_func.regions[0].blocks:  # type: ignore
@@ -78,17 +138,17 @@ for block in matcher_func.regions[0].blocks:  # type: ignore
             res.name_hint = "s" + str(ssa_name)
             ssa_name += 1
 
-pdl_interp_data.verify()
+matcher_func.verify()
 
-print(pdl_interp_data)
+print(matcher_func)
 
 printer = Printer(print_debuginfo=True)
 
 op_context = OperationContext({"rv32i.or": OperationInfo(0, [i32, i32], i32)})
 
-hw_module, fsm = generate_matcher_unit(matcher_func.regions[0], EncodingContext(4, 4, 2), op_context, "matcher_unit")  # type: ignore
+matcher_unit = generate_matcher_unit(matcher_func.regions[0], EncodingContext(4, 4, 2), op_context, "matcher_unit")  # type: ignore
 
-module = ModuleOp([fsm, hw_module])
+module = ModuleOp(matcher_unit.modules())
 
 walker = PatternRewriteWalker(
     GreedyRewritePatternApplier([LowerIntegerHwOperation(op_context)]),
@@ -110,3 +170,25 @@ walker.rewrite_module(module)
 
 module.verify()
 printer.print(module)
+
+if args.report:
+    print(
+        estimate_logic_depth(matcher_unit.hw_module, matcher_unit.fsm).format(
+            args.target_depth
+        ),
+        file=sys.stderr,
+    )
+
+    # Compare the area of the gatherer with the one of a window matcher, to pick
+    # the cheapest architecture for the pattern.
+    window_matcher_unit = generate_window_matcher(
+        matcher_func.regions[0],  # type: ignore
+        EncodingContext(4, 4, 2),
+        "window_matcher_unit",
+        WINDOW_MATCHER_WINDOW,
+    )
+    for unit in [matcher_unit, window_matcher_unit]:
+        print(
+            estimate_area(unit.hw_module, unit.fsm, unit.filler_modules).format(),
+            file=sys.stderr,
+        )
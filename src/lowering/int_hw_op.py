@@ -20,9 +20,11 @@ from dialects.hw_op import (
     HwOpGetOpcode,
     HwOpHasOperand,
     HwOpHasResult,
+    HwOpResultTypeIs,
     HwOpGetOperandOffset,
     HwOpOperandAmountIs,
     HwOpIsOperation,
+    HwOpPrune,
 )
 
 from encoder import OperationContext
@@ -189,6 +191,23 @@ class LowerIntegerHwOperation(RewritePattern):
                 )
                 return
 
+            # If the operation is a HwOpResultTypeIs, check the opcode against all operations that have a result
+            # of the expected type
+            if isinstance(op, HwOpResultTypeIs):
+                opcode_max_width = cast(
+                    HwOperation, op.op.typ
+                ).opcode_integer.width.data
+                opcodes_which_do: list[int] = [
+                    x.opcode
+                    for x in self.ctx.operations.values()
+                    if x.result_type == op.expected_type
+                    and x.opcode.bit_count() <= opcode_max_width
+                ]
+                self.is_in_set_replace_helper(
+                    rewriter, op, op.op, opcodes_which_do, opcode_max_width
+                )
+                return
+
             # If the operation is a HwOpIsOperation, check the opcode against the desired operation
             if isinstance(op, HwOpIsOperation):
                 opcode_max_width = cast(
@@ -209,15 +228,47 @@ class LowerIntegerHwOperation(RewritePattern):
             # If the operation is a HwOpGetOperandOffset, extract the offset from the operation
             if isinstance(op, HwOpGetOperandOffset):
                 hw_op_typ = cast(HwOperation, op.op.typ)
-                expected_operand = op.operand.value.data
+                stored_index = hw_op_typ.get_stored_operands().index(
+                    op.operand.value.data
+                )
                 offset_width = hw_op_typ.operand_offset_integer.width.data
                 opcode_width = hw_op_typ.opcode_integer.width.data
                 extracted_offset = CombExtract.from_values(
-                    op.op, offset_width, opcode_width + expected_operand * offset_width
+                    op.op, offset_width, opcode_width + stored_index * offset_width
                 )
                 rewriter.replace_op(op, extracted_offset)
                 return
 
+            # If the operation is a HwOpPrune, only concatenate the fields that are kept
+            if isinstance(op, HwOpPrune):
+                hw_op_typ = cast(HwOperation, op.op.typ)
+                stored_operands = hw_op_typ.get_stored_operands()
+                offset_width = hw_op_typ.operand_offset_integer.width.data
+                opcode_width = hw_op_typ.opcode_integer.width.data
+                fields: list[Operation] = [
+                    CombExtract.from_values(op.op, opcode_width, 0)
+                ]
+                for operand in cast(HwOperation, op.output.typ).get_stored_operands():
+                    fields.append(
+                        CombExtract.from_values(
+                            op.op,
+                            offset_width,
+                            opcode_width
+                            + stored_operands.index(operand) * offset_width,
+                        )
+                    )
+                if len(fields) == 1:
+                    rewriter.replace_op(op, fields[0])
+                    return
+                for field in fields:
+                    rewriter.insert_op_before(field, op)
+                # Concatenation starts with the most significant bits.
+                concat = CombConcat.from_values(
+                    [field.results[0] for field in reversed(fields)]
+                )
+                rewriter.replace_op(op, concat)
+                return
+
             # If the operation is unrelated to HwOperation, simply lower its attributes
             for k, v in op.attributes.items():
                 op.attributes[k] = replace_hwop(v)
@@ -0,0 +1,1757 @@
+from dataclasses import dataclass
+from typing import cast
+from xdsl.ir import Attribute, Block, Operation, SSAValue
+from xdsl.dialects.builtin import IntegerAttr, IntegerType, SymbolRefAttr, i1
+
+from dialects.comb import *
+from dialects.fsm import FsmHwInstance
+from dialects.hw import HwConstant, HwInstance, HwModule, HwOutput
+from dialects.hw_op import HwOperation, HwOpIsOperation
+from dialects.hw_sum import HwSumGetAs, HwSumIs
+from dialects.seq import SeqCompregCe
+
+from analysis.fsm_latency import compute_fsm_cycle_bound
+from encoder import EncodingContext
+
+from lowering.pdli_to_matcher_unit import (
+    MatcherUnit,
+    match_status_sum_type,
+    pattern_id_width,
+)
+
+import math
+
+"""
+Generation of chains of matcher units and of their controller.
+
+Matcher units are chained so the operation output by a unit is the input
+operation of the next one. The controller decides which unit starts a matching
+attempt on which operation, and pauses the stream when an operation would
+otherwise leave the chain without having been used as a root.
+"""
+
+
+def _counter_width(max_value: int) -> int:
+    return max(1, math.ceil(math.log2(max_value + 1)))
+
+
+def _constant(block: Block, value: int, width: int) -> SSAValue:
+    constant = HwConstant.from_attr(IntegerAttr.from_int_and_width(value, width))
+    block.add_op(constant)
+    return constant.output
+
+
+def _not(block: Block, value: SSAValue, true: SSAValue) -> SSAValue:
+    negated = CombXor.from_values([value, true])
+    block.add_op(negated)
+    return negated.result
+
+
+def _window_counter(
+    block: Block,
+    register_name: str,
+    clock: SSAValue,
+    reset: SSAValue,
+    window: int,
+    true: SSAValue,
+    step: int = 1,
+) -> tuple[SeqCompregCe, SSAValue]:
+    """
+    Defines the counter of the operations seen since the root of an attempt,
+    saturating once the window is over, and returns it with whether the window
+    is over. Its input is set by `_window_completion`.
+    """
+    window_width = _counter_width(window + step - 1)
+    window_size = _constant(block, window, window_width)
+    seen_register = SeqCompregCe.new(
+        register_name,
+        IntegerType(window_width),
+        window_size,  # input is defined later
+        clock,
+        true,
+        reset,
+        window_size,
+    )
+    block.add_op(seen_register)
+    is_over = CombICmp.from_values(seen_register.data, window_size, ICmpPredicate.UGE)
+    block.add_op(is_over)
+    return seen_register, is_over.output
+
+
+def _window_completion(
+    block: Block,
+    seen_register: SeqCompregCe,
+    is_over: SSAValue,
+    is_running: SSAValue,
+    claim: SSAValue,
+    window: int,
+    true: SSAValue,
+    step: int = 1,
+    root_slot: SSAValue | None = None,
+) -> SSAValue:
+    """
+    Updates the counter of `_window_counter`, and returns whether the stream
+    must be completed for the attempt, during the cycles providing the last
+    operation of its window and after.
+
+    With `step` operations per cycle, the root arrives in `root_slot`, and the
+    cycle of the claim provides the operations from the root slot on. The
+    stream is completed during the claim if they cover the whole window.
+    """
+    window_width = cast(IntegerType, seen_register.data.typ).width.data
+    incremented = CombAdd.from_values(
+        [seen_register.data, _constant(block, step, window_width)]
+    )
+    block.add_op(incremented)
+    should_increment = CombAnd.from_values([is_running, _not(block, is_over, true)])
+    block.add_op(should_increment)
+    increment_muxer = CombMux.from_values(
+        should_increment.result, incremented.result, seen_register.data
+    )
+    block.add_op(increment_muxer)
+
+    claimed_seen = _constant(block, 1, window_width)
+    if root_slot:
+        slot_width = cast(IntegerType, root_slot.typ).width.data
+        extended_slot = CombConcat.from_values(
+            [_constant(block, 0, window_width - slot_width), root_slot]
+        )
+        block.add_op(extended_slot)
+        slot_seen = CombSub.from_values(
+            _constant(block, step, window_width), extended_slot.output
+        )
+        block.add_op(slot_seen)
+        claimed_seen = slot_seen.result
+    claim_muxer = CombMux.from_values(claim, claimed_seen, increment_muxer.result)
+    block.add_op(claim_muxer)
+    seen_register.replace_operand(0, claim_muxer.result)
+
+    is_claim_end = CombICmp.from_values(
+        claimed_seen, _constant(block, window, window_width), ICmpPredicate.UGE
+    )
+    block.add_op(is_claim_end)
+    is_window_end = CombICmp.from_values(
+        seen_register.data,
+        _constant(block, max(window - step, 0), window_width),
+        ICmpPredicate.UGE,
+    )
+    block.add_op(is_window_end)
+    stream_completed = CombMux.from_values(
+        claim, is_claim_end.output, is_window_end.output
+    )
+    block.add_op(stream_completed)
+    return stream_completed.result
+
+
+def _root_slot_distance(
+    block: Block,
+    position: SSAValue,
+    unit: int,
+    unit_count: int,
+    stream_width: int,
+) -> SSAValue:
+    """
+    Distance between the first operation a unit sees in the current cycle and
+    its next root, `(n(W + 1) - p) mod N` for the position `p` of the first
+    operation at the first unit.
+    """
+    position_width = cast(IntegerType, position.typ).width.data
+    distance_width = _counter_width(2 * unit_count - 1)
+    extended_position = CombConcat.from_values(
+        [_constant(block, 0, distance_width - position_width), position]
+    )
+    block.add_op(extended_position)
+    root_position = unit * (stream_width + 1) % unit_count
+    distance = CombSub.from_values(
+        _constant(block, root_position + unit_count, distance_width),
+        extended_position.output,
+    )
+    block.add_op(distance)
+    wrapped_distance = CombSub.from_values(
+        distance.result, _constant(block, unit_count, distance_width)
+    )
+    block.add_op(wrapped_distance)
+    is_wrapped = CombICmp.from_values(
+        distance.result,
+        _constant(block, unit_count, distance_width),
+        ICmpPredicate.UGE,
+    )
+    block.add_op(is_wrapped)
+    slot_distance = CombMux.from_values(
+        is_wrapped.output, wrapped_distance.result, distance.result
+    )
+    block.add_op(slot_distance)
+    return slot_distance.result
+
+
+def generate_prefilter(
+    candidates: set[str], enc_ctx: EncodingContext, prefilter_name: str
+) -> HwModule:
+    """
+    Generates a stage marking the operations of the stream that may be the root
+    of a pattern, as computed by `candidate_root_operations`. It is placed in
+    front of the first matcher unit of a chain.
+
+    The module has the following inputs:
+    - clock (`i1`)
+    - input_op (`HwOperation`)
+    - is_stream_paused (`i1`)
+
+    The module has the following outputs:
+    - output_op (`HwOperation`): the operation to provide to the first unit.
+    - is_candidate (`i1`): whether output_op may be the root of a pattern.
+    """
+    block = Block(arg_types=[i1, HwOperation.from_encoding_ctx(enc_ctx), i1])
+    clock = block.args[0]
+    input_op = block.args[1]
+    is_stream_paused = block.args[2]
+
+    true = _constant(block, 1, 1)
+    is_candidate = _constant(block, 0, 1)
+    candidate_checks: list[SSAValue] = []
+    for op_name in sorted(candidates):
+        is_operation = HwOpIsOperation.from_operand(input_op, op_name)
+        block.add_op(is_operation)
+        candidate_checks.append(is_operation.output)
+    if len(candidate_checks) != 0:
+        any_candidate = CombOr.from_values(candidate_checks)
+        block.add_op(any_candidate)
+        is_candidate = any_candidate.result
+
+    is_stream_running = _not(block, is_stream_paused, true)
+    false = _constant(block, 0, 1)
+    op_register = SeqCompregCe.new(
+        f"{prefilter_name}_op",
+        input_op.typ,
+        input_op,
+        clock,
+        is_stream_running,
+        false,
+        input_op,
+    )
+    block.add_op(op_register)
+    candidate_register = SeqCompregCe.new(
+        f"{prefilter_name}_is_candidate",
+        i1,
+        is_candidate,
+        clock,
+        is_stream_running,
+        false,
+        false,
+    )
+    block.add_op(candidate_register)
+
+    block.add_op(HwOutput.from_outputs([op_register.data, candidate_register.data]))
+    return HwModule.from_block(
+        prefilter_name,
+        block,
+        ["clock", "input_op", "is_stream_paused"],
+        ["output_op", "is_candidate"],
+    )
+
+
+def generate_chain_controller(
+    unit_count: int,
+    controller_name: str,
+    recycle_units: bool = False,
+    window: int | None = None,
+    prefiltered: bool = False,
+    pattern_count: int = 1,
+    double_buffered: bool = False,
+    stream_width: int = 1,
+) -> HwModule:
+    """
+    Generates the controller of a chain of `unit_count` matcher units.
+
+    By default, unit `n` attempts to match operations `N*i + n` of the stream.
+    Each attempt is given `window` operations, including the root, before the
+    stream is completed for it. The window is at most `N - W + 1` with `W`
+    operations per cycle, which is its default.
+
+    If `recycle_units` is set, a unit instead starts a new attempt on the first
+    unclaimed operation it sees once its previous attempt has a result. Units
+    failing early on their root are thus immediately available again. Claims
+    travel alongside operations in the chain. A unit whose window is over must
+    claim the unclaimed operations it sees, and pauses the stream until its
+    previous attempt has a result. Units still in their window let operations
+    through, but as the window is at most `N`, at least one unit is out of its
+    window when an operation goes through the chain, so all operations are
+    claimed.
+
+    If `prefiltered` is set, only operations marked by the prefilter are used
+    as roots. Units assigned to other operations stay idle.
+
+    `pattern_count` is the amount of patterns reported by the units, which
+    determines the type of their match results.
+
+    If `double_buffered` is set, units report whether they can start a new
+    attempt, which they may do before their previous attempt has a result.
+    A new attempt ends the window of the previous one, so units cannot be
+    recycled in that case.
+
+    If `stream_width` is larger than one, units receive that amount of
+    consecutive operations per cycle, and stream_valid covers all of them. The
+    controller then tells each unit in which slot its root arrives. Units
+    cannot be recycled nor prefiltered in that case.
+
+    The module has the following inputs:
+    - clock (`i1`)
+    - reset (`i1`): resets the chain to an empty state.
+    - stream_valid (`i1`): an operation is available at the input of the first unit.
+    - is_candidate (`i1`), if prefiltered: the prefilter marked the operation at
+      the input of the first unit.
+    - match_result_n (`Unknown | Success | Failure`) for each unit.
+    - ready_n (`i1`) for each unit, if double_buffered.
+
+    The module has the following outputs:
+    - is_stream_paused (`i1`): to provide to all matcher units.
+    - stall (`i1`): the stream is paused because a unit has not converged yet.
+    - new_sequence_n (`i1`) for each unit.
+    - stream_completed_n (`i1`) for each unit.
+    - root_slot_n (`i{log2(stream_width)}`) for each unit, if stream_width > 1.
+    """
+    assert unit_count >= 1
+    assert 1 <= stream_width <= unit_count
+    assert stream_width & (stream_width - 1) == 0
+    assert not (double_buffered and recycle_units)
+    if stream_width != 1:
+        assert not recycle_units and not prefiltered
+    # The cycle completing the window of an attempt must come before the one
+    # providing the next root of its unit, `N` operations after its root.
+    max_window = unit_count - stream_width + 1
+    if not window:
+        window = max_window
+    assert 1 <= window <= max_window
+
+    status_sum_type = match_status_sum_type(pattern_count)
+    input_types: list[Attribute] = [i1, i1, i1]
+    input_names = ["clock", "reset", "stream_valid"]
+    if prefiltered:
+        input_types.append(i1)
+        input_names.append("is_candidate")
+    result_types: list[Attribute] = [status_sum_type] * unit_count
+    if double_buffered:
+        result_types += [i1] * unit_count
+    block = Block(arg_types=input_types + result_types)
+    clock = block.args[0]
+    reset = block.args[1]
+    stream_valid = block.args[2]
+    match_results = block.args[len(input_types) : len(input_types) + unit_count]
+    ready_units = block.args[len(input_types) + unit_count :]
+
+    true = _constant(block, 1, 1)
+    false = _constant(block, 0, 1)
+
+    # Operations in the chain are tracked with whether they are valid roots and,
+    # when units are recycled, whether they have been claimed by a previous unit.
+    # The registers are defined first and receive their inputs once the claims
+    # are known.
+    valid_at: list[SSAValue] = [stream_valid]
+    if prefiltered:
+        is_valid_candidate = CombAnd.from_values([stream_valid, block.args[3]])
+        block.add_op(is_valid_candidate)
+        valid_at = [is_valid_candidate.result]
+    claimed_at: list[SSAValue] = [false]
+    valid_registers: list[SeqCompregCe] = []
+    claimed_registers: list[SeqCompregCe] = []
+    for unit in range(1, unit_count):
+        valid_register = SeqCompregCe.new(
+            f"{controller_name}_valid_{unit}", i1, false, clock, true, reset, false
+        )
+        block.add_op(valid_register)
+        valid_registers.append(valid_register)
+        valid_at.append(valid_register.data)
+        if not recycle_units:
+            continue
+        claimed_register = SeqCompregCe.new(
+            f"{controller_name}_claimed_{unit}", i1, false, clock, true, reset, false
+        )
+        block.add_op(claimed_register)
+        claimed_registers.append(claimed_register)
+        claimed_at.append(claimed_register.data)
+
+    # Without recycling, the position modulo N of the operation at the first
+    # unit designates which unit receives its root. Unit `n` sees operations
+    # `n` positions behind the first unit, so its root arrives at position `2n`.
+    # With W operations per cycle, the position is the one of the first
+    # operation of the cycle, and unit `n` sees operations `nW` positions
+    # behind. Its root `n` is then in slot `(n(W + 1) - p) mod N` if below W.
+    position_width = _counter_width(unit_count - 1)
+    slot_width = int(math.log2(stream_width))
+    position_register: SeqCompregCe | None = None
+    if not recycle_units:
+        position_register = SeqCompregCe.new(
+            f"{controller_name}_position",
+            IntegerType(position_width),
+            _constant(block, 0, position_width),
+            clock,
+            true,
+            reset,
+            _constant(block, 0, position_width),
+        )
+        block.add_op(position_register)
+
+    # A unit is idle if it never started or if its current attempt has a result.
+    # Double-buffered units tell themselves whether they are ready.
+    started_registers: list[SeqCompregCe] = []
+    seen_registers: list[SeqCompregCe] = []
+    is_over: list[SSAValue] = []
+    is_idle: list[SSAValue] = []
+    must_claim: list[SSAValue] = []
+    root_slots: list[SSAValue] = []
+    for unit in range(unit_count):
+        seen_register, is_window_over = _window_counter(
+            block,
+            f"{controller_name}_seen_{unit}",
+            clock,
+            reset,
+            window,
+            true,
+            stream_width,
+        )
+        seen_registers.append(seen_register)
+        is_over.append(is_window_over)
+        if double_buffered:
+            is_idle.append(ready_units[unit])
+        else:
+            started_register = SeqCompregCe.new(
+                f"{controller_name}_started_{unit}",
+                i1,
+                false,
+                clock,
+                true,
+                reset,
+                false,
+            )
+            block.add_op(started_register)
+            started_registers.append(started_register)
+            is_unknown = HwSumIs.from_variant(match_results[unit], "unknown")
+            block.add_op(is_unknown)
+            idle = CombOr.from_values(
+                [
+                    _not(block, started_register.data, true),
+                    _not(block, is_unknown.output, true),
+                ]
+            )
+            block.add_op(idle)
+            is_idle.append(idle.result)
+
+        if recycle_units:
+            # Units out of their window must claim what previous units did not.
+            unclaimed_over = CombAnd.from_values(
+                [valid_at[unit], _not(block, claimed_at[unit], true), is_over[unit]]
+            )
+            block.add_op(unclaimed_over)
+            must_claim.append(unclaimed_over.result)
+        else:
+            assert position_register
+            if stream_width == 1:
+                is_root_position = CombICmp.from_values(
+                    position_register.data,
+                    _constant(block, (2 * unit) % unit_count, position_width),
+                    ICmpPredicate.EQ,
+                )
+            else:
+                slot_distance = _root_slot_distance(
+                    block, position_register.data, unit, unit_count, stream_width
+                )
+                root_slot = CombExtract.from_values(slot_distance, slot_width, 0)
+                block.add_op(root_slot)
+                root_slots.append(root_slot.output)
+                distance_width = cast(IntegerType, slot_distance.typ).width.data
+                is_root_position = CombICmp.from_values(
+                    slot_distance,
+                    _constant(block, stream_width, distance_width),
+                    ICmpPredicate.ULT,
+                )
+            block.add_op(is_root_position)
+            is_root = CombAnd.from_values([valid_at[unit], is_root_position.output])
+            block.add_op(is_root)
+            must_claim.append(is_root.result)
+
+    # The stream is stalled if a root arrives at a unit that is not done yet.
+    stalling_units: list[SSAValue] = []
+    for unit in range(unit_count):
+        is_stalling = CombAnd.from_values(
+            [must_claim[unit], _not(block, is_idle[unit], true)]
+        )
+        block.add_op(is_stalling)
+        stalling_units.append(is_stalling.result)
+    stall = CombOr.from_values(stalling_units)
+    block.add_op(stall)
+    is_stream_paused = CombOr.from_values(
+        [_not(block, stream_valid, true), stall.result]
+    )
+    block.add_op(is_stream_paused)
+    is_stream_running = _not(block, is_stream_paused.result, true)
+
+    new_sequences: list[SSAValue] = []
+    stream_completions: list[SSAValue] = []
+    for unit in range(unit_count):
+        can_claim: SSAValue = must_claim[unit]
+        if recycle_units:
+            is_unclaimed = CombAnd.from_values(
+                [valid_at[unit], _not(block, claimed_at[unit], true)]
+            )
+            block.add_op(is_unclaimed)
+            can_claim = is_unclaimed.result
+        claim = CombAnd.from_values([can_claim, is_idle[unit], is_stream_running])
+        block.add_op(claim)
+        new_sequences.append(claim.result)
+
+        if not double_buffered:
+            started = CombOr.from_values([started_registers[unit].data, claim.result])
+            block.add_op(started)
+            started_registers[unit].replace_operand(0, started.result)
+
+        stream_completions.append(
+            _window_completion(
+                block,
+                seen_registers[unit],
+                is_over[unit],
+                is_stream_running,
+                claim.result,
+                window,
+                true,
+                stream_width,
+                root_slots[unit] if stream_width != 1 else None,
+            )
+        )
+
+    # Move validity and claims along with operations.
+    for unit in range(1, unit_count):
+        valid_muxer = CombMux.from_values(
+            is_stream_running, valid_at[unit - 1], valid_at[unit]
+        )
+        block.add_op(valid_muxer)
+        valid_registers[unit - 1].replace_operand(0, valid_muxer.result)
+        if not recycle_units:
+            continue
+        claimed = CombOr.from_values([claimed_at[unit - 1], new_sequences[unit - 1]])
+        block.add_op(claimed)
+        claimed_muxer = CombMux.from_values(
+            is_stream_running, claimed.result, claimed_at[unit]
+        )
+        block.add_op(claimed_muxer)
+        claimed_registers[unit - 1].replace_operand(0, claimed_muxer.result)
+
+    if position_register:
+        if stream_width == 1:
+            last_position = CombICmp.from_values(
+                position_register.data,
+                _constant(block, unit_count - 1, position_width),
+                ICmpPredicate.EQ,
+            )
+            block.add_op(last_position)
+            next_position = CombAdd.from_values(
+                [position_register.data, _constant(block, 1, position_width)]
+            )
+            block.add_op(next_position)
+            wrapped_position = CombMux.from_values(
+                last_position.output,
+                _constant(block, 0, position_width),
+                next_position.result,
+            )
+            block.add_op(wrapped_position)
+        else:
+            # The position wraps around once it would reach N, so it never
+            # overflows. With W = N, it always wraps around.
+            wrap_start = _constant(block, unit_count - stream_width, position_width)
+            is_wrapping = CombICmp.from_values(
+                position_register.data, wrap_start, ICmpPredicate.UGE
+            )
+            block.add_op(is_wrapping)
+            next_position = CombAdd.from_values(
+                [
+                    position_register.data,
+                    _constant(block, stream_width % unit_count, position_width),
+                ]
+            )
+            block.add_op(next_position)
+            wrapped_next_position = CombSub.from_values(
+                position_register.data, wrap_start
+            )
+            block.add_op(wrapped_next_position)
+            wrapped_position = CombMux.from_values(
+                is_wrapping.output, wrapped_next_position.result, next_position.result
+            )
+            block.add_op(wrapped_position)
+        position_muxer = CombMux.from_values(
+            is_stream_running, wrapped_position.result, position_register.data
+        )
+        block.add_op(position_muxer)
+        position_register.replace_operand(0, position_muxer.result)
+
+    block.add_op(
+        HwOutput.from_outputs(
+            [is_stream_paused.result, stall.result]
+            + new_sequences
+            + stream_completions
+            + root_slots
+        )
+    )
+    return HwModule.from_block(
+        controller_name,
+        block,
+        input_names
+        + [f"match_result_{x}" for x in range(unit_count)]
+        + [f"ready_{x}" for x in range(len(ready_units))],
+        ["is_stream_paused", "stall"]
+        + [f"new_sequence_{x}" for x in range(unit_count)]
+        + [f"stream_completed_{x}" for x in range(unit_count)]
+        + [f"root_slot_{x}" for x in range(len(root_slots))],
+    )
+
+
+def generate_match_histogram(
+    unit_count: int, pattern_count: int, counter_width: int, histogram_name: str
+) -> HwModule:
+    """
+    Generates a module counting the matches of each pattern reported by the
+    units of a chain. A match is counted when the result of a unit becomes a
+    success, once the unit started its first attempt: until then, its FSM runs
+    on the values its registers power on with. Counters wrap around.
+
+    The module has the following inputs:
+    - clock (`i1`)
+    - reset (`i1`): resets all counters to zero.
+    - match_result_n (`Unknown | Success(pattern) | Failure`) for each unit.
+    - new_sequence_n (`i1`) for each unit.
+
+    The module has the following outputs:
+    - match_count_p (`i{counter_width}`) for each pattern.
+    """
+    assert unit_count >= 1 and pattern_count >= 1 and counter_width >= 1
+    status_sum_type = match_status_sum_type(pattern_count)
+    block = Block(
+        arg_types=[i1, i1] + [status_sum_type] * unit_count + [i1] * unit_count
+    )
+    clock = block.args[0]
+    reset = block.args[1]
+    match_results = block.args[2 : 2 + unit_count]
+    new_sequences = block.args[2 + unit_count :]
+
+    true = _constant(block, 1, 1)
+    false = _constant(block, 0, 1)
+    id_width = pattern_id_width(pattern_count)
+
+    # Matches reported by each unit during the current cycle, per pattern.
+    new_matches: list[list[SSAValue]] = [[] for _ in range(pattern_count)]
+    for unit in range(unit_count):
+        is_success = HwSumIs.from_variant(match_results[unit], "success")
+        block.add_op(is_success)
+        was_success = SeqCompregCe.new(
+            f"{histogram_name}_was_success_{unit}",
+            i1,
+            is_success.output,
+            clock,
+            true,
+            reset,
+            false,
+        )
+        block.add_op(was_success)
+        started = SeqCompregCe.new(
+            f"{histogram_name}_started_{unit}", i1, false, clock, true, reset, false
+        )
+        block.add_op(started)
+        is_started = CombOr.from_values([started.data, new_sequences[unit]])
+        block.add_op(is_started)
+        started.replace_operand(0, is_started.result)
+        new_success = CombAnd.from_values(
+            [is_success.output, _not(block, was_success.data, true), started.data]
+        )
+        block.add_op(new_success)
+        if pattern_count == 1:
+            new_matches[0].append(new_success.result)
+            continue
+        pattern_id = HwSumGetAs.from_variant(match_results[unit], "success")
+        block.add_op(pattern_id)
+        for pattern in range(pattern_count):
+            is_pattern = CombICmp.from_values(
+                pattern_id.output,
+                _constant(block, pattern, id_width),
+                ICmpPredicate.EQ,
+            )
+            block.add_op(is_pattern)
+            is_match = CombAnd.from_values([new_success.result, is_pattern.output])
+            block.add_op(is_match)
+            new_matches[pattern].append(is_match.result)
+
+    counter_type = IntegerType(counter_width)
+    counter_zero = _constant(block, 0, counter_width)
+    counts: list[SSAValue] = []
+    for pattern in range(pattern_count):
+        counter = SeqCompregCe.new(
+            f"{histogram_name}_count_{pattern}",
+            counter_type,
+            counter_zero,
+            clock,
+            true,
+            reset,
+            counter_zero,
+        )
+        block.add_op(counter)
+        increments: list[SSAValue] = [counter.data]
+        for is_match in new_matches[pattern]:
+            increment = is_match
+            if counter_width != 1:
+                padded = CombConcat.from_values(
+                    [_constant(block, 0, counter_width - 1), is_match]
+                )
+                block.add_op(padded)
+                increment = padded.output
+            increments.append(increment)
+        incremented = CombAdd.from_values(increments)
+        block.add_op(incremented)
+        counter.replace_operand(0, incremented.result)
+        counts.append(counter.data)
+
+    block.add_op(HwOutput.from_outputs(counts))
+    return HwModule.from_block(
+        histogram_name,
+        block,
+        ["clock", "reset"]
+        + [f"match_result_{x}" for x in range(unit_count)]
+        + [f"new_sequence_{x}" for x in range(unit_count)],
+        [f"match_count_{x}" for x in range(pattern_count)],
+    )
+
+
+@dataclass
+class PositionDependentMatcherUnit(Exception):
+    """The module of a matcher unit cannot be instantiated at every chain position."""
+
+    reason: str
+
+
+_MATCHER_UNIT_ARG_NAMES = [
+    "clock",
+    "input_op",
+    "is_stream_paused",
+    "new_sequence",
+    "stream_completed",
+]
+
+
+def check_position_independent(unit: MatcherUnit):
+    """
+    Checks that the module of a matcher unit only depends on its inputs, so a
+    single definition can be instantiated at every position of a chain. Its
+    interface must be the one of matcher units, it must not be parameterized,
+    and it may only instantiate definitions generated along with it.
+    """
+    module = unit.hw_module
+    arg_names = [x.data for x in module.argNames.data]
+    expected_arg_names = _MATCHER_UNIT_ARG_NAMES + (
+        ["reset"] if unit.double_buffered else []
+    )
+    if unit.stream_width != 1:
+        expected_arg_names += [f"input_op_{x}" for x in range(1, unit.stream_width)]
+        expected_arg_names.append("root_slot")
+    if arg_names != expected_arg_names:
+        raise PositionDependentMatcherUnit(f"unexpected inputs {arg_names}")
+    input_types = list(module.function_type.inputs.data)
+    output_types = list(module.function_type.outputs.data)
+    if len(output_types) < 2 or output_types[0] != input_types[1]:
+        raise PositionDependentMatcherUnit("output_op does not match input_op")
+    if output_types[1] != match_status_sum_type(unit.pattern_count):
+        raise PositionDependentMatcherUnit("unexpected match_result type")
+    result_names = [x.data for x in module.resultNames.data]
+    if unit.double_buffered and result_names[-unit.stream_width] != "ready":
+        raise PositionDependentMatcherUnit("missing ready output")
+    extra_output_names = [f"output_op_{x}" for x in range(1, unit.stream_width)]
+    if unit.stream_width != 1 and (
+        result_names[1 - unit.stream_width :] != extra_output_names
+    ):
+        raise PositionDependentMatcherUnit("missing output_op_k outputs")
+    if len(module.parameters.data) != 0:
+        raise PositionDependentMatcherUnit("the module is parameterized")
+
+    definitions = {unit.fsm.sym_name.data} | {
+        x.sym_name.data for x in unit.filler_modules
+    }
+    for op in module.regions[0].blocks[0].ops:
+        reference: SymbolRefAttr | None = None
+        if isinstance(op, FsmHwInstance):
+            reference = op.machine
+        elif isinstance(op, HwInstance):
+            reference = op.module_name
+        if reference and not reference.root_reference.data in definitions:
+            raise PositionDependentMatcherUnit(
+                f"instantiates {reference.root_reference.data}, which is not"
+                " generated with the unit"
+            )
+
+
+@dataclass
+class MatcherChain:
+    """
+    Modules generated for a chain of identical matcher units.
+
+    Field:
+    - top: module instantiating the controller, the histogram if any, and the
+           matcher unit once per position.
+    - controller: controller of the chain, or of each unit if the chain is
+                  decoupled.
+    - unit: matcher unit, defined once for all positions.
+    - histogram: counter of matches per pattern, if requested.
+    - fifo: input FIFO of each unit, if the chain is decoupled.
+    - prefilter: stage in front of the first unit, if requested.
+    """
+
+    top: HwModule
+    controller: HwModule
+    unit: MatcherUnit
+    histogram: HwModule | None = None
+    fifo: HwModule | None = None
+    prefilter: HwModule | None = None
+
+    def modules(self) -> list[Operation]:
+        """Operations to place in the top-level module, definitions first."""
+        modules: list[Operation] = self.unit.modules() + [self.controller]
+        if self.fifo:
+            modules.append(self.fifo)
+        if self.prefilter:
+            modules.append(self.prefilter)
+        if self.histogram:
+            modules.append(self.histogram)
+        return modules + [self.top]
+
+
+def generate_matcher_chain(
+    unit: MatcherUnit,
+    unit_count: int,
+    chain_name: str,
+    recycle_units: bool = False,
+    window: int | None = None,
+    counter_width: int | None = None,
+    prefilter: HwModule | None = None,
+) -> MatcherChain:
+    """
+    Generates a chain of `unit_count` instances of the same matcher unit, driven
+    by a controller (see `generate_chain_controller`). The unit is checked to be
+    position-independent, and its definition is shared by all positions, so
+    the size of the generated IR does not depend on `unit_count`.
+
+    If `counter_width` is provided, the matches of each pattern are counted
+    (see `generate_match_histogram`).
+
+    If `prefilter` is provided (see `generate_prefilter`), it is placed in front
+    of the first unit, which thus receives the stream one operation later, and
+    the controller only starts attempts on the operations it marks.
+
+    If the unit receives several operations per cycle, the chain does as well,
+    through additional `input_op_k` inputs and `output_op_k` outputs.
+
+    The module has the following inputs:
+    - clock (`i1`)
+    - reset (`i1`)
+    - stream_valid (`i1`): input_op and all input_op_k are valid.
+    - input_op (`HwOperation`)
+    - input_op_k (`HwOperation`) for each additional operation per cycle.
+
+    The module has the following outputs:
+    - output_op (`HwOperation`): operation leaving the last unit.
+    - is_stream_paused (`i1`): input_op is not consumed during this cycle.
+    - stall (`i1`): the stream is paused because a unit has not converged yet.
+    - match_result_n (`Unknown | Success | Failure`) for each unit.
+    - match_count_p (`i{counter_width}`) for each pattern, if counted.
+    - output_op_k (`HwOperation`) for each additional operation per cycle.
+    """
+    check_position_independent(unit)
+    unit_module = unit.hw_module
+    input_op_type = unit_module.function_type.inputs.data[1]
+    stream_width = unit.stream_width
+
+    controller = generate_chain_controller(
+        unit_count,
+        f"{chain_name}_controller",
+        recycle_units,
+        window,
+        prefiltered=prefilter is not None,
+        pattern_count=unit.pattern_count,
+        double_buffered=unit.double_buffered,
+        stream_width=stream_width,
+    )
+    histogram = None
+    if counter_width:
+        histogram = generate_match_histogram(
+            unit_count, unit.pattern_count, counter_width, f"{chain_name}_histogram"
+        )
+
+    block = Block(arg_types=[i1, i1, i1] + [input_op_type] * stream_width)
+    clock = block.args[0]
+    reset = block.args[1]
+    stream_valid = block.args[2]
+    input_op = block.args[3]
+
+    # Units and the controller depend on each other. The controller is given
+    # placeholders for the results of the units, replaced once they exist.
+    placeholder = HwConstant.from_attr(IntegerAttr.from_int_and_width(0, 1))
+    block.add_op(placeholder)
+    placeholder_count = 2 * unit_count if unit.double_buffered else unit_count
+    controller_inputs = [clock, reset, stream_valid]
+    if prefilter:
+        controller_inputs.append(placeholder.output)
+    results_start = len(controller_inputs)
+    controller_inst = HwInstance.new(
+        f"{chain_name}_controller_inst",
+        controller,
+        controller_inputs + [placeholder.output] * placeholder_count,
+    )
+    block.add_op(controller_inst)
+    is_stream_paused = controller_inst.outputs[0]
+    stall = controller_inst.outputs[1]
+    new_sequences = controller_inst.outputs[2 : 2 + unit_count]
+    stream_completions = controller_inst.outputs[2 + unit_count : 2 + 2 * unit_count]
+    root_slots = controller_inst.outputs[2 + 2 * unit_count :]
+
+    unit_input_op: SSAValue = input_op
+    if prefilter:
+        prefilter_inst = HwInstance.new(
+            f"{chain_name}_prefilter_inst",
+            prefilter,
+            [clock, input_op, is_stream_paused],
+        )
+        block.add_op(prefilter_inst)
+        unit_input_op = prefilter_inst.outputs[0]
+        controller_inst.replace_operand(3, prefilter_inst.outputs[1])
+    extra_input_ops: list[SSAValue] = list(block.args[4:])
+    match_results: list[SSAValue] = []
+    for position in range(unit_count):
+        unit_inputs = [
+            clock,
+            unit_input_op,
+            is_stream_paused,
+            new_sequences[position],
+            stream_completions[position],
+        ]
+        if unit.double_buffered:
+            unit_inputs.append(reset)
+        if stream_width != 1:
+            unit_inputs += extra_input_ops + [root_slots[position]]
+        unit_inst = HwInstance.new(
+            f"{chain_name}_unit_{position}", unit_module, unit_inputs
+        )
+        block.add_op(unit_inst)
+        unit_input_op = unit_inst.outputs[0]
+        output_count = len(unit_inst.outputs)
+        extra_input_ops = list(unit_inst.outputs[output_count + 1 - stream_width :])
+        match_results.append(unit_inst.outputs[1])
+        controller_inst.replace_operand(results_start + position, unit_inst.outputs[1])
+        if unit.double_buffered:
+            controller_inst.replace_operand(
+                results_start + unit_count + position,
+                unit_inst.outputs[-stream_width],
+            )
+    block.erase_op(placeholder)
+
+    match_counts: list[SSAValue] = []
+    if histogram:
+        histogram_inst = HwInstance.new(
+            f"{chain_name}_histogram_inst",
+            histogram,
+            [clock, reset] + match_results + new_sequences,
+        )
+        block.add_op(histogram_inst)
+        match_counts = list(histogram_inst.outputs)
+
+    block.add_op(
+        HwOutput.from_outputs(
+            [unit_input_op, is_stream_paused, stall]
+            + match_results
+            + match_counts
+            + extra_input_ops
+        )
+    )
+    top = HwModule.from_block(
+        chain_name,
+        block,
+        ["clock", "reset", "stream_valid", "input_op"]
+        + [f"input_op_{x}" for x in range(1, stream_width)],
+        ["output_op", "is_stream_paused", "stall"]
+        + [f"match_result_{x}" for x in range(unit_count)]
+        + [f"match_count_{x}" for x in range(len(match_counts))]
+        + [f"output_op_{x}" for x in range(1, stream_width)],
+    )
+    return MatcherChain(top, controller, unit, histogram, prefilter=prefilter)
+
+
+def fifo_depth_for_cycle_bound(cycle_bound: int) -> int:
+    """
+    Depth of the input FIFOs of a decoupled chain whose units decide at most
+    `cycle_bound` cycles after the end of their window (see
+    `compute_fsm_cycle_bound`). A late unit pauses for at most that many
+    cycles, during which the previous unit keeps filling its FIFO. Depths are
+    powers of two so pointers wrap around on their own.
+    """
+    return max(2, 2 ** _counter_width(cycle_bound))
+
+
+def generate_operation_fifo(
+    input_op_type: Attribute, depth: int, fifo_name: str
+) -> HwModule:
+    """
+    Generates a FIFO of `depth` operations, `depth` being a power of two.
+    Pushing when full or popping when empty is not supported.
+
+    The module has the following inputs:
+    - clock (`i1`)
+    - reset (`i1`): empties the FIFO.
+    - push (`i1`): push_op enters the FIFO.
+    - push_op (`HwOperation`)
+    - pop (`i1`): head_op leaves the FIFO.
+
+    The module has the following outputs:
+    - head_op (`HwOperation`): oldest operation of the FIFO.
+    - is_empty (`i1`)
+    - is_full (`i1`)
+    """
+    assert depth >= 2 and depth & (depth - 1) == 0
+    pointer_width = _counter_width(depth - 1)
+    count_width = _counter_width(depth)
+    pointer_type = IntegerType(pointer_width)
+
+    block = Block(arg_types=[i1, i1, i1, input_op_type, i1])
+    clock = block.args[0]
+    reset = block.args[1]
+    push = block.args[2]
+    push_op = block.args[3]
+    pop = block.args[4]
+
+    true = _constant(block, 1, 1)
+    false = _constant(block, 0, 1)
+    pointer_zero = _constant(block, 0, pointer_width)
+    pointer_one = _constant(block, 1, pointer_width)
+
+    pointers: list[SeqCompregCe] = []
+    for pointer_name, enable in [("write", push), ("read", pop)]:
+        pointer = SeqCompregCe.new(
+            f"{fifo_name}_{pointer_name}_pointer",
+            pointer_type,
+            pointer_zero,
+            clock,
+            enable,
+            reset,
+            pointer_zero,
+        )
+        block.add_op(pointer)
+        next_pointer = CombAdd.from_values([pointer.data, pointer_one])
+        block.add_op(next_pointer)
+        pointer.replace_operand(0, next_pointer.result)
+        pointers.append(pointer)
+    write_pointer, read_pointer = pointers
+
+    entries: list[SSAValue] = []
+    for entry in range(depth):
+        is_written = CombICmp.from_values(
+            write_pointer.data,
+            _constant(block, entry, pointer_width),
+            ICmpPredicate.EQ,
+        )
+        block.add_op(is_written)
+        write_entry = CombAnd.from_values([push, is_written.output])
+        block.add_op(write_entry)
+        entry_register = SeqCompregCe.new(
+            f"{fifo_name}_entry_{entry}",
+            input_op_type,
+            push_op,
+            clock,
+            write_entry.result,
+            false,
+            push_op,
+        )
+        block.add_op(entry_register)
+        entries.append(entry_register.data)
+
+    # Select the head with a tree of muxers over the bits of the read pointer.
+    for bit in range(pointer_width):
+        is_bit_set = CombExtract.from_values(read_pointer.data, 1, bit)
+        block.add_op(is_bit_set)
+        selected: list[SSAValue] = []
+        for pair in range(0, len(entries), 2):
+            muxer = CombMux.from_values(
+                is_bit_set.output, entries[pair + 1], entries[pair]
+            )
+            block.add_op(muxer)
+            selected.append(muxer.result)
+        entries = selected
+
+    count_type = IntegerType(count_width)
+    count_zero = _constant(block, 0, count_width)
+    count_one = _constant(block, 1, count_width)
+    count_register = SeqCompregCe.new(
+        f"{fifo_name}_count", count_type, count_zero, clock, true, reset, count_zero
+    )
+    block.add_op(count_register)
+    incremented = CombAdd.from_values([count_register.data, count_one])
+    block.add_op(incremented)
+    decremented = CombSub.from_values(count_register.data, count_one)
+    block.add_op(decremented)
+    only_push = CombAnd.from_values([push, _not(block, pop, true)])
+    block.add_op(only_push)
+    only_pop = CombAnd.from_values([pop, _not(block, push, true)])
+    block.add_op(only_pop)
+    pop_muxer = CombMux.from_values(
+        only_pop.result, decremented.result, count_register.data
+    )
+    block.add_op(pop_muxer)
+    push_muxer = CombMux.from_values(
+        only_push.result, incremented.result, pop_muxer.result
+    )
+    block.add_op(push_muxer)
+    count_register.replace_operand(0, push_muxer.result)
+
+    is_empty = CombICmp.from_values(count_register.data, count_zero, ICmpPredicate.EQ)
+    block.add_op(is_empty)
+    is_full = CombICmp.from_values(
+        count_register.data, _constant(block, depth, count_width), ICmpPredicate.EQ
+    )
+    block.add_op(is_full)
+
+    block.add_op(HwOutput.from_outputs([entries[0], is_empty.output, is_full.output]))
+    return HwModule.from_block(
+        fifo_name,
+        block,
+        ["clock", "reset", "push", "push_op", "pop"],
+        ["head_op", "is_empty", "is_full"],
+    )
+
+
+def generate_unit_controller(
+    unit_count: int,
+    controller_name: str,
+    window: int | None = None,
+    pattern_count: int = 1,
+    double_buffered: bool = False,
+) -> HwModule:
+    """
+    Generates the controller of a single unit of a decoupled chain of
+    `unit_count` units, where each unit pops the stream from its own FIFO.
+
+    Every unit sees every operation of the stream, so the amount of operations
+    a unit consumed, modulo N, is the position of its current operation in the
+    stream. Unit `n` attempts to match operations `N*i + n`, and only pauses
+    itself when the root of its next attempt arrives before the previous one
+    has a result. Each attempt is given `window` operations, including the
+    root, before the stream is completed for it.
+
+    The module has the following inputs:
+    - clock (`i1`)
+    - reset (`i1`)
+    - root_position (`i{w}`): position modulo N of the roots of the unit.
+    - is_available (`i1`): the FIFO of the unit is not empty.
+    - has_room (`i1`): the FIFO of the next unit is not full.
+    - match_result (`Unknown | Success | Failure`)
+    - ready (`i1`), if double_buffered: the unit can start a new attempt.
+
+    The module has the following outputs:
+    - is_stream_paused (`i1`): to provide to the unit.
+    - pop (`i1`): the unit consumes the head of its FIFO, which is pushed to
+      the FIFO of the next unit.
+    - new_sequence (`i1`)
+    - stream_completed (`i1`)
+    """
+    assert unit_count >= 1
+    if not window:
+        window = unit_count
+    assert 1 <= window <= unit_count
+
+    position_width = _counter_width(unit_count - 1)
+    position_type = IntegerType(position_width)
+    input_types: list[Attribute] = [
+        i1,
+        i1,
+        position_type,
+        i1,
+        i1,
+        match_status_sum_type(pattern_count),
+    ]
+    input_names = [
+        "clock",
+        "reset",
+        "root_position",
+        "is_available",
+        "has_room",
+        "match_result",
+    ]
+    if double_buffered:
+        input_types.append(i1)
+        input_names.append("ready")
+    block = Block(arg_types=input_types)
+    clock = block.args[0]
+    reset = block.args[1]
+    root_position = block.args[2]
+    is_available = block.args[3]
+    has_room = block.args[4]
+    match_result = block.args[5]
+
+    true = _constant(block, 1, 1)
+    false = _constant(block, 0, 1)
+
+    position_zero = _constant(block, 0, position_width)
+    position_register = SeqCompregCe.new(
+        f"{controller_name}_position",
+        position_type,
+        position_zero,
+        clock,
+        true,
+        reset,
+        position_zero,
+    )
+    block.add_op(position_register)
+    is_root = CombICmp.from_values(
+        position_register.data, root_position, ICmpPredicate.EQ
+    )
+    block.add_op(is_root)
+
+    # The unit is idle if it never started or if its current attempt has a result.
+    started_register: SeqCompregCe | None = None
+    if double_buffered:
+        is_idle = block.args[6]
+    else:
+        started_register = SeqCompregCe.new(
+            f"{controller_name}_started", i1, false, clock, true, reset, false
+        )
+        block.add_op(started_register)
+        is_unknown = HwSumIs.from_variant(match_result, "unknown")
+        block.add_op(is_unknown)
+        idle = CombOr.from_values(
+            [
+                _not(block, started_register.data, true),
+                _not(block, is_unknown.output, true),
+            ]
+        )
+        block.add_op(idle)
+        is_idle = idle.result
+
+    is_stalling = CombAnd.from_values([is_root.output, _not(block, is_idle, true)])
+    block.add_op(is_stalling)
+    is_running = CombAnd.from_values(
+        [is_available, has_room, _not(block, is_stalling.result, true)]
+    )
+    block.add_op(is_running)
+    claim = CombAnd.from_values([is_root.output, is_running.result])
+    block.add_op(claim)
+    if started_register:
+        started = CombOr.from_values([started_register.data, claim.result])
+        block.add_op(started)
+        started_register.replace_operand(0, started.result)
+
+    seen_register, is_over = _window_counter(
+        block, f"{controller_name}_seen", clock, reset, window, true
+    )
+    stream_completed = _window_completion(
+        block, seen_register, is_over, is_running.result, claim.result, window, true
+    )
+
+    last_position = CombICmp.from_values(
+        position_register.data,
+        _constant(block, unit_count - 1, position_width),
+        ICmpPredicate.EQ,
+    )
+    block.add_op(last_position)
+    next_position = CombAdd.from_values(
+        [position_register.data, _constant(block, 1, position_width)]
+    )
+    block.add_op(next_position)
+    wrapped_position = CombMux.from_values(
+        last_position.output, position_zero, next_position.result
+    )
+    block.add_op(wrapped_position)
+    position_muxer = CombMux.from_values(
+        is_running.result, wrapped_position.result, position_register.data
+    )
+    block.add_op(position_muxer)
+    position_register.replace_operand(0, position_muxer.result)
+
+    block.add_op(
+        HwOutput.from_outputs(
+            [
+                _not(block, is_running.result, true),
+                is_running.result,
+                claim.result,
+                stream_completed,
+            ]
+        )
+    )
+    return HwModule.from_block(
+        controller_name,
+        block,
+        input_names,
+        ["is_stream_paused", "pop", "new_sequence", "stream_completed"],
+    )
+
+
+def generate_decoupled_chain(
+    unit: MatcherUnit,
+    unit_count: int,
+    chain_name: str,
+    window: int | None = None,
+    fifo_depth: int | None = None,
+    counter_width: int | None = None,
+) -> MatcherChain:
+    """
+    Generates a chain of `unit_count` instances of the same matcher unit, in
+    which each unit walks the stream at its own rhythm. Each unit pops the
+    stream from its own FIFO and pushes what it consumes to the FIFO of the next
+    unit. A unit whose FSM runs late only pauses itself, until its FIFO is
+    empty or the FIFO of the next unit is full (see `generate_unit_controller`).
+
+    If `fifo_depth` is not provided, FIFOs are sized from the cycle bound of
+    the FSM of the unit (see `fifo_depth_for_cycle_bound`). If `counter_width`
+    is provided, the matches of each pattern are counted (see
+    `generate_match_histogram`).
+
+    The module has the following inputs:
+    - clock (`i1`)
+    - reset (`i1`)
+    - stream_valid (`i1`): input_op is valid.
+    - input_op (`HwOperation`)
+
+    The module has the following outputs:
+    - output_op (`HwOperation`): operation leaving the last unit.
+    - output_valid (`i1`): output_op leaves the last unit during this cycle.
+    - is_stream_paused (`i1`): input_op is not consumed during this cycle.
+    - stall (`i1`): input_op is valid but the FIFO of the first unit is full.
+    - match_result_n (`Unknown | Success | Failure`) for each unit.
+    - match_count_p (`i{counter_width}`) for each pattern, if counted.
+    """
+    check_position_independent(unit)
+    assert unit.stream_width == 1
+    unit_module = unit.hw_module
+    input_op_type = unit_module.function_type.inputs.data[1]
+    if not fifo_depth:
+        fifo_depth = fifo_depth_for_cycle_bound(compute_fsm_cycle_bound(unit.fsm))
+
+    controller = generate_unit_controller(
+        unit_count,
+        f"{chain_name}_unit_controller",
+        window,
+        unit.pattern_count,
+        unit.double_buffered,
+    )
+    fifo = generate_operation_fifo(input_op_type, fifo_depth, f"{chain_name}_fifo")
+    histogram = None
+    if counter_width:
+        histogram = generate_match_histogram(
+            unit_count, unit.pattern_count, counter_width, f"{chain_name}_histogram"
+        )
+
+    block = Block(arg_types=[i1, i1, i1, input_op_type])
+    clock = block.args[0]
+    reset = block.args[1]
+    stream_valid = block.args[2]
+    input_op = block.args[3]
+
+    true = _constant(block, 1, 1)
+    position_width = _counter_width(unit_count - 1)
+
+    # FIFOs, controllers and units depend on each other. They are given
+    # placeholders, replaced once all of them exist.
+    placeholder = HwConstant.from_attr(IntegerAttr.from_int_and_width(0, 1))
+    block.add_op(placeholder)
+
+    fifo_insts: list[HwInstance] = []
+    for position in range(unit_count):
+        fifo_inst = HwInstance.new(
+            f"{chain_name}_fifo_{position}",
+            fifo,
+            [clock, reset, placeholder.output, input_op, placeholder.output],
+        )
+        block.add_op(fifo_inst)
+        fifo_insts.append(fifo_inst)
+
+    # The first FIFO receives the stream.
+    is_first_full = fifo_insts[0].outputs[2]
+    stall = CombAnd.from_values([stream_valid, is_first_full])
+    block.add_op(stall)
+    is_accepted = CombAnd.from_values([stream_valid, _not(block, is_first_full, true)])
+    block.add_op(is_accepted)
+    fifo_insts[0].replace_operand(2, is_accepted.result)
+
+    match_results: list[SSAValue] = []
+    new_sequences: list[SSAValue] = []
+    pops: list[SSAValue] = []
+    for position in range(unit_count):
+        head_op = fifo_insts[position].outputs[0]
+        is_empty = fifo_insts[position].outputs[1]
+        has_room: SSAValue = true
+        if position + 1 < unit_count:
+            has_room = _not(block, fifo_insts[position + 1].outputs[2], true)
+        controller_inputs = [
+            clock,
+            reset,
+            _constant(block, position, position_width),
+            _not(block, is_empty, true),
+            has_room,
+            placeholder.output,
+        ]
+        if unit.double_buffered:
+            controller_inputs.append(placeholder.output)
+        controller_inst = HwInstance.new(
+            f"{chain_name}_unit_controller_{position}", controller, controller_inputs
+        )
+        block.add_op(controller_inst)
+        pop = controller_inst.outputs[1]
+        pops.append(pop)
+        fifo_insts[position].replace_operand(4, pop)
+        if position + 1 < unit_count:
+            fifo_insts[position + 1].replace_operand(2, pop)
+            fifo_insts[position + 1].replace_operand(3, head_op)
+
+        new_sequences.append(controller_inst.outputs[2])
+        unit_inputs = [
+            clock,
+            head_op,
+            controller_inst.outputs[0],
+            controller_inst.outputs[2],
+            controller_inst.outputs[3],
+        ]
+        if unit.double_buffered:
+            unit_inputs.append(reset)
+        unit_inst = HwInstance.new(
+            f"{chain_name}_unit_{position}", unit_module, unit_inputs
+        )
+        block.add_op(unit_inst)
+        match_results.append(unit_inst.outputs[1])
+        controller_inst.replace_operand(5, unit_inst.outputs[1])
+        if unit.double_buffered:
+            controller_inst.replace_operand(6, unit_inst.outputs[-1])
+    block.erase_op(placeholder)
+
+    match_counts: list[SSAValue] = []
+    if histogram:
+        histogram_inst = HwInstance.new(
+            f"{chain_name}_histogram_inst",
+            histogram,
+            [clock, reset] + match_results + new_sequences,
+        )
+        block.add_op(histogram_inst)
+        match_counts = list(histogram_inst.outputs)
+
+    block.add_op(
+        HwOutput.from_outputs(
+            [
+                fifo_insts[-1].outputs[0],
+                pops[-1],
+                _not(block, is_accepted.result, true),
+                stall.result,
+            ]
+            + match_results
+            + match_counts
+        )
+    )
+    top = HwModule.from_block(
+        chain_name,
+        block,
+        ["clock", "reset", "stream_valid", "input_op"],
+        ["output_op", "output_valid", "is_stream_paused", "stall"]
+        + [f"match_result_{x}" for x in range(unit_count)]
+        + [f"match_count_{x}" for x in range(len(match_counts))],
+    )
+    return MatcherChain(top, controller, unit, histogram, fifo)
+
+
+def generate_block_dispatcher(chain_count: int, dispatcher_name: str) -> HwModule:
+    """
+    Generates a dispatcher handing whole blocks of the stream to `chain_count`
+    chains in turn, through the input FIFO of each chain. The stream is only
+    paused when the FIFO of the chain receiving the current block is full, so
+    a chain running late does not hold back the others.
+
+    The module has the following inputs:
+    - clock (`i1`)
+    - reset (`i1`)
+    - stream_valid (`i1`): an operation is available.
+    - is_block_end (`i1`): the operation is the block identifier ending its
+      block.
+    - is_full_k (`i1`) for each chain: the FIFO of the chain is full.
+
+    The module has the following outputs:
+    - is_stream_paused (`i1`): the operation is not consumed during this cycle.
+    - stall (`i1`): the operation is valid but the FIFO of its chain is full.
+    - push_k (`i1`) for each chain: the operation enters the FIFO of the chain.
+    """
+    assert chain_count >= 1
+    block = Block(arg_types=[i1, i1, i1, i1] + [i1] * chain_count)
+    clock = block.args[0]
+    reset = block.args[1]
+    stream_valid = block.args[2]
+    is_block_end = block.args[3]
+    full_chains = block.args[4:]
+
+    true = _constant(block, 1, 1)
+
+    # The target is the chain receiving the current block.
+    target_width = _counter_width(chain_count - 1)
+    target_zero = _constant(block, 0, target_width)
+    target_register = SeqCompregCe.new(
+        f"{dispatcher_name}_target",
+        IntegerType(target_width),
+        target_zero,
+        clock,
+        true,
+        reset,
+        target_zero,
+    )
+    block.add_op(target_register)
+    is_targets: list[SSAValue] = []
+    targets_full: list[SSAValue] = []
+    for chain in range(chain_count):
+        is_target = CombICmp.from_values(
+            target_register.data,
+            _constant(block, chain, target_width),
+            ICmpPredicate.EQ,
+        )
+        block.add_op(is_target)
+        is_targets.append(is_target.output)
+        target_full = CombAnd.from_values([is_target.output, full_chains[chain]])
+        block.add_op(target_full)
+        targets_full.append(target_full.result)
+    is_target_full = CombOr.from_values(targets_full)
+    block.add_op(is_target_full)
+
+    stall = CombAnd.from_values([stream_valid, is_target_full.result])
+    block.add_op(stall)
+    is_accepted = CombAnd.from_values(
+        [stream_valid, _not(block, is_target_full.result, true)]
+    )
+    block.add_op(is_accepted)
+    pushes: list[SSAValue] = []
+    for chain in range(chain_count):
+        push = CombAnd.from_values([is_accepted.result, is_targets[chain]])
+        block.add_op(push)
+        pushes.append(push.result)
+
+    # The next block goes to the next chain once the block identifier is sent.
+    is_last_chain = CombICmp.from_values(
+        target_register.data,
+        _constant(block, chain_count - 1, target_width),
+        ICmpPredicate.EQ,
+    )
+    block.add_op(is_last_chain)
+    next_target = CombAdd.from_values(
+        [target_register.data, _constant(block, 1, target_width)]
+    )
+    block.add_op(next_target)
+    wrapped_target = CombMux.from_values(
+        is_last_chain.output, target_zero, next_target.result
+    )
+    block.add_op(wrapped_target)
+    is_switching = CombAnd.from_values([is_accepted.result, is_block_end])
+    block.add_op(is_switching)
+    target_muxer = CombMux.from_values(
+        is_switching.result, wrapped_target.result, target_register.data
+    )
+    block.add_op(target_muxer)
+    target_register.replace_operand(0, target_muxer.result)
+
+    block.add_op(
+        HwOutput.from_outputs(
+            [_not(block, is_accepted.result, true), stall.result] + pushes
+        )
+    )
+    return HwModule.from_block(
+        dispatcher_name,
+        block,
+        ["clock", "reset", "stream_valid", "is_block_end"]
+        + [f"is_full_{x}" for x in range(chain_count)],
+        ["is_stream_paused", "stall"] + [f"push_{x}" for x in range(chain_count)],
+    )
+
+
+def generate_match_count_reducer(
+    chain_count: int, pattern_count: int, counter_width: int, reducer_name: str
+) -> HwModule:
+    """
+    Generates a module summing the match counts of each pattern over several
+    chains (see `generate_match_histogram`). Sums wrap around like counters.
+
+    The module has the following inputs:
+    - match_count_k_p (`i{counter_width}`) for each chain k and pattern p.
+
+    The module has the following outputs:
+    - match_count_p (`i{counter_width}`) for each pattern.
+    """
+    assert chain_count >= 1 and pattern_count >= 1 and counter_width >= 1
+    block = Block(arg_types=[IntegerType(counter_width)] * chain_count * pattern_count)
+
+    sums: list[SSAValue] = []
+    for pattern in range(pattern_count):
+        chain_counts = [
+            block.args[chain * pattern_count + pattern] for chain in range(chain_count)
+        ]
+        if chain_count == 1:
+            sums.append(chain_counts[0])
+            continue
+        pattern_sum = CombAdd.from_values(chain_counts)
+        block.add_op(pattern_sum)
+        sums.append(pattern_sum.result)
+
+    block.add_op(HwOutput.from_outputs(sums))
+    return HwModule.from_block(
+        reducer_name,
+        block,
+        [
+            f"match_count_{chain}_{pattern}"
+            for chain in range(chain_count)
+            for pattern in range(pattern_count)
+        ],
+        [f"match_count_{x}" for x in range(pattern_count)],
+    )
+
+
+@dataclass
+class ParallelChains:
+    """
+    Modules generated for independent chains processing different blocks.
+
+    Field:
+    - top: module instantiating the dispatcher, the reducer, and the chain and
+           its input FIFO once per chain.
+    - dispatcher: hands blocks to the chains.
+    - reducer: sums the match counts of the chains.
+    - fifo: input FIFO of each chain.
+    - chain: chain of matcher units, defined once for all chains.
+    """
+
+    top: HwModule
+    dispatcher: HwModule
+    reducer: HwModule
+    fifo: HwModule
+    chain: MatcherChain
+
+    def modules(self) -> list[Operation]:
+        """Operations to place in the top-level module, definitions first."""
+        return self.chain.modules() + [
+            self.dispatcher,
+            self.fifo,
+            self.reducer,
+            self.top,
+        ]
+
+
+def generate_parallel_chains(
+    chain: MatcherChain,
+    chain_count: int,
+    top_name: str,
+    fifo_depth: int | None = None,
+) -> ParallelChains:
+    """
+    Generates `chain_count` instances of the same chain of matcher units, each
+    processing whole blocks of the stream. As patterns never span several
+    blocks, chains are independent: a dispatcher hands each block to the next
+    chain through its input FIFO (see `generate_block_dispatcher`), and the
+    match counts of all chains are summed (see `generate_match_count_reducer`).
+
+    The chain must count its matches, and receive one operation per cycle. If
+    `fifo_depth` is not provided, FIFOs are sized from the cycle bound of the
+    FSM of its unit (see `fifo_depth_for_cycle_bound`).
+
+    The module has the following inputs:
+    - clock (`i1`)
+    - reset (`i1`)
+    - stream_valid (`i1`): input_op is valid.
+    - is_block_end (`i1`): input_op is the block identifier ending its block.
+    - input_op (`HwOperation`)
+
+    The module has the following outputs:
+    - is_stream_paused (`i1`): input_op is not consumed during this cycle.
+    - stall (`i1`): input_op is valid but the FIFO of its chain is full.
+    - match_count_p (`i{counter_width}`) for each pattern.
+    """
+    assert chain_count >= 1
+    assert chain.histogram
+    assert chain.unit.stream_width == 1
+    chain_module = chain.top
+    input_op_type = chain_module.function_type.inputs.data[3]
+    result_names = [x.data for x in chain_module.resultNames.data]
+    paused_index = result_names.index("is_stream_paused")
+    counts_index = result_names.index("match_count_0")
+    pattern_count = chain.unit.pattern_count
+    counter_type = cast(
+        IntegerType, chain_module.function_type.outputs.data[counts_index]
+    )
+    if not fifo_depth:
+        fifo_depth = fifo_depth_for_cycle_bound(
+            compute_fsm_cycle_bound(chain.unit.fsm)
+        )
+
+    dispatcher = generate_block_dispatcher(chain_count, f"{top_name}_dispatcher")
+    fifo = generate_operation_fifo(input_op_type, fifo_depth, f"{top_name}_fifo")
+    reducer = generate_match_count_reducer(
+        chain_count, pattern_count, counter_type.width.data, f"{top_name}_reducer"
+    )
+
+    block = Block(arg_types=[i1, i1, i1, i1, input_op_type])
+    clock = block.args[0]
+    reset = block.args[1]
+    stream_valid = block.args[2]
+    is_block_end = block.args[3]
+    input_op = block.args[4]
+
+    true = _constant(block, 1, 1)
+
+    # The dispatcher and FIFOs depend on each other. The dispatcher is given
+    # placeholders for whether FIFOs are full, replaced once they exist.
+    placeholder = HwConstant.from_attr(IntegerAttr.from_int_and_width(0, 1))
+    block.add_op(placeholder)
+    dispatcher_inst = HwInstance.new(
+        f"{top_name}_dispatcher_inst",
+        dispatcher,
+        [clock, reset, stream_valid, is_block_end]
+        + [placeholder.output] * chain_count,
+    )
+    block.add_op(dispatcher_inst)
+
+    match_counts: list[SSAValue] = []
+    for index in range(chain_count):
+        fifo_inst = HwInstance.new(
+            f"{top_name}_fifo_{index}",
+            fifo,
+            [
+                clock,
+                reset,
+                dispatcher_inst.outputs[2 + index],
+                input_op,
+                placeholder.output,
+            ],
+        )
+        block.add_op(fifo_inst)
+        dispatcher_inst.replace_operand(4 + index, fifo_inst.outputs[2])
+        chain_inst = HwInstance.new(
+            f"{top_name}_chain_{index}",
+            chain_module,
+            [
+                clock,
+                reset,
+                _not(block, fifo_inst.outputs[1], true),
+                fifo_inst.outputs[0],
+            ],
+        )
+        block.add_op(chain_inst)
+        # The chain consumes the head of the FIFO whenever it is not paused.
+        fifo_inst.replace_operand(
+            4, _not(block, chain_inst.outputs[paused_index], true)
+        )
+        match_counts += chain_inst.outputs[counts_index : counts_index + pattern_count]
+    block.erase_op(placeholder)
+
+    reducer_inst = HwInstance.new(f"{top_name}_reducer_inst", reducer, match_counts)
+    block.add_op(reducer_inst)
+
+    block.add_op(
+        HwOutput.from_outputs(
+            [dispatcher_inst.outputs[0], dispatcher_inst.outputs[1]]
+            + list(reducer_inst.outputs)
+        )
+    )
+    top = HwModule.from_block(
+        top_name,
+        block,
+        ["clock", "reset", "stream_valid", "is_block_end", "input_op"],
+        ["is_stream_paused", "stall"]
+        + [f"match_count_{x}" for x in range(pattern_count)],
+    )
+    return ParallelChains(top, dispatcher, reducer, fifo, chain)
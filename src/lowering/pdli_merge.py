@@ -0,0 +1,106 @@
+from xdsl.dialects.builtin import IntegerAttr, StringAttr
+from xdsl.ir import Block, Region
+from xdsl.pattern_rewriter import PatternRewriteWalker, GreedyRewritePatternApplier
+
+from dialects.pdl_interp import (
+    PdlInterpFinalize,
+    PdlInterpFunc,
+    PdlInterpRecordMatch,
+)
+from lowering.pdli_switchify import (
+    MergeSwitchCascades,
+    SwitchifyPdlInterp,
+    remove_unreachable_blocks,
+)
+
+"""
+Merging of the PDL-Interp matchers of several patterns into a single matcher,
+so one FSM walks a shared decision tree instead of one FSM per pattern.
+
+Matchers are tried in order: wherever a matcher fails, the merged matcher
+carries on with the next one. Once chained this way, the checks on the root
+starting each matcher form cascades of switches on the same value, which are
+merged into shared switches. Each `record_match` is tagged with the index of
+the pattern it reports.
+"""
+
+
+def _is_failure(block: Block) -> bool:
+    return isinstance(block.first_op, PdlInterpFinalize)
+
+
+def merge_matchers(
+    matchers: list[PdlInterpFunc], name: str = "matcher"
+) -> PdlInterpFunc:
+    """
+    Merges matchers into a single one. Patterns of earlier matchers have
+    priority over the ones of later matchers. The provided matchers are left
+    untouched.
+    """
+    assert len(matchers) != 0
+    regions = [x.clone().region for x in matchers]
+
+    merged_region = Region()
+    end = Block()
+    end.add_op(PdlInterpFinalize.create())
+
+    # Matchers all start from the same root, the one of the first matcher.
+    root = regions[0].blocks[0].args[0]
+    for region in regions[1:]:
+        entry = region.blocks[0]
+        entry.args[0].replace_by(root)
+        entry.erase_arg(entry.args[0])
+
+    pattern_index = 0
+    for index, region in enumerate(regions):
+        on_failure = regions[index + 1].blocks[0] if index + 1 < len(regions) else end
+        for block in region.blocks:
+            terminator = block.last_op
+            if not terminator:
+                continue
+            if isinstance(terminator, PdlInterpRecordMatch):
+                terminator.attributes["patternIndex"] = IntegerAttr.from_int_and_width(
+                    pattern_index, 32
+                )
+                pattern_index += 1
+            for successor_index, successor in enumerate(terminator.successors):
+                if not _is_failure(successor):
+                    continue
+                # The FSM stops at the first recorded match.
+                terminator.successors[successor_index] = (
+                    end if isinstance(terminator, PdlInterpRecordMatch) else on_failure
+                )
+        for block in list(region.blocks):
+            merged_region.add_block(region.detach_block(block))
+    merged_region.add_block(end)
+    remove_unreachable_blocks(merged_region)
+
+    merged = PdlInterpFunc.create(
+        attributes={
+            "sym_name": StringAttr(name),
+            "function_type": matchers[0].function_type,
+        },
+        regions=[merged_region],
+    )
+
+    # Checks on the root of successive matchers now cascade into each other.
+    for pattern in [SwitchifyPdlInterp(), MergeSwitchCascades()]:
+        walker = PatternRewriteWalker(
+            GreedyRewritePatternApplier([pattern]),
+            walk_regions_first=True,
+            apply_recursively=True,
+            walk_reverse=False,
+        )
+        walker.rewrite_module(merged)
+    remove_unreachable_blocks(merged.region)
+    return merged
+
+
+def pattern_count(pdli_region: Region) -> int:
+    """Amount of patterns a matcher reports, one per `record_match` index."""
+    indices = [
+        x.last_op.get_pattern_index()
+        for x in pdli_region.blocks
+        if isinstance(x.last_op, PdlInterpRecordMatch)
+    ]
+    return max(indices) + 1 if len(indices) != 0 else 0
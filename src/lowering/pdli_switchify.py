@@ -1,6 +1,7 @@
 from dataclasses import dataclass
+from typing import cast
 
-from xdsl.ir import Operation
+from xdsl.ir import Block, Operation, Region
 from xdsl.pattern_rewriter import RewritePattern, PatternRewriter
 
 from dialects.pdl_interp import *
@@ -60,3 +61,126 @@ class SwitchifyPdlInterp(RewritePattern):
                     ),
                 )
 
+
+
+def _redirect_failures(
+    switch: Operation, case_dest: Block, cascade: Block, fallback: Block
+) -> bool:
+    """
+    Makes the blocks reached from `case_dest`, a destination of `switch`, branch
+    to `fallback` instead of `cascade`. Returns False and leaves the blocks
+    untouched if one of them can be reached without going through `case_dest`.
+    """
+    region = cast(Region, case_dest.parent)
+    predecessors: dict[Block, list[Block]] = {x: [] for x in region.blocks}
+    for block in region.blocks:
+        if block.last_op:
+            for successor in block.last_op.successors:
+                predecessors[successor].append(block)
+
+    reachable: set[Block] = set()
+    worklist = [case_dest]
+    while len(worklist) != 0:
+        block = worklist.pop()
+        if block in reachable or block == cascade:
+            continue
+        reachable.add(block)
+        if block.last_op:
+            worklist += list(block.last_op.successors)
+
+    # Blocks from which the cascade can be reached. Matchers are acyclic.
+    leading: set[Block] = set()
+    changed = True
+    while changed:
+        changed = False
+        for block in reachable - leading:
+            if block.last_op and any(
+                x == cascade or x in leading for x in block.last_op.successors
+            ):
+                leading.add(block)
+                changed = True
+
+    for block in leading:
+        if block == case_dest:
+            if predecessors[block] != [switch.parent_block()]:
+                return False
+        elif any(not x in reachable for x in predecessors[block]):
+            return False
+    for block in leading:
+        terminator = cast(Operation, block.last_op)
+        for index, successor in enumerate(terminator.successors):
+            if successor == cascade:
+                terminator.successors[index] = fallback
+    return True
+
+
+@dataclass
+class MergeSwitchCascades(RewritePattern):
+    """
+    Merges a switch with the switch on the same value that its default destination
+    solely consists of, so a cascade of checks on a value becomes a single switch.
+
+    Cases of the first switch take precedence over the ones of the second. When
+    both switches have a case for the same value, the checks of the first case
+    carry on with the ones of the second case when they fail, instead of going
+    back to the second switch. Switches met on both cases can then be merged in
+    turn, so merged matchers share their checks recursively.
+    """
+
+    def match_and_rewrite(self, op: Operation, rewriter: PatternRewriter) -> None:
+        match op:
+            case (
+                PdlInterpSwitchAttribute()
+                | PdlInterpSwitchOperationName()
+                | PdlInterpSwitchType()
+                | PdlInterpSwitchTypes()
+            ):
+                pass
+            case _:
+                return
+
+        default_dest = op.default_dest
+        if len(default_dest.args) != 0 or default_dest.first_op != default_dest.last_op:
+            return
+        cascaded = default_dest.last_op
+        if (
+            type(cascaded) != type(op)
+            or cascaded == op
+            or cascaded.operands[0] != op.operands[0]
+        ):
+            return
+
+        cases = dict(zip(op.case_values.data, op.cases))
+        for case_value, case_dest in zip(
+            cascaded.case_values.data, cascaded.cases  # type: ignore
+        ):
+            if case_value in cases:
+                # If they cannot be redirected, failures of the first case still
+                # reach the second switch through its block, which stays in place.
+                _redirect_failures(op, cases[case_value], default_dest, case_dest)
+            else:
+                cases[case_value] = case_dest
+        rewriter.replace_op(
+            op,
+            type(op).from_cases(
+                op.operands[0], cases, cascaded.default_dest  # type: ignore
+            ),
+        )
+
+
+def remove_unreachable_blocks(region: Region):
+    """Erases the blocks of a region that cannot be reached from its entry block."""
+    if len(region.blocks) == 0:
+        return
+    reachable: set[Block] = set()
+    worklist = [region.blocks[0]]
+    while len(worklist) != 0:
+        block = worklist.pop()
+        if block in reachable:
+            continue
+        reachable.add(block)
+        if block.last_op:
+            worklist += list(block.last_op.successors)
+    for block in [x for x in region.blocks if not x in reachable]:
+        # Values of unreachable blocks are only used by unreachable blocks.
+        region.erase_block(block, safe_erase=False)
@@ -1,7 +1,7 @@
 from dataclasses import dataclass, field
-from typing import Tuple, Union
+from typing import Tuple, Union, cast
 
-from xdsl.ir import Region, SSAValue, Block
+from xdsl.ir import Attribute, Region, SSAValue, Block
 from xdsl.dialects.builtin import IntegerType, i1, IntegerAttr, FunctionType
 from xdsl.parser import ArrayAttr
 
@@ -47,9 +47,12 @@ from dialects.comb import *
 from analysis.pattern_dag_span import (
     OperationSpan,
     OperationSpanCtx,
+    SpanLcaIndex,
+    SpanValueKind,
     compute_usage_graph,
 )
 from encoder import EncodingContext, OperationContext
+from lowering.pdli_merge import pattern_count
 from utils import UnsupportedPatternFeature
 
 import math
@@ -81,7 +84,7 @@ class FsmContext:
         return self.block_to_state[block]
 
 
-@dataclass
+@dataclass(eq=False, slots=True)
 class DagBufferNode:
     """
     Represents a node of the DAG buffer, storing an operation.
@@ -97,13 +100,16 @@ class DagBufferNode:
     - store_operands_at: maps to which DagBufferNode the defining operation of
                          operands of the currently stored operation will be
                          stored.
+    - operand_positions: when offsets are accumulated by the gatherer, maps operands
+                         of the stored operation to a register containing the offset
+                         in the stream between the root and the operand definition.
+
+    Nodes are compared and hashed by identity.
     """
 
     data: SSAValue
     store_operands_at: dict[int, "DagBufferNode"] = field(default_factory=dict)
-
-    def __hash__(self):
-        return hash(str(self))
+    operand_positions: dict[int, SSAValue] = field(default_factory=dict)
 
 
 @dataclass
@@ -115,12 +121,24 @@ class DagBufferCtx:
     nodes: list[DagBufferNode] = field(default_factory=list)
     span_to_dag: dict[OperationSpan, DagBufferNode] = field(default_factory=dict)
 
+    """
+    Width of accumulated operand positions, if the gatherer accumulates them.
+    """
+    position_width: int | None = None
+
+    def fsm_inputs(self) -> list[SSAValue]:
+        """Values of the DAG buffer to provide to the pattern FSM, in order."""
+        inputs = [node.data for node in self.nodes]
+        for node in self.nodes:
+            inputs += list(node.operand_positions.values())
+        return inputs
+
 
 PathToOperationSpan = list[OperandSpan]
 
 
 def _paths_to_common_ancestor(
-    lhs: OperationSpan, rhs: OperationSpan, root: OperationSpan
+    lhs: OperationSpan, rhs: OperationSpan, lca_index: SpanLcaIndex
 ) -> Tuple[PathToOperationSpan, PathToOperationSpan]:
     """
     Compute the sequence of operand spans to go through to reach each operand starting
@@ -128,53 +146,17 @@ def _paths_to_common_ancestor(
     operand span of the list is the operand to unstack next, in order. Once the list is
     empty, the current operation span should be respectively lhs and rhs.
     """
+    common_ancestor = lca_index.lowest_common_ancestor(lhs, rhs)
 
-    @dataclass
-    class FoundBoth:
-        left: PathToOperationSpan
-        right: PathToOperationSpan
-
-    @dataclass
-    class FoundLeft:
-        path: PathToOperationSpan
-
-    @dataclass
-    class FoundRight:
-        path: PathToOperationSpan
-
-    @dataclass
-    class FoundNothing:
-        pass
-
-    def compute_path(
-        current: OperationSpan,
-    ) -> Union[FoundBoth, FoundLeft, FoundRight, FoundNothing]:
-        left: FoundLeft | None = FoundLeft([]) if lhs == current else None
-        right: FoundRight | None = FoundRight([]) if rhs == current else None
-        for operand in current.operands.values():
-            if left and right:
-                break
-            res = compute_path(operand.defining_op)
-            if isinstance(res, FoundBoth):
-                return res
-            if isinstance(res, FoundLeft):
-                res.path.append(operand)
-                left = res
-            if isinstance(res, FoundRight):
-                res.path.append(operand)
-                right = res
-        if left and right:
-            return FoundBoth(left.path, right.path)
-        if left:
-            return left
-        if right:
-            return right
-        return FoundNothing()
-
-    root_res = compute_path(root)
-    # The root element is a common ancestor of lhs and rhs.
-    assert isinstance(root_res, FoundBoth)
-    return root_res.left, root_res.right
+    def path_from(span: OperationSpan) -> PathToOperationSpan:
+        path: PathToOperationSpan = []
+        while span != common_ancestor:
+            assert span.parent
+            path.append(span.parent)
+            span = span.parent.operand_of
+        return path
+
+    return path_from(lhs), path_from(rhs)
 
 
 def _sum_path(
@@ -187,14 +169,16 @@ def _sum_path(
 ) -> SSAValue:
     """
     Compute the offset in the operation stream between the beginning
-    and the end of the provided path. `max_path_len` specifies the
+    and the end of the provided path. As operands are located `offset + 1`
+    operations after their user, this is the sum of the operand offsets along
+    the path plus its length. `max_path_len` specifies the
     maximum length of paths against which this sum will be compared,
     and is used to determine the type of the result value.
     All operations in the path must be ready to use. This can be easily
     checked by verifying the last operation is ready.
     """
     assert len(path) <= max_path_len
-    overflow_margin = math.ceil(math.log2(max_path_len))
+    overflow_margin = math.ceil(math.log2(max_path_len + 1))
     result_bitwidth = overflow_margin + enc_ctx.operand_offset_width
     if len(path) == 0:
         zero = HwConstant.from_attr(IntegerAttr.from_int_and_width(0, result_bitwidth))
@@ -225,46 +209,150 @@ def _sum_path(
             block.add_op(concat)
             adjusted_offset = concat.output
         to_sum.append(adjusted_offset)
+    edge_count = HwConstant.from_attr(
+        IntegerAttr.from_int_and_width(len(path), result_bitwidth)
+    )
+    block.add_op(edge_count)
+    to_sum.append(edge_count.output)
     summed = CombAdd.from_values(to_sum)
     block.add_op(summed)
     return summed.result
 
 
+def _find_operand_defined_by(
+    defining_op: OperationSpan, user: OperationSpan, dag_span_ctx: OperationSpanCtx
+) -> OperandSpan | None:
+    operand = defining_op.parent
+    if operand and dag_span_ctx.get_lca_index().is_ancestor_of(
+        user, operand.operand_of
+    ):
+        return operand
+    return None
+
+
+def _find_user_of_result(
+    result: ResultSpan, user: OperationSpan, dag_span_ctx: OperationSpanCtx
+) -> OperationSpan | None:
+    operand = _find_operand_defined_by(result.result_of, user, dag_span_ctx)
+    return operand.operand_of if operand else None
+
+
+def _equality_blocker(
+    value: OperandSpan | ResultSpan, dag_span_ctx: OperationSpanCtx
+) -> OperationSpan:
+    """
+    Returns the operation span whose DAG buffer node must be found for the
+    position of the value in the stream to be known.
+    """
+    if isinstance(value, OperandSpan):
+        return value.operand_of
+    return (
+        _find_user_of_result(value, dag_span_ctx.root, dag_span_ctx)
+        or value.result_of
+    )
+
+
+def _position_operand(
+    value: OperandSpan | ResultSpan, dag_span_ctx: OperationSpanCtx
+) -> OperandSpan | None:
+    """
+    Returns the operand whose accumulated position is the position of the value,
+    or None if the value is a result of the root.
+    """
+    if isinstance(value, OperandSpan):
+        return value
+    return _find_operand_defined_by(value.result_of, dag_span_ctx.root, dag_span_ctx)
+
+
+def _equality_paths(
+    lhs: OperandSpan | ResultSpan,
+    rhs: OperandSpan | ResultSpan,
+    dag_span_ctx: OperationSpanCtx,
+) -> Tuple[PathToOperationSpan, PathToOperationSpan]:
+    """
+    Computes the operand offsets to sum to get the position of each value
+    relative to their last common ancestor.
+    """
+    lhs_path, rhs_path = _paths_to_common_ancestor(
+        lhs.operand_of if isinstance(lhs, OperandSpan) else lhs.result_of,
+        rhs.operand_of if isinstance(rhs, OperandSpan) else rhs.result_of,
+        dag_span_ctx.get_lca_index(),
+    )
+    # Operand values are further offset from their user.
+    if isinstance(lhs, OperandSpan):
+        lhs_path = lhs_path + [lhs]
+    if isinstance(rhs, OperandSpan):
+        rhs_path = rhs_path + [rhs]
+    return lhs_path, rhs_path
+
+
+def _accumulated_position(
+    block: Block,
+    value: OperandSpan | ResultSpan,
+    dag_span_ctx: OperationSpanCtx,
+    dag_buffer_ctx: DagBufferCtx,
+    fsm_value_of: dict[SSAValue, SSAValue],
+) -> SSAValue:
+    """
+    Fetches the offset in the stream between the root and the definition of a
+    value, as accumulated by the gatherer in the DAG buffer.
+    """
+    assert dag_buffer_ctx.position_width
+    operand = _position_operand(value, dag_span_ctx)
+    if not operand:
+        # Only the root has no user, it is located at the origin.
+        assert not isinstance(value, OperandSpan)
+        assert value.result_of == dag_span_ctx.root
+        zero = HwConstant.from_attr(
+            IntegerAttr.from_int_and_width(0, dag_buffer_ctx.position_width)
+        )
+        block.add_op(zero)
+        return zero.output
+    dag_buffer_node = dag_buffer_ctx.span_to_dag[operand.operand_of]
+    return fsm_value_of[dag_buffer_node.operand_positions[operand.operand_index]]
+
+
 def _are_equal_values(
     fsm_ctx: FsmContext,
     dest: Block,
+    lhs: OperandSpan | ResultSpan,
     lhs_blocker: OperationSpan,
-    lhs_defining_op: OperationSpan,
+    rhs: OperandSpan | ResultSpan,
     rhs_blocker: OperationSpan,
-    rhs_defining_op: OperationSpan,
     dag_span_ctx: OperationSpanCtx,
     dag_buffer_ctx: DagBufferCtx,
     dag_buffer_node_access: dict[DagBufferNode, SSAValue],
+    fsm_value_of: dict[SSAValue, SSAValue],
     enc_ctx: EncodingContext,
 ) -> FsmTransition:
     block = Block()
-    lhs_path, rhs_path = _paths_to_common_ancestor(
-        lhs_defining_op,
-        rhs_defining_op,
-        dag_span_ctx.root,
-    )
-    max_path_len = max(len(lhs_path), len(rhs_path))
-    lhs_sum = _sum_path(
-        block,
-        lhs_path,
-        max_path_len,
-        dag_buffer_ctx,
-        dag_buffer_node_access,
-        enc_ctx,
-    )
-    rhs_sum = _sum_path(
-        block,
-        lhs_path,
-        max_path_len,
-        dag_buffer_ctx,
-        dag_buffer_node_access,
-        enc_ctx,
-    )
+    if dag_buffer_ctx.position_width:
+        # Positions were accumulated while gathering, a single comparison is enough.
+        lhs_sum = _accumulated_position(
+            block, lhs, dag_span_ctx, dag_buffer_ctx, fsm_value_of
+        )
+        rhs_sum = _accumulated_position(
+            block, rhs, dag_span_ctx, dag_buffer_ctx, fsm_value_of
+        )
+    else:
+        lhs_path, rhs_path = _equality_paths(lhs, rhs, dag_span_ctx)
+        max_path_len = max(len(lhs_path), len(rhs_path))
+        lhs_sum = _sum_path(
+            block,
+            lhs_path,
+            max_path_len,
+            dag_buffer_ctx,
+            dag_buffer_node_access,
+            enc_ctx,
+        )
+        rhs_sum = _sum_path(
+            block,
+            rhs_path,
+            max_path_len,
+            dag_buffer_ctx,
+            dag_buffer_node_access,
+            enc_ctx,
+        )
     cmp_sum = CombICmp.from_values(lhs_sum, rhs_sum, ICmpPredicate.EQ)
     block.add_op(cmp_sum)
     lhs_found = HwSumIs.from_variant(
@@ -290,33 +378,468 @@ def _are_equal_values(
     )
 
 
-def _find_user_of_result(
-    result: ResultSpan, user: OperationSpan
-) -> OperationSpan | None:
-    for operand in user.operands.values():
-        if operand.defining_op == result.result_of:
-            return user
-        res = _find_user_of_result(result, operand.defining_op)
-        if res:
-            return res
+def _compared_values(
+    are_equal: PdlInterpAreEqual, dag_span_ctx: OperationSpanCtx
+) -> Tuple[OperandSpan | ResultSpan, OperandSpan | ResultSpan] | None:
+    """
+    Returns the spans of the values compared by an are_equal operation, if both
+    are operation values.
+    """
+
+    def value_span(value: SSAValue) -> OperandSpan | ResultSpan | None:
+        return dag_span_ctx.operand_of(value) or dag_span_ctx.result_of(value)
+
+    lhs = value_span(are_equal.lhs)
+    rhs = value_span(are_equal.rhs)
+    if lhs and rhs:
+        return lhs, rhs
     return None
 
 
+def _type_range_is(
+    guard_block: Block,
+    op: SSAValue,
+    kind: SpanValueKind,
+    types: list[Attribute],
+    true: SSAValue,
+) -> SSAValue | None:
+    """
+    Checks, in `guard_block`, that the operand or result types of the operation
+    `op` are exactly `types`. Returns None if no operation can have them.
+    """
+    checks: list[SSAValue] = []
+    if kind == SpanValueKind.OPERAND_TYPE_RANGE:
+        max_operand_amount = cast(HwOperation, op.typ).max_operand_amount.value.data
+        if len(types) > max_operand_amount:
+            return None
+        is_amount = HwOpOperandAmountIs.from_operand(op, len(types))
+        guard_block.add_op(is_amount)
+        checks.append(is_amount.output)
+        for index, typ in enumerate(types):
+            is_type = HwOpOperandTypeIs.from_operand(op, index, typ)
+            guard_block.add_op(is_type)
+            checks.append(is_type.output)
+    else:
+        # Operations have at most one result.
+        if len(types) > 1:
+            return None
+        if len(types) == 0:
+            has_result = HwOpHasResult.from_operand(op)
+            guard_block.add_op(has_result)
+            has_no_result = CombXor.from_values([has_result.output, true])
+            guard_block.add_op(has_no_result)
+            checks.append(has_no_result.result)
+        else:
+            is_type = HwOpResultTypeIs.from_operand(op, types[0])
+            guard_block.add_op(is_type)
+            checks.append(is_type.output)
+    if len(checks) == 1:
+        return checks[0]
+    all_checks = CombAnd.from_values(checks)
+    guard_block.add_op(all_checks)
+    return all_checks.result
+
+
+def _bound_value_path(
+    value: SSAValue, dag_span_ctx: OperationSpanCtx
+) -> PathToOperationSpan | None:
+    """
+    Computes the operand offsets to sum to get the position of a value bound by a
+    `record_match` relative to the root, or None if the value is not located in
+    the stream.
+    """
+    span_value = dag_span_ctx.lookup(value)
+    if not span_value or not span_value.kind in [
+        SpanValueKind.OPERATION,
+        SpanValueKind.OPERAND,
+        SpanValueKind.RESULT,
+    ]:
+        return None
+    _, path = _paths_to_common_ancestor(
+        dag_span_ctx.root, span_value.operation, dag_span_ctx.get_lca_index()
+    )
+    if span_value.kind == SpanValueKind.OPERAND:
+        path = path + [cast(OperandSpan, span_value.span)]
+    return path
+
+
+def _bound_value_paths(
+    pdli_region: Region, dag_span_ctx: OperationSpanCtx
+) -> list[PathToOperationSpan | None]:
+    paths: list[PathToOperationSpan | None] = []
+    for block in pdli_region.blocks:
+        if isinstance(block.last_op, PdlInterpRecordMatch):
+            paths += [_bound_value_path(x, dag_span_ctx) for x in block.last_op.inputs]
+    return paths
+
+
+def bound_value_count(pdli_region: Region) -> int:
+    """Amount of values bound by the `record_match` binding the most values."""
+    return max(
+        [
+            len(x.last_op.inputs)
+            for x in pdli_region.blocks
+            if isinstance(x.last_op, PdlInterpRecordMatch)
+        ]
+        + [0]
+    )
+
+
+def _max_bound_path_len(pdli_region: Region, dag_span_ctx: OperationSpanCtx) -> int:
+    return max(
+        [len(x) for x in _bound_value_paths(pdli_region, dag_span_ctx) if x] + [0]
+    )
+
+
+def bound_offset_width(
+    pdli_region: Region, dag_span_ctx: OperationSpanCtx, enc_ctx: EncodingContext
+) -> int:
+    """Width of the stream offsets of bound values output by the FSM."""
+    max_path_len = _max_bound_path_len(pdli_region, dag_span_ctx)
+    return enc_ctx.operand_offset_width + math.ceil(math.log2(max_path_len + 1))
+
+
+@dataclass
+class DagBufferLiveness:
+    """
+    Data of the DAG buffer read by the pattern FSM.
+
+    Field:
+    - stored_operands: maps operation spans to the operands whose offset is read
+                       from the operation found in their DAG buffer node.
+    - read_positions: maps operation spans to the operands whose accumulated
+                      position is read, when the gatherer accumulates offsets.
+    """
+
+    stored_operands: dict[OperationSpan, set[int]] = field(default_factory=dict)
+    read_positions: dict[OperationSpan, set[int]] = field(default_factory=dict)
+
+    def stored_operands_of(self, span: OperationSpan) -> list[int]:
+        return sorted(self.stored_operands.get(span, set()))
+
+    def read_positions_of(self, span: OperationSpan) -> list[int]:
+        return sorted(self.read_positions.get(span, set()))
+
+
+def compute_dag_buffer_liveness(
+    pdli_region: Region,
+    dag_span_ctx: OperationSpanCtx,
+    accumulate_offsets: bool,
+    bound_offsets: bool = False,
+) -> DagBufferLiveness:
+    """
+    Computes which parts of the DAG buffer `generate_fsm` reads, so the gatherer
+    does not need to store the rest. Opcodes are always considered read.
+    """
+    liveness = DagBufferLiveness()
+    if bound_offsets:
+        for path in _bound_value_paths(pdli_region, dag_span_ctx):
+            for operand in path or []:
+                liveness.stored_operands.setdefault(operand.operand_of, set()).add(
+                    operand.operand_index
+                )
+    for block in pdli_region.blocks:
+        if not isinstance(block.last_op, PdlInterpAreEqual):
+            continue
+        compared_values = _compared_values(block.last_op, dag_span_ctx)
+        if not compared_values:
+            continue
+        lhs, rhs = compared_values
+        if accumulate_offsets:
+            for value in [lhs, rhs]:
+                operand = _position_operand(value, dag_span_ctx)
+                if operand:
+                    liveness.read_positions.setdefault(operand.operand_of, set()).add(
+                        operand.operand_index
+                    )
+        else:
+            for path in _equality_paths(lhs, rhs, dag_span_ctx):
+                for operand in path:
+                    liveness.stored_operands.setdefault(
+                        operand.operand_of, set()
+                    ).add(operand.operand_index)
+    return liveness
+
+
+@dataclass
+class DagBufferSharing:
+    """
+    Classes of operation spans that hold the same operation whenever the pattern
+    matches, and can thus be stored in a single DAG buffer node.
+
+    Field:
+    - representative_of: maps the spans of shared classes to the span representing
+                         their class, which is the first one in tree order.
+                         Spans missing from it are not shared.
+    """
+
+    representative_of: dict[OperationSpan, OperationSpan] = field(default_factory=dict)
+
+    def representative(self, span: OperationSpan) -> OperationSpan:
+        return self.representative_of.get(span, span)
+
+    def members_of(self, representative: OperationSpan) -> list[OperationSpan]:
+        """Spans of the class of a representative, in tree order."""
+        if not representative in self.representative_of:
+            return [representative]
+        return [x for x, y in self.representative_of.items() if y == representative]
+
+
+def _used_spans(span: OperationSpan) -> list[OperationSpan]:
+    """Operation spans with a DAG buffer node below `span`, in tree order."""
+    spans = [span]
+    for operand in span.operands.values():
+        if operand.defining_op.used:
+            spans += _used_spans(operand.defining_op)
+    return spans
+
+
+@dataclass
+class _PathsToMatch:
+    """
+    What the paths of the matcher leading to a `record_match` go through.
+
+    Field:
+    - equalities: equality checks that hold on every path to the match.
+    - read_spans: operation spans read by an operation on at least one path to the
+                  match, including the `record_match` itself.
+    """
+
+    equalities: set[PdlInterpAreEqual]
+    read_spans: set[OperationSpan]
+
+
+def _read_spans(block: Block, dag_span_ctx: OperationSpanCtx) -> set[OperationSpan]:
+    """Operation spans of the values the operations of a block use."""
+    spans: set[OperationSpan] = set()
+    for op in block.ops:
+        for operand in op.operands:
+            span_value = dag_span_ctx.lookup(operand)
+            if span_value:
+                spans.add(span_value.operation)
+    return spans
+
+
+def _paths_to_matches(
+    pdli_region: Region, dag_span_ctx: OperationSpanCtx
+) -> list[_PathsToMatch]:
+    """Summarizes the paths leading to each `record_match`, in block order."""
+    holding: dict[Block, set[PdlInterpAreEqual] | None] = {
+        x: None for x in pdli_region.blocks
+    }
+    read: dict[Block, set[OperationSpan]] = {x: set() for x in pdli_region.blocks}
+    holding[pdli_region.blocks[0]] = set()
+    changed = True
+    while changed:
+        changed = False
+        for block in pdli_region.blocks:
+            facts = holding[block]
+            if facts is None or not block.last_op:
+                continue
+            read_through = read[block] | _read_spans(block, dag_span_ctx)
+            for successor in block.last_op.successors:
+                successor_facts = set(facts)
+                terminator = block.last_op
+                if (
+                    isinstance(terminator, PdlInterpAreEqual)
+                    and successor == terminator.true_dest
+                    and successor != terminator.false_dest
+                ):
+                    successor_facts.add(terminator)
+                previous = holding[successor]
+                if previous is not None:
+                    successor_facts &= previous
+                if successor_facts != previous:
+                    holding[successor] = successor_facts
+                    changed = True
+                if not read_through <= read[successor]:
+                    read[successor] |= read_through
+                    changed = True
+
+    paths: list[_PathsToMatch] = []
+    for block in pdli_region.blocks:
+        facts = holding[block]
+        if facts is None or not isinstance(block.last_op, PdlInterpRecordMatch):
+            continue
+        paths.append(
+            _PathsToMatch(facts, read[block] | _read_spans(block, dag_span_ctx))
+        )
+    return paths
+
+
+def _quotient_is_acyclic(
+    spans: list[OperationSpan], class_of: dict[OperationSpan, OperationSpan]
+) -> bool:
+    """Checks the DAG buffer nodes of the classes can be filled from the root."""
+    successors: dict[OperationSpan, set[OperationSpan]] = dict()
+    for span in spans:
+        for operand in span.operands.values():
+            if operand.defining_op.used:
+                successors.setdefault(class_of[span], set()).add(
+                    class_of[operand.defining_op]
+                )
+    visiting: set[OperationSpan] = set()
+    visited: set[OperationSpan] = set()
+
+    def visit(representative: OperationSpan) -> bool:
+        if representative in visited:
+            return True
+        if representative in visiting:
+            return False
+        visiting.add(representative)
+        for successor in successors.get(representative, set()):
+            if not visit(successor):
+                return False
+        visiting.remove(representative)
+        visited.add(representative)
+        return True
+
+    return all(visit(class_of[x]) for x in spans)
+
+
+def compute_dag_buffer_sharing(
+    pdli_region: Region, dag_span_ctx: OperationSpanCtx
+) -> DagBufferSharing:
+    """
+    Computes which operation spans can share a DAG buffer node.
+
+    Two values compared by an `are_equal` on every path to a `record_match` are
+    defined by the same operation whenever the pattern matches, and so are, by
+    congruence, the definitions of the operands of that operation. Registers of
+    such spans can be merged: if the equality does not hold, the shared node may
+    contain either operation, but the pattern fails anyway when the equality is
+    checked. With several `record_match`, as in merged matchers, an equality only
+    needs to hold on the paths to the matches that read the merged nodes or a
+    node located from them.
+
+    For this check to stay correct, nodes it reads from, which are the ancestors
+    of the compared values, are never shared.
+    """
+    spans = _used_spans(dag_span_ctx.root)
+    tree_order = {x: i for i, x in enumerate(spans)}
+
+    lca_index = dag_span_ctx.get_lca_index()
+    read_by_equalities: set[OperationSpan] = set()
+    for block in pdli_region.blocks:
+        if not isinstance(block.last_op, PdlInterpAreEqual):
+            continue
+        compared_values = _compared_values(block.last_op, dag_span_ctx)
+        if not compared_values:
+            continue
+        for value in compared_values:
+            blocker = _equality_blocker(value, dag_span_ctx)
+            read_by_equalities.update(
+                x for x in spans if lca_index.is_ancestor_of(x, blocker)
+            )
+
+    def merge(
+        class_of: dict[OperationSpan, OperationSpan],
+        lhs: OperationSpan,
+        rhs: OperationSpan,
+    ) -> dict[OperationSpan, OperationSpan] | None:
+        class_of = dict(class_of)
+        worklist = [(lhs, rhs)]
+        while len(worklist) != 0:
+            lhs, rhs = worklist.pop()
+            if not lhs.used or not rhs.used or class_of[lhs] == class_of[rhs]:
+                continue
+            if lhs in read_by_equalities or rhs in read_by_equalities:
+                return None
+            representative, merged = sorted(
+                [class_of[lhs], class_of[rhs]], key=lambda x: tree_order[x]
+            )
+            for span, span_class in class_of.items():
+                if span_class == merged:
+                    class_of[span] = representative
+            # The operands of a same operation are defined by the same operations.
+            members = [x for x in spans if class_of[x] == representative]
+            defined_by: dict[int, OperationSpan] = dict()
+            for member in members:
+                for index, operand in member.operands.items():
+                    if not operand.defining_op.used:
+                        continue
+                    if index in defined_by:
+                        worklist.append((defined_by[index], operand.defining_op))
+                    else:
+                        defined_by[index] = operand.defining_op
+        if not _quotient_is_acyclic(spans, class_of):
+            return None
+        return class_of
+
+    def defined_span(value: OperandSpan | ResultSpan) -> OperationSpan:
+        if isinstance(value, OperandSpan):
+            return value.defining_op
+        return value.result_of
+
+    paths_to_matches = _paths_to_matches(pdli_region, dag_span_ctx)
+
+    def holds_where_read(
+        are_equal: PdlInterpAreEqual,
+        class_of: dict[OperationSpan, OperationSpan],
+        merged: dict[OperationSpan, OperationSpan],
+    ) -> bool:
+        """Checks the matches not guarded by the equality ignore the merge."""
+        changed = [x for x in spans if merged[x] != class_of[x]]
+        affected = {
+            x for x in spans if any(lca_index.is_ancestor_of(y, x) for y in changed)
+        }
+        return all(
+            are_equal in x.equalities or x.read_spans.isdisjoint(affected)
+            for x in paths_to_matches
+        )
+
+    equalities: dict[PdlInterpAreEqual, None] = dict()
+    for paths in paths_to_matches:
+        equalities.update((x, None) for x in paths.equalities)
+
+    class_of = {x: x for x in spans}
+    for block in pdli_region.blocks:
+        are_equal = block.last_op
+        if not isinstance(are_equal, PdlInterpAreEqual) or not are_equal in equalities:
+            continue
+        compared_values = _compared_values(are_equal, dag_span_ctx)
+        if not compared_values:
+            continue
+        lhs, rhs = compared_values
+        merged = merge(class_of, defined_span(lhs), defined_span(rhs))
+        if merged and holds_where_read(are_equal, class_of, merged):
+            class_of = merged
+
+    class_sizes: dict[OperationSpan, int] = dict()
+    for representative in class_of.values():
+        class_sizes[representative] = class_sizes.get(representative, 0) + 1
+    return DagBufferSharing(
+        {x: y for x, y in class_of.items() if class_sizes[y] > 1}
+    )
+
+
 def generate_fsm(
     pdli_region: Region,
     dag_span_ctx: OperationSpanCtx,
     dag_buffer_ctx: DagBufferCtx,
     enc_ctx: EncodingContext,
     fsm_name: str,
-    node_sum_type: HwSumType,
     status_sum_type: HwSumType,
+    bound_offsets: bool = False,
 ) -> FsmMachine:
+    """
+    Generates the pattern FSM. Its first output is the match status, whose
+    `success` variant carries the index of the matched pattern when the matcher
+    reports several. If `bound_offsets` is set, it then outputs the offset in the
+    stream between the root and each value bound by the recorded match, as the
+    sum of operand offsets equality checks compare. Offsets are only meaningful on
+    success, and are null for values that are not operations or operation values.
+    """
     ctx = FsmContext()
-    fsm_block = Block(arg_types=[node_sum_type] * len(dag_buffer_ctx.nodes))
+    fsm_inputs = dag_buffer_ctx.fsm_inputs()
+    fsm_block = Block(arg_types=[x.typ for x in fsm_inputs])
 
+    fsm_value_of = {
+        input: cast(SSAValue, ssa_val)
+        for input, ssa_val in zip(fsm_inputs, fsm_block.args)
+    }
     dag_buffer_node_access = {
-        node: cast(SSAValue, ssa_val)
-        for node, ssa_val in zip(dag_buffer_ctx.nodes, fsm_block.args)
+        node: fsm_value_of[node.data] for node in dag_buffer_ctx.nodes
     }
 
     # Prepare possible ouputs:
@@ -326,17 +849,50 @@ def generate_fsm(
     fsm_block.add_op(false)
     unknown_status = HwSumCreate.from_data(status_sum_type, "unknown", true.output)
     fsm_block.add_op(unknown_status)
-    success_status = HwSumCreate.from_data(status_sum_type, "success", true.output)
-    fsm_block.add_op(success_status)
+    # With several patterns, success reports which one matched.
+    success_of_pattern: dict[int, SSAValue] = dict()
+    if pattern_count(pdli_region) > 1:
+        pattern_id_type = cast(IntegerType, status_sum_type.cases.data["success"])
+        for index in range(pattern_count(pdli_region)):
+            pattern_id = HwConstant.from_attr(
+                IntegerAttr.from_int_and_width(index, pattern_id_type.width.data)
+            )
+            fsm_block.add_op(pattern_id)
+            success_status = HwSumCreate.from_data(
+                status_sum_type, "success", pattern_id.output
+            )
+            fsm_block.add_op(success_status)
+            success_of_pattern[index] = success_status.output
+    else:
+        success_status = HwSumCreate.from_data(status_sum_type, "success", true.output)
+        fsm_block.add_op(success_status)
+        success_of_pattern[0] = success_status.output
     failure_status = HwSumCreate.from_data(status_sum_type, "failure", true.output)
     fsm_block.add_op(failure_status)
 
+    # Offsets of bound values are null until a match is recorded.
+    output_types: list[Attribute] = [status_sum_type]
+    null_offsets: list[SSAValue] = []
+    max_bound_path_len = 0
+    if bound_offsets:
+        max_bound_path_len = _max_bound_path_len(pdli_region, dag_span_ctx)
+        offset_width = bound_offset_width(pdli_region, dag_span_ctx, enc_ctx)
+        null_offset = HwConstant.from_attr(
+            IntegerAttr.from_int_and_width(0, offset_width)
+        )
+        fsm_block.add_op(null_offset)
+        null_offsets = [null_offset.output] * bound_value_count(pdli_region)
+        output_types += [IntegerType(offset_width)] * len(null_offsets)
+
     # Create a failure ssink state for all conditional failures.
     state_failure_block = Block()
-    status_out = FsmOutput.from_output([failure_status.output])
+    status_out = FsmOutput.from_output([failure_status.output] + null_offsets)
     state_failure_block.add_op(status_out)
     fsm_block.add_op(FsmState.new(STATE_FAILURE_NAME, state_failure_block, Block()))
 
+    # Name the entry block first, as successors are named while visiting blocks.
+    initial_state = ctx.get_state_name_of(pdli_region.blocks[0])
+
     for block in pdli_region.blocks:
         state_output_block = Block()
         transitions_block = Block()
@@ -344,22 +900,17 @@ def generate_fsm(
         match block.last_op:
             case PdlInterpFinalize():
                 # If a finalize is reached before a record match, output failure.
-                status_out = FsmOutput.from_output([failure_status.output])
+                status_out = FsmOutput.from_output([failure_status.output] + null_offsets)
                 state_output_block.add_op(status_out)
                 # No transition after finalize.
             case PdlInterpIsNotNull(
                 value=value, true_dest=true_dest, false_dest=false_dest
             ):
-                status_out = FsmOutput.from_output([unknown_status.output])
+                status_out = FsmOutput.from_output([unknown_status.output] + null_offsets)
                 state_output_block.add_op(status_out)
-                if (
-                    value in dag_span_ctx.value_of_operand
-                    or value in dag_span_ctx.type_of_operand
-                ):
-                    if value in dag_span_ctx.value_of_operand:
-                        operand = dag_span_ctx.value_of_operand[value]
-                    else:
-                        operand = dag_span_ctx.type_of_operand[value]
+                span_value = dag_span_ctx.lookup(value)
+                if span_value and span_value.is_operand():
+                    operand = cast(OperandSpan, span_value.span)
                     operand_dag_node = dag_buffer_node_access[
                         dag_buffer_ctx.span_to_dag[operand.operand_of]
                     ]
@@ -404,14 +955,8 @@ def generate_fsm(
                             Block(),
                         )
                     )
-                elif (
-                    value in dag_span_ctx.value_of_result
-                    or value in dag_span_ctx.type_of_result
-                ):
-                    if value in dag_span_ctx.value_of_result:
-                        result = dag_span_ctx.value_of_result[value]
-                    else:
-                        result = dag_span_ctx.type_of_result[value]
+                elif span_value and span_value.is_result():
+                    result = cast(ResultSpan, span_value.span)
                     result_dag_node = dag_buffer_node_access[
                         dag_buffer_ctx.span_to_dag[result.result_of]
                     ]
@@ -454,26 +999,10 @@ def generate_fsm(
                             Block(),
                         )
                     )
-                elif (
-                    value in dag_span_ctx.operations
-                    or value in dag_span_ctx.operand_range_of
-                    or value in dag_span_ctx.operand_type_range_of
-                    or value in dag_span_ctx.result_range_of
-                    or value in dag_span_ctx.result_type_range_of
-                ):
-                    find_in = next(
-                        x
-                        for x in [
-                            dag_span_ctx.operations,
-                            dag_span_ctx.operand_range_of,
-                            dag_span_ctx.operand_type_range_of,
-                            dag_span_ctx.result_range_of,
-                            dag_span_ctx.result_type_range_of,
-                        ]
-                        if value in x
-                    )
+                elif span_value:
+                    # Operations and ranges are non-null as soon as the operation is found.
                     operation_dag_node = dag_buffer_node_access[
-                        dag_buffer_ctx.span_to_dag[find_in[value]]
+                        dag_buffer_ctx.span_to_dag[span_value.operation]
                     ]
                     # If the operation is found, move to true_dest
                     true_trans_guard_block = Block()
@@ -504,9 +1033,24 @@ def generate_fsm(
                 else:
                     raise UnsupportedPatternFeature(block.last_op)
 
-            case PdlInterpRecordMatch(dest=dest):
+            case PdlInterpRecordMatch(inputs=inputs) as record_match:
                 # If a match is recorded, this means success.
-                status_out = FsmOutput.from_output([success_status.output])
+                offsets = list(null_offsets)
+                for index, value in enumerate(inputs if bound_offsets else []):
+                    path = _bound_value_path(value, dag_span_ctx)
+                    if path is None:
+                        continue
+                    offsets[index] = _sum_path(
+                        state_output_block,
+                        path,
+                        max_bound_path_len,
+                        dag_buffer_ctx,
+                        dag_buffer_node_access,
+                        enc_ctx,
+                    )
+                status_out = FsmOutput.from_output(
+                    [success_of_pattern[record_match.get_pattern_index()]] + offsets
+                )
                 state_output_block.add_op(status_out)
                 # No transition after record match, as the output will not change.
 
@@ -517,12 +1061,13 @@ def generate_fsm(
                 true_dest=true_dest,
                 false_dest=false_dest,
             ):
-                status_out = FsmOutput.from_output([unknown_status.output])
+                status_out = FsmOutput.from_output([unknown_status.output] + null_offsets)
                 state_output_block.add_op(status_out)
-                if not input_op in dag_span_ctx.operations:
+                input_span = dag_span_ctx.operation_of(input_op)
+                if not input_span:
                     raise UnsupportedPatternFeature(block.last_op)
                 operation_dag_node = dag_buffer_node_access[
-                    dag_buffer_ctx.span_to_dag[dag_span_ctx.operations[input_op]]
+                    dag_buffer_ctx.span_to_dag[input_span]
                 ]
                 # If the operation is found and has the amount of operands requested,
                 # then move to true_dest.
@@ -583,12 +1128,13 @@ def generate_fsm(
                 cases=cases,
                 default_dest=default_dest,
             ):
-                status_out = FsmOutput.from_output([unknown_status.output])
+                status_out = FsmOutput.from_output([unknown_status.output] + null_offsets)
                 state_output_block.add_op(status_out)
-                if not input_op in dag_span_ctx.operations:
+                input_span = dag_span_ctx.operation_of(input_op)
+                if not input_span:
                     raise UnsupportedPatternFeature(block.last_op)
                 operation_dag_node = dag_buffer_node_access[
-                    dag_buffer_ctx.span_to_dag[dag_span_ctx.operations[input_op]]
+                    dag_buffer_ctx.span_to_dag[input_span]
                 ]
                 for case, case_dest in zip(case_values.data, cases):
                     # If the operation is found and has the amount of operands requested,
@@ -642,12 +1188,13 @@ def generate_fsm(
                 cases=cases,
                 default_dest=default_dest,
             ):
-                status_out = FsmOutput.from_output([unknown_status.output])
+                status_out = FsmOutput.from_output([unknown_status.output] + null_offsets)
                 state_output_block.add_op(status_out)
-                if not input_op in dag_span_ctx.operations:
+                input_span = dag_span_ctx.operation_of(input_op)
+                if not input_span:
                     raise UnsupportedPatternFeature(block.last_op)
                 operation_dag_node = dag_buffer_node_access[
-                    dag_buffer_ctx.span_to_dag[dag_span_ctx.operations[input_op]]
+                    dag_buffer_ctx.span_to_dag[input_span]
                 ]
                 for case, case_dest in zip(case_values.data, cases):
                     # If the operation is found and is the expected operation,
@@ -700,18 +1247,21 @@ def generate_fsm(
                 true_dest=true_dest,
                 false_dest=false_dest,
             ):
-                status_out = FsmOutput.from_output([unknown_status.output])
+                status_out = FsmOutput.from_output([unknown_status.output] + null_offsets)
                 state_output_block.add_op(status_out)
-                if not input_op in dag_span_ctx.operations:
+                input_span = dag_span_ctx.operation_of(input_op)
+                if not input_span:
                     raise UnsupportedPatternFeature(block.last_op)
                 operation_dag_node = dag_buffer_node_access[
-                    dag_buffer_ctx.span_to_dag[dag_span_ctx.operations[input_op]]
+                    dag_buffer_ctx.span_to_dag[input_span]
                 ]
                 # If the operation is found and has the amount of results requested,
                 # then move to true_dest.
                 true_trans_guard_block = Block()
                 is_found = HwSumIs.from_variant(operation_dag_node, "found")
                 true_trans_guard_block.add_op(is_found)
+                unwrap_op = HwSumGetAs.from_variant(operation_dag_node, "found")
+                true_trans_guard_block.add_op(unwrap_op)
                 is_expected_amount: SSAValue
                 if compare_at_least:
                     if count.value.data <= 0:
@@ -719,12 +1269,12 @@ def generate_fsm(
                     elif count.value.data > 1:
                         is_expected_amount = false.output
                     else:
-                        has_result = HwOpHasResult.from_operand(input_op)
+                        has_result = HwOpHasResult.from_operand(unwrap_op.output)
                         true_trans_guard_block.add_op(has_result)
                         is_expected_amount = has_result.output
                 else:
                     if count.value.data == 0:
-                        has_result = HwOpHasResult.from_operand(input_op)
+                        has_result = HwOpHasResult.from_operand(unwrap_op.output)
                         true_trans_guard_block.add_op(has_result)
                         has_no_result = CombXor.from_values(
                             [has_result.output, true.output]
@@ -732,7 +1282,7 @@ def generate_fsm(
                         true_trans_guard_block.add_op(has_no_result)
                         is_expected_amount = has_no_result.result
                     elif count.value.data == 1:
-                        has_result = HwOpHasResult.from_operand(input_op)
+                        has_result = HwOpHasResult.from_operand(unwrap_op.output)
                         true_trans_guard_block.add_op(has_result)
                         is_expected_amount = has_result.output
                     else:
@@ -773,12 +1323,13 @@ def generate_fsm(
                 cases=cases,
                 default_dest=default_dest,
             ):
-                status_out = FsmOutput.from_output([unknown_status.output])
+                status_out = FsmOutput.from_output([unknown_status.output] + null_offsets)
                 state_output_block.add_op(status_out)
-                if not input_op in dag_span_ctx.operations:
+                input_span = dag_span_ctx.operation_of(input_op)
+                if not input_span:
                     raise UnsupportedPatternFeature(block.last_op)
                 operation_dag_node = dag_buffer_node_access[
-                    dag_buffer_ctx.span_to_dag[dag_span_ctx.operations[input_op]]
+                    dag_buffer_ctx.span_to_dag[input_span]
                 ]
                 target_for_zero = next(
                     (
@@ -869,17 +1420,16 @@ def generate_fsm(
                 cases=cases,
                 default_dest=default_dest,
             ):
-                status_out = FsmOutput.from_output([unknown_status.output])
+                status_out = FsmOutput.from_output([unknown_status.output] + null_offsets)
                 state_output_block.add_op(status_out)
-                op_span: OperationSpan
-                if value in dag_span_ctx.type_of_operand:
-                    op_span = dag_span_ctx.type_of_operand[value].operand_of
-                elif value in dag_span_ctx.type_of_result:
-                    op_span = dag_span_ctx.type_of_result[value].result_of
-                else:
+                span_value = dag_span_ctx.lookup(value)
+                if not span_value or not span_value.kind in [
+                    SpanValueKind.OPERAND_TYPE,
+                    SpanValueKind.RESULT_TYPE,
+                ]:
                     raise UnsupportedPatternFeature(block.last_op)
                 operation_dag_node = dag_buffer_node_access[
-                    dag_buffer_ctx.span_to_dag[op_span]
+                    dag_buffer_ctx.span_to_dag[span_value.operation]
                 ]
                 for case, case_dest in zip(case_values.data, cases):
                     # If the operation is found and the operand or result is of the right type,
@@ -890,10 +1440,10 @@ def generate_fsm(
                     unwrap_op = HwSumGetAs.from_variant(operation_dag_node, "found")
                     true_trans_guard_block.add_op(unwrap_op)
                     is_right_op_value: SSAValue
-                    if value in dag_span_ctx.type_of_operand:
+                    if span_value.kind == SpanValueKind.OPERAND_TYPE:
                         is_right_op = HwOpOperandTypeIs.from_operand(
                             unwrap_op.output,
-                            dag_span_ctx.type_of_operand[value].operand_index,
+                            span_value.index,
                             case,
                         )
                         true_trans_guard_block.add_op(is_right_op)
@@ -936,109 +1486,99 @@ def generate_fsm(
                     )
                 )
 
-            case PdlInterpSwitchTypes():
-                status_out = FsmOutput.from_output([unknown_status.output])
+            case PdlInterpSwitchTypes(
+                value=value,
+                case_values=case_values,
+                cases=cases,
+                default_dest=default_dest,
+            ):
+                status_out = FsmOutput.from_output([unknown_status.output] + null_offsets)
                 state_output_block.add_op(status_out)
-                raise UnsupportedPatternFeature(block.last_op)  # TODO
+                span_value = dag_span_ctx.lookup(value)
+                if not span_value or not span_value.kind in [
+                    SpanValueKind.OPERAND_TYPE_RANGE,
+                    SpanValueKind.RESULT_TYPE_RANGE,
+                ]:
+                    raise UnsupportedPatternFeature(block.last_op)
+                operation_dag_node = dag_buffer_node_access[
+                    dag_buffer_ctx.span_to_dag[span_value.operation]
+                ]
+                for case, case_dest in zip(case_values.data, cases):
+                    # If the operation is found and its operands or results are of the
+                    # right types, then move to case_dest.
+                    true_trans_guard_block = Block()
+                    is_found = HwSumIs.from_variant(operation_dag_node, "found")
+                    true_trans_guard_block.add_op(is_found)
+                    unwrap_op = HwSumGetAs.from_variant(operation_dag_node, "found")
+                    true_trans_guard_block.add_op(unwrap_op)
+                    are_right_types = _type_range_is(
+                        true_trans_guard_block,
+                        unwrap_op.output,
+                        span_value.kind,
+                        list(case.data),
+                        true.output,
+                    )
+                    if not are_right_types:
+                        # No operation has these types, the case is never taken.
+                        continue
+                    is_case_valid = CombAnd.from_values(
+                        [is_found.output, are_right_types]
+                    )
+                    true_trans_guard_block.add_op(is_case_valid)
+                    true_trans_return = FsmReturn.from_value(is_case_valid.result)
+                    true_trans_guard_block.add_op(true_trans_return)
+                    transitions_block.add_op(
+                        FsmTransition.new(
+                            ctx.get_state_name_of(case_dest),
+                            true_trans_guard_block,
+                            Block(),
+                        )
+                    )
+                # If the operation is found or will never come and the previous transitions
+                # were not taken, then move to default_dest.
+                default_trans_guard_block = Block()
+                is_found = HwSumIs.from_variant(operation_dag_node, "found")
+                default_trans_guard_block.add_op(is_found)
+                is_never = HwSumIs.from_variant(operation_dag_node, "never")
+                default_trans_guard_block.add_op(is_never)
+                is_null = CombOr.from_values([is_found.output, is_never.output])
+                default_trans_guard_block.add_op(is_null)
+                default_trans_return = FsmReturn.from_value(is_null.result)
+                default_trans_guard_block.add_op(default_trans_return)
+                transitions_block.add_op(
+                    FsmTransition.new(
+                        ctx.get_state_name_of(default_dest),
+                        default_trans_guard_block,
+                        Block(),
+                    )
+                )
 
             case PdlInterpAreEqual(
                 lhs=lhs, rhs=rhs, true_dest=true_dest, false_dest=false_dest
             ):
-                status_out = FsmOutput.from_output([unknown_status.output])
+                status_out = FsmOutput.from_output([unknown_status.output] + null_offsets)
                 state_output_block.add_op(status_out)
-                if (
-                    lhs in dag_span_ctx.value_of_operand
-                    or lhs in dag_span_ctx.value_of_result
-                ) and (
-                    rhs in dag_span_ctx.value_of_operand
-                    or rhs in dag_span_ctx.value_of_result
-                ):
-                    # If two values need to be compared, compare the offset between
-                    # them and their last common ancestor of the two values.
-                    if lhs in dag_span_ctx.value_of_operand:
-                        lhs_operand = dag_span_ctx.value_of_operand[lhs]
-                        lhs_blocker = lhs_operand.operand_of
-                        if rhs in dag_span_ctx.value_of_operand:
-                            rhs_operand = dag_span_ctx.value_of_operand[rhs]
-                            rhs_blocker = rhs_operand.operand_of
-                            transitions_block.add_op(
-                                _are_equal_values(
-                                    ctx,
-                                    true_dest,
-                                    lhs_operand.operand_of,
-                                    lhs_blocker,
-                                    rhs_operand.operand_of,
-                                    rhs_blocker,
-                                    dag_span_ctx,
-                                    dag_buffer_ctx,
-                                    dag_buffer_node_access,
-                                    enc_ctx,
-                                )
-                            )
-                        else:
-                            rhs_result = dag_span_ctx.value_of_result[rhs]
-                            rhs_blocker = (
-                                _find_user_of_result(rhs_result, dag_span_ctx.root)
-                                or rhs_result.result_of
-                            )
-                            transitions_block.add_op(
-                                _are_equal_values(
-                                    ctx,
-                                    true_dest,
-                                    lhs_operand.operand_of,
-                                    lhs_blocker,
-                                    rhs_result.result_of,
-                                    rhs_blocker,
-                                    dag_span_ctx,
-                                    dag_buffer_ctx,
-                                    dag_buffer_node_access,
-                                    enc_ctx,
-                                )
-                            )
-                    else:
-                        lhs_result = dag_span_ctx.value_of_result[lhs]
-                        lhs_blocker = (
-                            _find_user_of_result(lhs_result, dag_span_ctx.root)
-                            or lhs_result.result_of
+                compared_values = _compared_values(block.last_op, dag_span_ctx)
+                if compared_values:
+                    # If two values need to be compared, compare their position in the stream.
+                    lhs_value, rhs_value = compared_values
+                    lhs_blocker = _equality_blocker(lhs_value, dag_span_ctx)
+                    rhs_blocker = _equality_blocker(rhs_value, dag_span_ctx)
+                    transitions_block.add_op(
+                        _are_equal_values(
+                            ctx,
+                            true_dest,
+                            lhs_value,
+                            lhs_blocker,
+                            rhs_value,
+                            rhs_blocker,
+                            dag_span_ctx,
+                            dag_buffer_ctx,
+                            dag_buffer_node_access,
+                            fsm_value_of,
+                            enc_ctx,
                         )
-                        if rhs in dag_span_ctx.value_of_operand:
-                            rhs_operand = dag_span_ctx.value_of_operand[rhs]
-                            rhs_blocker = rhs_operand.defining_op
-                            transitions_block.add_op(
-                                _are_equal_values(
-                                    ctx,
-                                    true_dest,
-                                    lhs_result.result_of,
-                                    lhs_blocker,
-                                    rhs_operand.operand_of,
-                                    rhs_blocker,
-                                    dag_span_ctx,
-                                    dag_buffer_ctx,
-                                    dag_buffer_node_access,
-                                    enc_ctx,
-                                )
-                            )
-                        else:
-                            rhs_result = dag_span_ctx.value_of_result[rhs]
-                            rhs_blocker = (
-                                _find_user_of_result(rhs_result, dag_span_ctx.root)
-                                or rhs_result.result_of
-                            )
-                            transitions_block.add_op(
-                                _are_equal_values(
-                                    ctx,
-                                    true_dest,
-                                    lhs_result.result_of,
-                                    lhs_blocker,
-                                    rhs_result.result_of,
-                                    rhs_blocker,
-                                    dag_span_ctx,
-                                    dag_buffer_ctx,
-                                    dag_buffer_node_access,
-                                    enc_ctx,
-                                )
-                            )
-                    print(block.last_op)
+                    )
                     lhs_blocker_dag_node = dag_buffer_node_access[
                         dag_buffer_ctx.span_to_dag[lhs_blocker]
                     ]
@@ -1101,9 +1641,9 @@ def generate_fsm(
     # Finally, build the FSM machine operation
     return FsmMachine.new(
         fsm_name,
-        "STATE0",
+        initial_state,
         FunctionType.from_attrs(
-            ArrayAttr([x.typ for x in fsm_block.args]), ArrayAttr([status_sum_type])
+            ArrayAttr([x.typ for x in fsm_block.args]), ArrayAttr(output_types)
         ),
         fsm_block,
     )
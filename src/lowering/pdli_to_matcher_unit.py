@@ -1,9 +1,15 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from typing import Tuple
 from attr import has
 
-from xdsl.ir import Region, SSAValue, Block
-from xdsl.dialects.builtin import IntegerType, i1, IntegerAttr, FunctionType
+from xdsl.ir import Attribute, Operation, Region, SSAValue, Block
+from xdsl.dialects.builtin import (
+    IntegerType,
+    i1,
+    IntegerAttr,
+    FunctionType,
+    StringAttr,
+)
 from xdsl.parser import ArrayAttr
 
 from dialects.fsm import (
@@ -15,15 +21,38 @@ from dialects.fsm import (
     FsmTransition,
     FsmVariable,
 )
-from dialects.hw import HwConstant, HwModule, HwOutput
-from dialects.hw_op import HwOp, HwOperation, HwOpGetOperandOffset, HwOpHasOperand
+from dialects.hw import HwConstant, HwInstance, HwModule, HwOutput
+from dialects.hw_op import (
+    HwOp,
+    HwOperation,
+    HwOpGetOperandOffset,
+    HwOpHasOperand,
+    HwOpHasResult,
+    HwOpIsOperation,
+    HwOpOperandAmountIs,
+    HwOpPrune,
+)
 from dialects.hw_sum import HwSumType, HwSumCreate, HwSumIs, HwSumGetAs
 from dialects.pdl_interp import PdlInterpFinalize, PdlInterpIsNotNull
 from dialects.seq import SeqCompregCe
 from dialects.comb import *
 
 from lowering.pdli_to_fsm import *
+from lowering.pdli_merge import pattern_count
 
+from analysis.root_checks import (
+    MayMatch,
+    NeverMatches,
+    RootCheck,
+    RootCondition,
+    RootDecision,
+    RootEither,
+    RootHasOperand,
+    RootHasResult,
+    RootIsOperation,
+    RootOperandAmountIs,
+    compute_root_decision,
+)
 from analysis.pattern_dag_span import (
     OperationSpan,
     OperationSpanCtx,
@@ -31,23 +60,111 @@ from analysis.pattern_dag_span import (
 )
 from encoder import EncodingContext, OperationContext
 
+import math
+
 # TODO: Fix HwSum lowering to remove dummy i1s
 
 
+@dataclass(frozen=True)
+class MatcherUnitOptions:
+    """
+    Options for the generation of a matcher unit.
+
+    Field:
+    - accumulate_offsets: make the gatherer store, for each DAG buffer node, the
+                          offset between the root and the definition of its operands.
+                          Equality checks then compare two registers instead of summing
+                          operand offsets along paths of the DAG.
+    - early_failure: report a failure as soon as the checks on the root alone show
+                     the pattern cannot match, without waiting for the FSM.
+    - share_equal_nodes: store operations that `are_equal` checks prove to be the
+                         same whenever the pattern matches in a single DAG buffer
+                         node, instead of one node per occurrence in the span tree.
+    - report_bound_offsets: output the offset in the stream between the root and
+                            each value bound by the matched pattern, so rewrites
+                            can be applied without matching again in software.
+    - filler_modules: emit the filler logic of each distinct shape of DAG buffer
+                      node as its own module, instantiated once per node, instead
+                      of inlining it in the matcher unit.
+    - absolute_positions: count the position of the stream relative to the root
+                          once for the unit, and make DAG buffer nodes wait for the
+                          absolute position of their operation instead of
+                          decrementing their own distance to it.
+    - double_buffered: duplicate the DAG buffer, so the gatherer fills one bank
+                       with a new attempt while the FSM still decides on the
+                       attempt stored in the other one.
+    - stream_width: amount of operations the unit receives per cycle, a power of
+                    two. Nodes then resolve in the cycle their operation arrives.
+    """
+
+    accumulate_offsets: bool = False
+    early_failure: bool = False
+    share_equal_nodes: bool = False
+    report_bound_offsets: bool = False
+    filler_modules: bool = False
+    absolute_positions: bool = False
+    double_buffered: bool = False
+    stream_width: int = 1
+
+
+@dataclass
+class MatcherUnit:
+    """
+    Modules generated for a matcher unit.
+
+    Field:
+    - filler_modules: modules of DAG buffer nodes created for this unit, if filler
+                      logic is emitted as modules. Modules already created for
+                      another unit sharing the same templates are not repeated.
+    - pattern_count: amount of patterns the unit reports, see `match_status_sum_type`.
+    - double_buffered: the unit has a `reset` input and a `ready` output, see
+                       `generate_matcher_unit`.
+    - stream_width: amount of operations the unit receives per cycle.
+    """
+
+    hw_module: HwModule
+    fsm: FsmMachine
+    filler_modules: list[HwModule] = field(default_factory=list)
+    pattern_count: int = 1
+    double_buffered: bool = False
+    stream_width: int = 1
+
+    def modules(self) -> list[Operation]:
+        """Operations to place in the top-level module, definitions first."""
+        return [self.fsm, *self.filler_modules, self.hw_module]
+
+
 @dataclass
 class FillerNodeOutput:
     output: SSAValue
     write_to_out: SSAValue  # all operands share the same write_to
     write_val_out: dict[int, SSAValue]
+    operand_positions: dict[int, SSAValue] = field(default_factory=dict)
 
 
 @dataclass
 class MatcherUnitInputs:
+    """
+    Field:
+    - stream_position: with absolute positions, position of input_op in the
+                       stream relative to the root of the current attempt.
+    - next_stream_position: with absolute positions, position of the next
+                            operation of the stream.
+    - extra_input_ops: when several operations arrive per cycle, the operations
+                       following input_op in the stream, in order.
+    - root_slot: when several operations arrive per cycle, index of the root
+                 among them on a new sequence, input_op being the first one.
+    """
+
     clock: SSAValue
     input_op: SSAValue
     is_stream_paused: SSAValue
     new_sequence: SSAValue
     stream_completed: SSAValue
+    stream_position: SSAValue | None = None
+    next_stream_position: SSAValue | None = None
+    extra_input_ops: list[SSAValue] = field(default_factory=list)
+    root_slot: SSAValue | None = None
 
 
 def build_filler_node(
@@ -56,10 +173,38 @@ def build_filler_node(
     write_to: SSAValue,
     write_val: SSAValue,
     block: Block,
-    operands: list[int],
+    operand_sum_types: dict[int, HwSumType],
     enc_ctx: EncodingContext,
     node_name: str,
+    position: SSAValue | None = None,
+    position_operands: list[int] | None = None,
 ) -> FillerNodeOutput:
+    """
+    Builds the register of a DAG buffer node and its update logic.
+    `operand_sum_types` maps the operands to follow to the type of the DAG buffer
+    node that stores their definition.
+    If `position` is provided, it must be the offset between the root and the
+    operation stored in this node, and the offset between the root and the
+    definition of each operand in `position_operands` is stored in a register.
+    If the matcher unit inputs provide a stream position, `located_at` holds
+    the absolute position in the stream of the expected operation instead of
+    the amount of operations left before it.
+    """
+    if position_operands is None:
+        position_operands = []
+    if matcher_unit_inputs.extra_input_ops:
+        return _build_wide_filler_node(
+            matcher_unit_inputs,
+            default_value,
+            write_to,
+            write_val,
+            block,
+            operand_sum_types,
+            enc_ctx,
+            node_name,
+            position,
+            position_operands,
+        )
     sum_type = cast(HwSumType, default_value.typ)
 
     # Register declaration
@@ -88,51 +233,72 @@ def build_filler_node(
     is_found = HwSumIs.from_variant(register.data, "found")
     block.add_op(is_found)
 
-    # Constants
-    offset_zero = HwConstant.from_attr(
-        IntegerAttr.from_int_and_width(0, enc_ctx.operand_offset_width)
-    )
-    block.add_op(offset_zero)
-    offset_one = HwConstant.from_attr(
-        IntegerAttr.from_int_and_width(1, enc_ctx.operand_offset_width)
-    )
-    block.add_op(offset_one)
+    stream_position = matcher_unit_inputs.stream_position
+    next_stream_position = matcher_unit_inputs.next_stream_position
+    if stream_position:
+        # The expected operation arrives when the stream reaches its position.
+        get_located_at = HwSumGetAs.from_variant(register.data, "located_at")
+        block.add_op(get_located_at)
+        located_at_content_is_here = CombICmp.from_values(
+            get_located_at.output, stream_position, ICmpPredicate.EQ
+        )
+        block.add_op(located_at_content_is_here)
+        is_located_at_zero = CombAnd.from_values(
+            [is_located_at.output, located_at_content_is_here.output]
+        )
+        block.add_op(is_located_at_zero)
+    else:
+        # Constants
+        offset_zero = HwConstant.from_attr(
+            IntegerAttr.from_int_and_width(0, enc_ctx.operand_offset_width)
+        )
+        block.add_op(offset_zero)
+        offset_one = HwConstant.from_attr(
+            IntegerAttr.from_int_and_width(1, enc_ctx.operand_offset_width)
+        )
+        block.add_op(offset_one)
 
-    # Located at content and derivatives
-    get_located_at = HwSumGetAs.from_variant(register.data, "located_at")
-    block.add_op(get_located_at)
-    located_at_content_is_zero = CombICmp.from_values(
-        get_located_at.output, offset_zero.output, ICmpPredicate.EQ
-    )
-    block.add_op(located_at_content_is_zero)
-    located_at_content_decr = CombSub.from_values(
-        get_located_at.output, offset_one.output
-    )
-    block.add_op(located_at_content_decr)
-    is_located_at_zero = CombAnd.from_values(
-        [is_located_at.output, located_at_content_is_zero.output]
-    )
-    block.add_op(is_located_at_zero)
+        # Located at content and derivatives
+        get_located_at = HwSumGetAs.from_variant(register.data, "located_at")
+        block.add_op(get_located_at)
+        located_at_content_is_zero = CombICmp.from_values(
+            get_located_at.output, offset_zero.output, ICmpPredicate.EQ
+        )
+        block.add_op(located_at_content_is_zero)
+        located_at_content_decr = CombSub.from_values(
+            get_located_at.output, offset_one.output
+        )
+        block.add_op(located_at_content_decr)
+        is_located_at_zero = CombAnd.from_values(
+            [is_located_at.output, located_at_content_is_zero.output]
+        )
+        block.add_op(is_located_at_zero)
 
     # Inputs for muxers
     found_input_op = HwSumCreate.from_data(
-        sum_type, "found", matcher_unit_inputs.input_op
+        sum_type,
+        "found",
+        stored_input_op(block, matcher_unit_inputs.input_op, sum_type),
     )
     block.add_op(found_input_op)
-    located_at_decr = HwSumCreate.from_data(
-        sum_type, "located_at", located_at_content_decr.result
-    )
-    block.add_op(located_at_decr)
+    waiting_value: SSAValue = register.data
+    if not stream_position:
+        located_at_decr = HwSumCreate.from_data(
+            sum_type, "located_at", located_at_content_decr.result
+        )
+        block.add_op(located_at_decr)
     constant_never = HwSumCreate.from_data(sum_type, "never", true.output)
     block.add_op(constant_never)
 
     # Muxers
-    decr_muxer = CombMux.from_values(
-        is_located_at.output, located_at_decr.output, register.data
-    )
-    block.add_op(decr_muxer)
+    if not stream_position:
+        decr_muxer = CombMux.from_values(
+            is_located_at.output, located_at_decr.output, register.data
+        )
+        block.add_op(decr_muxer)
+        waiting_value = decr_muxer.result
     stream_end_muxer = CombMux.from_values(
-        matcher_unit_inputs.stream_completed, constant_never.output, decr_muxer.result
+        matcher_unit_inputs.stream_completed, constant_never.output, waiting_value
     )
     block.add_op(stream_end_muxer)
     found_muxer = CombMux.from_values(
@@ -152,33 +318,700 @@ def build_filler_node(
     register.replace_operand(0, write_to_muxer.result)
 
     # Finally, schedule updates for operands when an op is received or when the current op is never.
+    # An op received when the stream completes is the last of the window, its
+    # operands are past the end of the window.
     should_write_to = CombOr.from_values([is_never.output, is_located_at_zero.result])
     block.add_op(should_write_to)
+    is_in_window = CombXor.from_values(
+        [matcher_unit_inputs.stream_completed, true.output]
+    )
+    block.add_op(is_in_window)
     write_val_operands: dict[int, SSAValue] = dict()
-    for operand in operands:
+    for operand, operand_sum_type in operand_sum_types.items():
         has_operand = HwOpHasOperand.from_operand(matcher_unit_inputs.input_op, operand)
         block.add_op(has_operand)
         operand_offset = HwOpGetOperandOffset.from_operand(
             matcher_unit_inputs.input_op, operand
         )
         block.add_op(operand_offset)
+        location: SSAValue = operand_offset.output
+        if next_stream_position:
+            location = _operand_stream_position(
+                block, operand_offset.output, next_stream_position
+            )
         wrapped_operand_offset = HwSumCreate.from_data(
-            sum_type, "located_at", operand_offset.output
+            operand_sum_type, "located_at", location
         )
         block.add_op(wrapped_operand_offset)
         should_write_offset = CombAnd.from_values(
-            [has_operand.output, is_located_at_zero.result]
+            [has_operand.output, is_located_at_zero.result, is_in_window.result]
         )
         block.add_op(should_write_offset)
+        operand_never = HwSumCreate.from_data(operand_sum_type, "never", true.output)
+        block.add_op(operand_never)
         write_val_muxer = CombMux.from_values(
             should_write_offset.result,
             wrapped_operand_offset.output,
-            constant_never.output,
+            operand_never.output,
         )
         block.add_op(write_val_muxer)
         write_val_operands[operand] = write_val_muxer.result
 
-    return FillerNodeOutput(register.data, should_write_to.result, write_val_operands)
+    operand_positions: dict[int, SSAValue] = dict()
+    if position:
+        operand_positions = _accumulate_operand_positions(
+            matcher_unit_inputs,
+            matcher_unit_inputs.input_op,
+            is_located_at_zero.result,
+            is_stream_running.result,
+            block,
+            enc_ctx,
+            node_name,
+            position,
+            position_operands,
+        )
+
+    return FillerNodeOutput(
+        register.data, should_write_to.result, write_val_operands, operand_positions
+    )
+
+
+def _select_slot(block: Block, slot: SSAValue, values: list[SSAValue]) -> SSAValue:
+    """Selects one of a power of two amount of values with a tree of muxers."""
+    slot_width = cast(IntegerType, slot.typ).width.data
+    for bit in range(slot_width):
+        is_bit_set = CombExtract.from_values(slot, 1, bit)
+        block.add_op(is_bit_set)
+        selected: list[SSAValue] = []
+        for pair in range(0, len(values), 2):
+            muxer = CombMux.from_values(
+                is_bit_set.output, values[pair + 1], values[pair]
+            )
+            block.add_op(muxer)
+            selected.append(muxer.result)
+        values = selected
+    return values[0]
+
+
+def _build_wide_filler_node(
+    matcher_unit_inputs: MatcherUnitInputs,
+    default_value: SSAValue,
+    write_to: SSAValue,
+    write_val: SSAValue,
+    block: Block,
+    operand_sum_types: dict[int, HwSumType],
+    enc_ctx: EncodingContext,
+    node_name: str,
+    position: SSAValue | None = None,
+    position_operands: list[int] | None = None,
+) -> FillerNodeOutput:
+    """
+    Same as `build_filler_node`, for a unit receiving several operations per
+    cycle. `located_at` holds the distance between the first operation of the
+    current cycle and the expected one, which is found if it arrives in one of
+    the slots of the cycle. The writes of users and `default_value` on a new
+    sequence apply to the current cycle, so nodes whose operand arrives in the
+    same cycle resolve it as well.
+    """
+    if position_operands is None:
+        position_operands = []
+    sum_type = cast(HwSumType, default_value.typ)
+    input_ops = [matcher_unit_inputs.input_op] + matcher_unit_inputs.extra_input_ops
+    stream_width = len(input_ops)
+    slot_width = int(math.log2(stream_width))
+
+    # Register declaration
+    true = HwConstant.from_attr(IntegerAttr.from_int_and_width(1, 1))
+    block.add_op(true)
+    false = HwConstant.from_attr(IntegerAttr.from_int_and_width(0, 1))
+    block.add_op(false)
+    is_stream_running = CombXor.from_values(
+        [matcher_unit_inputs.is_stream_paused, true.output]
+    )
+    block.add_op(is_stream_running)
+    register = SeqCompregCe.new(
+        "register_" + node_name,
+        sum_type,
+        default_value,  # input is defined later, use default_value as dummy
+        matcher_unit_inputs.clock,
+        is_stream_running.result,
+        false.output,
+        default_value,
+    )
+    block.add_op(register)
+
+    # Content of the node during the current cycle
+    sequence_muxer = CombMux.from_values(
+        matcher_unit_inputs.new_sequence, default_value, register.data
+    )
+    block.add_op(sequence_muxer)
+    write_to_muxer = CombMux.from_values(write_to, write_val, sequence_muxer.result)
+    block.add_op(write_to_muxer)
+    current = write_to_muxer.result
+
+    # Sum type variant checks
+    is_never = HwSumIs.from_variant(current, "never")
+    block.add_op(is_never)
+    is_located_at = HwSumIs.from_variant(current, "located_at")
+    block.add_op(is_located_at)
+    is_found = HwSumIs.from_variant(current, "found")
+    block.add_op(is_found)
+
+    # Located at content and derivatives
+    get_located_at = HwSumGetAs.from_variant(current, "located_at")
+    block.add_op(get_located_at)
+    location_width = cast(IntegerType, get_located_at.output.typ).width.data
+    location_stream_width = HwConstant.from_attr(
+        IntegerAttr.from_int_and_width(stream_width, location_width)
+    )
+    block.add_op(location_stream_width)
+    is_in_cycle = CombICmp.from_values(
+        get_located_at.output, location_stream_width.output, ICmpPredicate.ULT
+    )
+    block.add_op(is_in_cycle)
+    is_arriving = CombAnd.from_values([is_located_at.output, is_in_cycle.output])
+    block.add_op(is_arriving)
+    slot = CombExtract.from_values(get_located_at.output, slot_width, 0)
+    block.add_op(slot)
+    arriving_op = _select_slot(block, slot.output, input_ops)
+    located_at_content_next = CombSub.from_values(
+        get_located_at.output, location_stream_width.output
+    )
+    block.add_op(located_at_content_next)
+
+    # Inputs for muxers
+    found_arriving_op = HwSumCreate.from_data(
+        sum_type, "found", stored_input_op(block, arriving_op, sum_type)
+    )
+    block.add_op(found_arriving_op)
+    located_at_next = HwSumCreate.from_data(
+        sum_type, "located_at", located_at_content_next.result
+    )
+    block.add_op(located_at_next)
+    constant_never = HwSumCreate.from_data(sum_type, "never", true.output)
+    block.add_op(constant_never)
+
+    # Muxers
+    next_cycle_muxer = CombMux.from_values(
+        is_located_at.output, located_at_next.output, current
+    )
+    block.add_op(next_cycle_muxer)
+    stream_end_muxer = CombMux.from_values(
+        matcher_unit_inputs.stream_completed,
+        constant_never.output,
+        next_cycle_muxer.result,
+    )
+    block.add_op(stream_end_muxer)
+    found_muxer = CombMux.from_values(is_found.output, current, stream_end_muxer.result)
+    block.add_op(found_muxer)
+    arriving_muxer = CombMux.from_values(
+        is_arriving.result, found_arriving_op.output, found_muxer.result
+    )
+    block.add_op(arriving_muxer)
+
+    # The input for the register is now ready, set it.
+    register.replace_operand(0, arriving_muxer.result)
+
+    # Operands are located relative to the first operation of the cycle. An
+    # offset of `o` designates the operation `o + 1` positions away.
+    should_write_to = CombOr.from_values([is_never.output, is_arriving.result])
+    block.add_op(should_write_to)
+    location_one = HwConstant.from_attr(
+        IntegerAttr.from_int_and_width(1, location_width)
+    )
+    block.add_op(location_one)
+    location_padding = HwConstant.from_attr(
+        IntegerAttr.from_int_and_width(
+            0, location_width - enc_ctx.operand_offset_width
+        )
+    )
+    block.add_op(location_padding)
+    write_val_operands: dict[int, SSAValue] = dict()
+    for operand, operand_sum_type in operand_sum_types.items():
+        has_operand = HwOpHasOperand.from_operand(arriving_op, operand)
+        block.add_op(has_operand)
+        operand_offset = HwOpGetOperandOffset.from_operand(arriving_op, operand)
+        block.add_op(operand_offset)
+        padded_offset = CombConcat.from_values(
+            [location_padding.output, operand_offset.output]
+        )
+        block.add_op(padded_offset)
+        location = CombAdd.from_values(
+            [get_located_at.output, padded_offset.output, location_one.output]
+        )
+        block.add_op(location)
+        wrapped_location = HwSumCreate.from_data(
+            operand_sum_type, "located_at", location.result
+        )
+        block.add_op(wrapped_location)
+        should_write_location = CombAnd.from_values(
+            [has_operand.output, is_arriving.result]
+        )
+        block.add_op(should_write_location)
+        operand_never = HwSumCreate.from_data(operand_sum_type, "never", true.output)
+        block.add_op(operand_never)
+        write_val_muxer = CombMux.from_values(
+            should_write_location.result,
+            wrapped_location.output,
+            operand_never.output,
+        )
+        block.add_op(write_val_muxer)
+        write_val_operands[operand] = write_val_muxer.result
+
+    operand_positions: dict[int, SSAValue] = dict()
+    if position:
+        operand_positions = _accumulate_operand_positions(
+            matcher_unit_inputs,
+            arriving_op,
+            is_arriving.result,
+            is_stream_running.result,
+            block,
+            enc_ctx,
+            node_name,
+            position,
+            position_operands,
+        )
+
+    return FillerNodeOutput(
+        register.data, should_write_to.result, write_val_operands, operand_positions
+    )
+
+
+def _accumulate_operand_positions(
+    matcher_unit_inputs: MatcherUnitInputs,
+    input_op: SSAValue,
+    is_arriving: SSAValue,
+    is_stream_running: SSAValue,
+    block: Block,
+    enc_ctx: EncodingContext,
+    node_name: str,
+    position: SSAValue,
+    position_operands: list[int],
+) -> dict[int, SSAValue]:
+    """
+    Accumulates the position of operands in the stream once the operation of a
+    node is found, `input_op` being the operation arriving to the node if
+    `is_arriving` is set. An operand with an offset of `o` is located `o + 1`
+    operations after its user.
+    """
+    operand_positions: dict[int, SSAValue] = dict()
+    position_width = cast(IntegerType, position.typ).width.data
+    padding_width = position_width - enc_ctx.operand_offset_width
+    position_padding = None
+    if padding_width != 0:
+        position_padding = HwConstant.from_attr(
+            IntegerAttr.from_int_and_width(0, padding_width)
+        )
+        block.add_op(position_padding)
+    position_one = HwConstant.from_attr(
+        IntegerAttr.from_int_and_width(1, position_width)
+    )
+    block.add_op(position_one)
+    for operand in position_operands:
+        operand_offset = HwOpGetOperandOffset.from_operand(input_op, operand)
+        block.add_op(operand_offset)
+        padded_offset: SSAValue = operand_offset.output
+        if position_padding:
+            concat = CombConcat.from_values(
+                [position_padding.output, operand_offset.output]
+            )
+            block.add_op(concat)
+            padded_offset = concat.output
+        accumulated = CombAdd.from_values(
+            [position, padded_offset, position_one.output]
+        )
+        block.add_op(accumulated)
+        # The value of the register is only meaningful once the node is found.
+        # Resetting it to the accumulated offset sets up the root accordingly.
+        position_register = SeqCompregCe.new(
+            f"position_{node_name}_{operand}",
+            position.typ,
+            accumulated.result,  # input is defined later, use accumulated as dummy
+            matcher_unit_inputs.clock,
+            is_stream_running,
+            matcher_unit_inputs.new_sequence,
+            accumulated.result,
+        )
+        block.add_op(position_register)
+        position_muxer = CombMux.from_values(
+            is_arriving, accumulated.result, position_register.data
+        )
+        block.add_op(position_muxer)
+        position_register.replace_operand(0, position_muxer.result)
+        operand_positions[operand] = position_register.data
+    return operand_positions
+
+
+def _operand_stream_position(
+    block: Block, operand_offset: SSAValue, next_stream_position: SSAValue
+) -> SSAValue:
+    """
+    Absolute position in the stream of the definition of an operand of the
+    current input operation. An offset of `o` designates the operation `o + 1`
+    positions away.
+    """
+    position_width = cast(IntegerType, next_stream_position.typ).width.data
+    offset_width = cast(IntegerType, operand_offset.typ).width.data
+    padded_offset = operand_offset
+    if position_width != offset_width:
+        padding = HwConstant.from_attr(
+            IntegerAttr.from_int_and_width(0, position_width - offset_width)
+        )
+        block.add_op(padding)
+        concat = CombConcat.from_values([padding.output, operand_offset])
+        block.add_op(concat)
+        padded_offset = concat.output
+    position = CombAdd.from_values([next_stream_position, padded_offset])
+    block.add_op(position)
+    return position.result
+
+
+# Placeholder for the name of the node in the registers of filler templates.
+_TEMPLATE_NODE_NAME = "{node}"
+
+
+def _shared_filler_inputs(
+    matcher_unit_inputs: MatcherUnitInputs,
+) -> list[Tuple[str, SSAValue]]:
+    """Inputs of the filler logic shared by all the nodes of a matcher unit."""
+    inputs = [
+        ("clock", matcher_unit_inputs.clock),
+        ("input_op", matcher_unit_inputs.input_op),
+        ("is_stream_paused", matcher_unit_inputs.is_stream_paused),
+        ("new_sequence", matcher_unit_inputs.new_sequence),
+        ("stream_completed", matcher_unit_inputs.stream_completed),
+    ]
+    if matcher_unit_inputs.stream_position:
+        assert matcher_unit_inputs.next_stream_position
+        inputs += [
+            ("stream_position", matcher_unit_inputs.stream_position),
+            ("next_stream_position", matcher_unit_inputs.next_stream_position),
+        ]
+    inputs += [
+        (f"input_op_{slot + 1}", input_op)
+        for slot, input_op in enumerate(matcher_unit_inputs.extra_input_ops)
+    ]
+    return inputs
+
+
+def _filler_inputs(
+    matcher_unit_inputs: MatcherUnitInputs,
+    default_value: SSAValue,
+    write_to: SSAValue,
+    write_val: SSAValue,
+    position: SSAValue | None,
+) -> list[Tuple[str, SSAValue]]:
+    """Inputs of the filler logic of a node, in the order of template arguments."""
+    inputs = _shared_filler_inputs(matcher_unit_inputs) + [
+        ("default_value", default_value),
+        ("write_to", write_to),
+        ("write_val", write_val),
+    ]
+    if position:
+        inputs.append(("position", position))
+    return inputs
+
+
+@dataclass
+class FillerTemplate:
+    """
+    Filler logic of a DAG buffer node, built once and cloned for every node
+    of the same shape.
+
+    Field:
+    - block: detached block holding the logic. Its arguments are the inputs of
+             the node, see `_filler_inputs`.
+    - arg_names: names of the arguments of `block`.
+    - output: outputs of the logic, as values of `block`.
+    - module: module holding the same logic, once created.
+    """
+
+    block: Block
+    arg_names: list[str]
+    output: FillerNodeOutput
+    module: HwModule | None = None
+
+
+class FillerTemplateCache:
+    """
+    Builds the filler logic of DAG buffer nodes by cloning templates, or by
+    instantiating one module per template. Templates are keyed by everything
+    the logic depends on but its inputs, so a cache can be shared by the
+    matcher units of a chip.
+    """
+
+    templates: dict[Tuple, FillerTemplate]
+    module_prefix: str
+    # Filler modules, in creation order.
+    modules: list[HwModule]
+
+    def __init__(self, module_prefix: str = "filler"):
+        self.templates = dict()
+        self.module_prefix = module_prefix
+        self.modules = []
+
+    @staticmethod
+    def _build_in(
+        block: Block,
+        arg_names: list[str],
+        operand_sum_types: dict[int, HwSumType],
+        enc_ctx: EncodingContext,
+        node_name: str,
+        position_operands: list[int],
+    ) -> FillerNodeOutput:
+        """Builds the filler logic of a node taking its inputs from `block`."""
+        args = dict(zip(arg_names, block.args))
+        matcher_unit_inputs = MatcherUnitInputs(
+            args["clock"],
+            args["input_op"],
+            args["is_stream_paused"],
+            args["new_sequence"],
+            args["stream_completed"],
+            args.get("stream_position"),
+            args.get("next_stream_position"),
+            [x for name, x in args.items() if name.startswith("input_op_")],
+        )
+        return build_filler_node(
+            matcher_unit_inputs,
+            args["default_value"],
+            args["write_to"],
+            args["write_val"],
+            block,
+            operand_sum_types,
+            enc_ctx,
+            node_name,
+            args.get("position"),
+            position_operands,
+        )
+
+    def _template_of(
+        self,
+        inputs: list[Tuple[str, SSAValue]],
+        operand_sum_types: dict[int, HwSumType],
+        enc_ctx: EncodingContext,
+        position_operands: list[int],
+    ) -> FillerTemplate:
+        # Attributes are not hashable, their textual form is used instead.
+        key = (
+            tuple((name, str(value.typ)) for name, value in inputs),
+            tuple((k, str(v)) for k, v in sorted(operand_sum_types.items())),
+            enc_ctx.operand_offset_width,
+            tuple(position_operands),
+        )
+        if key in self.templates:
+            return self.templates[key]
+        arg_names = [name for name, _ in inputs]
+        block = Block(arg_types=[value.typ for _, value in inputs])
+        output = self._build_in(
+            block,
+            arg_names,
+            operand_sum_types,
+            enc_ctx,
+            _TEMPLATE_NODE_NAME,
+            position_operands,
+        )
+        template = FillerTemplate(block, arg_names, output)
+        self.templates[key] = template
+        return template
+
+    def _module_of(self, template: FillerTemplate, enc_ctx: EncodingContext) -> HwModule:
+        if template.module:
+            return template.module
+        # The template block is kept for cloning, the module gets its own logic.
+        block = Block(arg_types=[x.typ for x in template.block.args])
+        output = self._build_in(
+            block,
+            template.arg_names,
+            {
+                operand: cast(HwSumType, value.typ)
+                for operand, value in template.output.write_val_out.items()
+            },
+            enc_ctx,
+            "node",
+            list(template.output.operand_positions.keys()),
+        )
+        write_val_operands = sorted(output.write_val_out.keys())
+        position_operands = sorted(output.operand_positions.keys())
+        block.add_op(
+            HwOutput.from_outputs(
+                [output.output, output.write_to_out]
+                + [output.write_val_out[x] for x in write_val_operands]
+                + [output.operand_positions[x] for x in position_operands]
+            )
+        )
+        template.module = HwModule.from_block(
+            f"{self.module_prefix}_{len(self.modules)}",
+            block,
+            template.arg_names,
+            ["data", "write_operands"]
+            + [f"operand_{x}" for x in write_val_operands]
+            + [f"position_{x}" for x in position_operands],
+        )
+        self.modules.append(template.module)
+        return template.module
+
+    def instantiate_node(
+        self,
+        matcher_unit_inputs: MatcherUnitInputs,
+        default_value: SSAValue,
+        write_to: SSAValue,
+        write_val: SSAValue,
+        block: Block,
+        operand_sum_types: dict[int, HwSumType],
+        enc_ctx: EncodingContext,
+        node_name: str,
+        position: SSAValue | None = None,
+        position_operands: list[int] | None = None,
+    ) -> FillerNodeOutput:
+        """Same as `build_filler_node`, instantiating the module of the node."""
+        if position_operands is None:
+            position_operands = []
+        inputs = _filler_inputs(
+            matcher_unit_inputs, default_value, write_to, write_val, position
+        )
+        template = self._template_of(
+            inputs, operand_sum_types, enc_ctx, position_operands
+        )
+        module = self._module_of(template, enc_ctx)
+        instance = HwInstance.new(node_name, module, [value for _, value in inputs])
+        block.add_op(instance)
+
+        outputs = list(instance.outputs)
+        write_val_operands = sorted(operand_sum_types.keys())
+        write_val_out = dict(zip(write_val_operands, outputs[2:]))
+        positions = outputs[2 + len(write_val_operands) :]
+        return FillerNodeOutput(
+            outputs[0],
+            outputs[1],
+            write_val_out,
+            dict(zip(sorted(position_operands), positions)),
+        )
+
+    def build_node(
+        self,
+        matcher_unit_inputs: MatcherUnitInputs,
+        default_value: SSAValue,
+        write_to: SSAValue,
+        write_val: SSAValue,
+        block: Block,
+        operand_sum_types: dict[int, HwSumType],
+        enc_ctx: EncodingContext,
+        node_name: str,
+        position: SSAValue | None = None,
+        position_operands: list[int] | None = None,
+    ) -> FillerNodeOutput:
+        """Same as `build_filler_node`, cloning the template of the node."""
+        if position_operands is None:
+            position_operands = []
+        inputs = _filler_inputs(
+            matcher_unit_inputs, default_value, write_to, write_val, position
+        )
+        template = self._template_of(
+            inputs, operand_sum_types, enc_ctx, position_operands
+        )
+        value_mapper: dict[SSAValue, SSAValue] = dict(
+            zip(template.block.args, [value for _, value in inputs])
+        )
+        clones: list[Operation] = []
+        for op in template.block.ops:
+            clone = op.clone(value_mapper)
+            if isinstance(clone, SeqCompregCe):
+                clone.attributes["name"] = StringAttr(
+                    clone.register_name.data.replace(_TEMPLATE_NODE_NAME, node_name)
+                )
+            block.add_op(clone)
+            clones.append(clone)
+        # Registers use values defined after them, only mapped once all is cloned.
+        for clone in clones:
+            for index, operand in enumerate(clone.operands):
+                if operand in value_mapper:
+                    clone.replace_operand(index, value_mapper[operand])
+
+        output = template.output
+        return FillerNodeOutput(
+            value_mapper[output.output],
+            value_mapper[output.write_to_out],
+            {k: value_mapper[v] for k, v in output.write_val_out.items()},
+            {k: value_mapper[v] for k, v in output.operand_positions.items()},
+        )
+
+
+def dag_buffer_node_sum_type(
+    input_op_type: HwOperation,
+    enc_ctx: EncodingContext,
+    stored_operands: list[int],
+    located_at_width: int | None = None,
+) -> HwSumType:
+    if not located_at_width:
+        located_at_width = enc_ctx.operand_offset_width
+    return HwSumType.from_variants(
+        {
+            "unknown": i1,  # dummy i1
+            "located_at": IntegerType(located_at_width),
+            "found": input_op_type.pruned(stored_operands),
+            "never": i1,  # dummy i1
+        }
+    )
+
+
+def stored_input_op(block: Block, input_op: SSAValue, sum_type: HwSumType) -> SSAValue:
+    """Drops the fields of the input operation a DAG buffer node does not store."""
+    found_type = cast(HwOperation, sum_type.cases.data["found"])
+    if found_type == input_op.typ:
+        return input_op
+    prune = HwOpPrune.from_operand(input_op, found_type.get_stored_operands())
+    block.add_op(prune)
+    return prune.output
+
+
+def _position_operands(
+    span: OperationSpan,
+    liveness: DagBufferLiveness,
+    sharing: DagBufferSharing,
+    memo: dict[OperationSpan, list[int]],
+) -> list[int]:
+    """
+    Operands of the node of the span whose position must be accumulated, either
+    because it is read or because a DAG buffer node stored below them needs its
+    position. Results are memoized in `memo`, as shared nodes are reached
+    through each of their users.
+    """
+    if span in memo:
+        return memo[span]
+    position_operands: set[int] = set()
+    for member in sharing.members_of(span):
+        position_operands.update(liveness.read_positions_of(member))
+        for operand, operand_span in member.operands.items():
+            defining_op = sharing.representative(operand_span.defining_op)
+            if (
+                defining_op.used
+                and len(_position_operands(defining_op, liveness, sharing, memo))
+                != 0
+            ):
+                position_operands.add(operand)
+    memo[span] = sorted(position_operands)
+    return memo[span]
+
+
+def _dag_buffer_depth(span: OperationSpan) -> int:
+    """Maximum amount of operand edges between the root and a DAG buffer node."""
+    depth = 0
+    for operand in span.operands.values():
+        if operand.defining_op.used:
+            depth = max(depth, _dag_buffer_depth(operand.defining_op) + 1)
+    return depth
+
+
+@dataclass
+class _NodeWrite:
+    """Update of a DAG buffer node by the node storing one of its users."""
+
+    write_to: SSAValue
+    write_val: SSAValue
+    position: SSAValue | None
+    default_value: SSAValue
+    # The operands of the root are located as soon as a sequence starts.
+    from_root: bool = False
 
 
 def create_filler(
@@ -186,115 +1019,657 @@ def create_filler(
     block: Block,
     matcher_unit_inputs: MatcherUnitInputs,
     matcher_unit_name: str,
-    node_sum_type: HwSumType,
     enc_ctx: EncodingContext,
+    options: MatcherUnitOptions,
+    liveness: DagBufferLiveness,
+    sharing: DagBufferSharing | None = None,
+    templates: FillerTemplateCache | None = None,
 ) -> DagBufferCtx:
     name_counter = 0
+    if sharing is None:
+        sharing = DagBufferSharing()
+    position_operands_of: dict[OperationSpan, list[int]] = dict()
+    if not templates:
+        templates = FillerTemplateCache(f"{matcher_unit_name}_filler")
+    build_node = (
+        templates.instantiate_node if options.filler_modules else templates.build_node
+    )
 
     false = HwConstant.from_attr(IntegerAttr.from_int_and_width(0, 1))
     block.add_op(false)
-    constant_unknown = HwSumCreate.from_data(node_sum_type, "unknown", false.output)
-    block.add_op(constant_unknown)
-    constant_never = HwSumCreate.from_data(node_sum_type, "never", false.output)
-    block.add_op(constant_never)
 
     ctx = DagBufferCtx()
 
+    # With absolute positions, a single counter tracks the position of the input
+    # operation relative to the root. Operands are located at least one and at
+    # most `2^w` positions before their user. The counter saturates above the
+    # furthest position, so it never wraps back to a position a node expects.
+    root_next_position: SSAValue | None = None
+    if options.absolute_positions:
+        max_position = _dag_buffer_depth(span) * 2**enc_ctx.operand_offset_width
+        stream_position_width = math.ceil(math.log2(max_position + 2))
+        stream_position_type = IntegerType(stream_position_width)
+        true = HwConstant.from_attr(IntegerAttr.from_int_and_width(1, 1))
+        block.add_op(true)
+        is_stream_running = CombXor.from_values(
+            [matcher_unit_inputs.is_stream_paused, true.output]
+        )
+        block.add_op(is_stream_running)
+        position_one = HwConstant.from_attr(
+            IntegerAttr.from_int_and_width(1, stream_position_width)
+        )
+        block.add_op(position_one)
+        root_next_position = position_one.output
+        # The root is at position zero, the counter points to the next operation
+        # once the attempt has started.
+        stream_position = SeqCompregCe.new(
+            f"{matcher_unit_name}_stream_position",
+            stream_position_type,
+            position_one.output,  # input is defined later, use one as dummy
+            matcher_unit_inputs.clock,
+            is_stream_running.result,
+            matcher_unit_inputs.new_sequence,
+            position_one.output,
+        )
+        block.add_op(stream_position)
+        next_stream_position = CombAdd.from_values(
+            [stream_position.data, position_one.output]
+        )
+        block.add_op(next_stream_position)
+        position_max = HwConstant.from_attr(
+            IntegerAttr.from_int_and_width(
+                2**stream_position_width - 1, stream_position_width
+            )
+        )
+        block.add_op(position_max)
+        is_saturated = CombICmp.from_values(
+            stream_position.data, position_max.output, ICmpPredicate.EQ
+        )
+        block.add_op(is_saturated)
+        position_muxer = CombMux.from_values(
+            is_saturated.output, stream_position.data, next_stream_position.result
+        )
+        block.add_op(position_muxer)
+        stream_position.replace_operand(0, position_muxer.result)
+        matcher_unit_inputs = replace(
+            matcher_unit_inputs,
+            stream_position=stream_position.data,
+            next_stream_position=next_stream_position.result,
+        )
+
+    # Each node only stores the operand offsets the FSM reads from it.
+    input_op_type = cast(HwOperation, matcher_unit_inputs.input_op.typ)
+    located_at_width = (
+        cast(IntegerType, matcher_unit_inputs.stream_position.typ).width.data
+        if matcher_unit_inputs.stream_position
+        else None
+    )
+    # With several operations per cycle, operands are located relative to the
+    # first operation of the cycle, and may lie up to `2^w` positions after its
+    # last operation.
+    stream_width = 1 + len(matcher_unit_inputs.extra_input_ops)
+    if stream_width != 1:
+        assert not options.absolute_positions
+        located_at_width = math.ceil(
+            math.log2(stream_width + 2**enc_ctx.operand_offset_width)
+        )
+
+    def sum_type_of(span: OperationSpan) -> HwSumType:
+        stored_operands: set[int] = set()
+        for member in sharing.members_of(sharing.representative(span)):
+            stored_operands.update(liveness.stored_operands_of(member))
+        return dag_buffer_node_sum_type(
+            input_op_type, enc_ctx, sorted(stored_operands), located_at_width
+        )
+
+    def operand_spans_of(span: OperationSpan) -> dict[int, OperationSpan]:
+        """Definitions of the operands the node of a span locates."""
+        operand_spans: dict[int, OperationSpan] = dict()
+        for member in sharing.members_of(span):
+            for operand, operand_span in member.operands.items():
+                if operand_span.defining_op.used:
+                    operand_spans.setdefault(operand, operand_span.defining_op)
+        return operand_spans
+
+    def operand_sum_types_of(span: OperationSpan) -> dict[int, HwSumType]:
+        return {
+            operand: sum_type_of(defining_op)
+            for operand, defining_op in operand_spans_of(span).items()
+        }
+
+    # A node is written by each node storing one of its users. Without sharing,
+    # this is only its parent in the span tree.
+    writer_amount: dict[OperationSpan, int] = dict()
+    worklist = [span]
+    while len(worklist) != 0:
+        user = worklist.pop()
+        for defining_op in operand_spans_of(user).values():
+            defining_op = sharing.representative(defining_op)
+            if not defining_op in writer_amount:
+                worklist.append(defining_op)
+            writer_amount[defining_op] = writer_amount.get(defining_op, 0) + 1
+
+    # Positions are sums of operand offsets plus one per edge along a path from
+    # the root, ending with an operand of the deepest DAG buffer node.
+    root_position: SSAValue | None = None
+    if options.accumulate_offsets:
+        max_path_len = _dag_buffer_depth(span) + 1
+        ctx.position_width = enc_ctx.operand_offset_width + math.ceil(
+            math.log2(max_path_len + 1)
+        )
+        position_zero = HwConstant.from_attr(
+            IntegerAttr.from_int_and_width(0, ctx.position_width)
+        )
+        block.add_op(position_zero)
+        root_position = position_zero.output
+
+    built_nodes: dict[OperationSpan, DagBufferNode] = dict()
+
     def register_in_ctx(node: DagBufferNode, span: OperationSpan) -> DagBufferNode:
         ctx.nodes.append(node)
-        ctx.span_to_dag[span] = node
+        built_nodes[span] = node
+        for member in sharing.members_of(span):
+            ctx.span_to_dag[member] = node
         return node
 
-    def construct_node(
-        span: OperationSpan,
-        default_value: SSAValue,
-        write_to: SSAValue,
-        write_val: SSAValue,
-    ) -> DagBufferNode:
-        nonlocal name_counter
-        operands = list(
-            filter(lambda x: span.operands[x].defining_op.used, span.operands.keys())
+    def merge_writes(writes: list[_NodeWrite]) -> _NodeWrite:
+        """Combines the updates of a shared node, the first writer having priority."""
+        if len(writes) == 1:
+            return writes[0]
+        write_to = CombOr.from_values([x.write_to for x in writes])
+        block.add_op(write_to)
+        write_val = writes[-1].write_val
+        for write in reversed(writes[:-1]):
+            write_muxer = CombMux.from_values(write.write_to, write.write_val, write_val)
+            block.add_op(write_muxer)
+            write_val = write_muxer.result
+        # When the equalities justifying the sharing hold, all users of the
+        # operation are found before it, and agree on its position.
+        from_root = [x for x in writes if x.from_root]
+        return _NodeWrite(
+            write_to.result,
+            write_val,
+            writes[0].position,
+            (from_root + writes)[0].default_value,
+            len(from_root) != 0,
         )
-        filler: FillerNodeOutput = build_filler_node(
+
+    def unknown_of(span: OperationSpan) -> SSAValue:
+        constant_unknown = HwSumCreate.from_data(
+            sum_type_of(sharing.representative(span)), "unknown", false.output
+        )
+        block.add_op(constant_unknown)
+        return constant_unknown.output
+
+    def link_shared_nodes():
+        """Shared nodes may be built after their users, links nodes once all exist."""
+        for built_span, node in built_nodes.items():
+            for operand, defining_op in operand_spans_of(built_span).items():
+                node.store_operands_at[operand] = ctx.span_to_dag[defining_op]
+
+    pending_writes: dict[OperationSpan, list[_NodeWrite]] = dict()
+
+    def construct_node(span: OperationSpan, write: _NodeWrite):
+        nonlocal name_counter
+        span = sharing.representative(span)
+        writes = pending_writes.setdefault(span, [])
+        writes.append(write)
+        if len(writes) < writer_amount[span]:
+            # Shared nodes are built once all their writers are.
+            return
+        write = merge_writes(writes)
+
+        operand_spans = operand_spans_of(span)
+        operand_sum_types = operand_sum_types_of(span)
+        filler: FillerNodeOutput = build_node(
             matcher_unit_inputs,
-            default_value,
-            write_to,
-            write_val,
+            write.default_value,
+            write.write_to,
+            write.write_val,
             block,
-            operands,
+            operand_sum_types,
             enc_ctx,
             f"{matcher_unit_name}_dag_buffer_{name_counter}",
+            write.position,
+            _position_operands(span, liveness, sharing, position_operands_of),
         )
         name_counter += 1
 
-        store_operands_at: dict[int, "DagBufferNode"] = dict()
-        for operand in operands:
-            operand_node = construct_node(
-                span.operands[operand].defining_op,
-                constant_unknown.output,
-                filler.write_to_out,
-                filler.write_val_out[operand],
+        for operand in operand_sum_types.keys():
+            construct_node(
+                operand_spans[operand],
+                _NodeWrite(
+                    filler.write_to_out,
+                    filler.write_val_out[operand],
+                    filler.operand_positions.get(operand),
+                    unknown_of(operand_spans[operand]),
+                ),
             )
-            store_operands_at[operand] = operand_node
-        return register_in_ctx(DagBufferNode(filler.output, store_operands_at), span)
+        register_in_ctx(DagBufferNode(filler.output, dict(), filler.operand_positions), span)
+
+    root_sum_type = sum_type_of(span)
+    if stream_width != 1:
+        # The root arrives in its slot as soon as the sequence starts, and
+        # locates its operands in the same cycle.
+        assert matcher_unit_inputs.root_slot
+        assert located_at_width
+        slot_width = cast(IntegerType, matcher_unit_inputs.root_slot.typ).width.data
+        slot_padding = HwConstant.from_attr(
+            IntegerAttr.from_int_and_width(0, located_at_width - slot_width)
+        )
+        block.add_op(slot_padding)
+        root_location = CombConcat.from_values(
+            [slot_padding.output, matcher_unit_inputs.root_slot]
+        )
+        block.add_op(root_location)
+        located_root = HwSumCreate.from_data(
+            root_sum_type, "located_at", root_location.output
+        )
+        block.add_op(located_root)
+        root_filler = build_node(
+            matcher_unit_inputs,
+            located_root.output,
+            false.output,
+            located_root.output,
+            block,
+            operand_sum_types_of(span),
+            enc_ctx,
+            f"{matcher_unit_name}_dag_buffer_{name_counter}",
+            root_position,
+            _position_operands(span, liveness, sharing, position_operands_of),
+        )
+        name_counter += 1
+        for operand, operand_span in operand_spans_of(span).items():
+            construct_node(
+                operand_span,
+                _NodeWrite(
+                    root_filler.write_to_out,
+                    root_filler.write_val_out[operand],
+                    root_filler.operand_positions.get(operand),
+                    unknown_of(operand_span),
+                ),
+            )
+        register_in_ctx(
+            DagBufferNode(root_filler.output, dict(), root_filler.operand_positions),
+            span,
+        )
+        link_shared_nodes()
+        return ctx
 
     found_input_op = HwSumCreate.from_data(
-        node_sum_type, "found", matcher_unit_inputs.input_op
+        root_sum_type,
+        "found",
+        stored_input_op(block, matcher_unit_inputs.input_op, root_sum_type),
     )
     block.add_op(found_input_op)
 
     # The root and its immediate operands have special-cased
-    # default values that must be handled separately.
-    operands = list(
-        filter(lambda x: span.operands[x].defining_op.used, span.operands.keys())
-    )
-    root_filler: FillerNodeOutput = build_filler_node(
+    # default values that must be handled separately. If the stream completes
+    # as the root arrives, its operands are past the end of the window.
+    operand_spans = operand_spans_of(span)
+    operand_sum_types = operand_sum_types_of(span)
+    root_filler: FillerNodeOutput = build_node(
         matcher_unit_inputs,
         found_input_op.output,
         false.output,
         found_input_op.output,
         block,
-        operands,
+        operand_sum_types,
         enc_ctx,
         f"{matcher_unit_name}_dag_buffer_{name_counter}",
+        root_position,
+        _position_operands(span, liveness, sharing, position_operands_of),
     )
     name_counter += 1
-    store_operands_at: dict[int, "DagBufferNode"] = dict()
-    for operand in operands:
+    true = HwConstant.from_attr(IntegerAttr.from_int_and_width(1, 1))
+    block.add_op(true)
+    is_in_window = CombXor.from_values(
+        [matcher_unit_inputs.stream_completed, true.output]
+    )
+    block.add_op(is_in_window)
+    for operand, operand_sum_type in operand_sum_types.items():
         has_operand = HwOpHasOperand.from_operand(matcher_unit_inputs.input_op, operand)
         block.add_op(has_operand)
+        is_located = CombAnd.from_values([has_operand.output, is_in_window.result])
+        block.add_op(is_located)
         operand_offset = HwOpGetOperandOffset.from_operand(
             matcher_unit_inputs.input_op, operand
         )
         block.add_op(operand_offset)
+        location: SSAValue = operand_offset.output
+        if root_next_position:
+            location = _operand_stream_position(
+                block, operand_offset.output, root_next_position
+            )
         wrapped_operand_offset = HwSumCreate.from_data(
-            node_sum_type, "located_at", operand_offset.output
+            operand_sum_type, "located_at", location
         )
         block.add_op(wrapped_operand_offset)
+        constant_never = HwSumCreate.from_data(operand_sum_type, "never", false.output)
+        block.add_op(constant_never)
         write_val_muxer = CombMux.from_values(
-            has_operand.output,
+            is_located.result,
             wrapped_operand_offset.output,
             constant_never.output,
         )
         block.add_op(write_val_muxer)
-        operand_node = construct_node(
-            span.operands[operand].defining_op,
-            write_val_muxer.result,
-            root_filler.write_to_out,
-            root_filler.write_val_out[operand],
+        construct_node(
+            operand_spans[operand],
+            _NodeWrite(
+                root_filler.write_to_out,
+                root_filler.write_val_out[operand],
+                root_filler.operand_positions.get(operand),
+                write_val_muxer.result,
+                True,
+            ),
         )
-        store_operands_at[operand] = operand_node
 
-    register_in_ctx(DagBufferNode(root_filler.output, store_operands_at), span)
+    register_in_ctx(
+        DagBufferNode(root_filler.output, dict(), root_filler.operand_positions),
+        span,
+    )
+    link_shared_nodes()
     return ctx
 
 
+def pattern_id_width(pattern_count: int) -> int:
+    return max(1, math.ceil(math.log2(max(pattern_count, 1))))
+
+
+def match_status_sum_type(pattern_count: int = 1) -> HwSumType:
+    """
+    Type of the `match_result` output of matcher units. If the unit matches
+    several patterns, `success` carries the index of the matched pattern.
+    """
+    return HwSumType.from_variants(
+        {
+            "unknown": i1,  # dummy i1
+            "success": IntegerType(pattern_id_width(pattern_count)),
+            "failure": i1,  # dummy i1
+        }
+    )
+
+
+def _build_root_condition(
+    block: Block, condition: RootCondition, root_op: SSAValue
+) -> SSAValue:
+    match condition:
+        case RootIsOperation(op_name=op_name):
+            check = HwOpIsOperation.from_operand(root_op, op_name)
+        case RootOperandAmountIs(amount=amount):
+            check = HwOpOperandAmountIs.from_operand(root_op, amount)
+        case RootHasOperand(index=index):
+            check = HwOpHasOperand.from_operand(root_op, index)
+        case RootHasResult():
+            check = HwOpHasResult.from_operand(root_op)
+    block.add_op(check)
+    return check.output
+
+
+def _build_root_may_match(
+    block: Block, decision: RootDecision, root_op: SSAValue
+) -> SSAValue:
+    """
+    Builds the logic computing whether the pattern may match given the root
+    operation, following the decision tree of root checks.
+    """
+    true = HwConstant.from_attr(IntegerAttr.from_int_and_width(1, 1))
+    block.add_op(true)
+    false = HwConstant.from_attr(IntegerAttr.from_int_and_width(0, 1))
+    block.add_op(false)
+
+    built: dict[RootDecision, SSAValue] = dict()
+
+    def build(decision: RootDecision) -> SSAValue:
+        if decision in built:
+            return built[decision]
+        match decision:
+            case MayMatch():
+                value = true.output
+            case NeverMatches():
+                value = false.output
+            case RootCheck(condition=condition, if_true=if_true, if_false=if_false):
+                check = _build_root_condition(block, condition, root_op)
+                muxer = CombMux.from_values(check, build(if_true), build(if_false))
+                block.add_op(muxer)
+                value = muxer.result
+            case RootEither(options=options):
+                any_option = CombOr.from_values([build(x) for x in options])
+                block.add_op(any_option)
+                value = any_option.result
+        built[decision] = value
+        return value
+
+    return build(decision)
+
+
+def insert_early_failure(
+    block: Block,
+    pdli_region: Region,
+    dag_span_ctx: OperationSpanCtx,
+    root_node: DagBufferNode,
+    fsm_output: SSAValue,
+) -> SSAValue:
+    """
+    Overrides the FSM status with a failure once the root is found and the checks
+    only depending on the root show the pattern cannot match.
+    """
+    decision = compute_root_decision(pdli_region, dag_span_ctx)
+    if isinstance(decision, MayMatch):
+        return fsm_output
+
+    true = HwConstant.from_attr(IntegerAttr.from_int_and_width(1, 1))
+    block.add_op(true)
+    root_found = HwSumIs.from_variant(root_node.data, "found")
+    block.add_op(root_found)
+    root_op = HwSumGetAs.from_variant(root_node.data, "found")
+    block.add_op(root_op)
+    may_match = _build_root_may_match(block, decision, root_op.output)
+    cannot_match = CombXor.from_values([may_match, true.output])
+    block.add_op(cannot_match)
+    fails_early = CombAnd.from_values([root_found.output, cannot_match.result])
+    block.add_op(fails_early)
+    failure_status = HwSumCreate.from_data(fsm_output.typ, "failure", true.output)
+    block.add_op(failure_status)
+    status_muxer = CombMux.from_values(
+        fails_early.result, failure_status.output, fsm_output
+    )
+    block.add_op(status_muxer)
+    return status_muxer.result
+
+
+@dataclass
+class _BankControl:
+    """
+    State of a double-buffered DAG buffer. The FSM reads the deciding bank, which
+    is the filling bank unless an attempt is pending.
+
+    Field:
+    - filling_bank: bank gathering the latest attempt.
+    - is_pending: the FSM decides on the other bank, which stopped gathering when
+                  the latest attempt started.
+    - is_started: an attempt started since the unit was reset.
+    - deciding_bank: bank the FSM reads from. It is the filling bank unless an
+                     attempt is pending, but is stored in its own register to
+                     keep the bank selection out of the paths of the FSM.
+    - bank_inputs: matcher unit inputs as seen by the filler of each bank.
+    """
+
+    filling_bank: SeqCompregCe
+    is_pending: SeqCompregCe
+    is_started: SeqCompregCe
+    deciding_bank: SeqCompregCe
+    bank_inputs: list[MatcherUnitInputs]
+
+
+def create_bank_control(
+    block: Block,
+    matcher_unit_inputs: MatcherUnitInputs,
+    reset: SSAValue,
+    matcher_unit_name: str,
+) -> _BankControl:
+    """
+    Builds the registers alternating attempts between the two banks of a
+    double-buffered DAG buffer. A new sequence resets the bank that is not
+    filling, and completes the stream for the filling bank, which then holds
+    its content until the FSM is done with it.
+    """
+    true = HwConstant.from_attr(IntegerAttr.from_int_and_width(1, 1))
+    block.add_op(true)
+    false = HwConstant.from_attr(IntegerAttr.from_int_and_width(0, 1))
+    block.add_op(false)
+    is_stream_running = CombXor.from_values(
+        [matcher_unit_inputs.is_stream_paused, true.output]
+    )
+    block.add_op(is_stream_running)
+
+    # Registers are defined first and receive their inputs once the FSM result
+    # is known.
+    registers: list[SeqCompregCe] = []
+    register_names = ["filling_bank", "is_pending", "is_started", "deciding_bank"]
+    for register_name in register_names:
+        register = SeqCompregCe.new(
+            f"{matcher_unit_name}_{register_name}",
+            i1,
+            false.output,
+            matcher_unit_inputs.clock,
+            true.output,
+            reset,
+            false.output,
+        )
+        block.add_op(register)
+        registers.append(register)
+    filling_bank, is_pending, is_started, deciding_bank = registers
+
+    not_filling_bank = CombXor.from_values([filling_bank.data, true.output])
+    block.add_op(not_filling_bank)
+    is_ending = CombOr.from_values(
+        [matcher_unit_inputs.stream_completed, matcher_unit_inputs.new_sequence]
+    )
+    block.add_op(is_ending)
+
+    bank_inputs: list[MatcherUnitInputs] = []
+    for bank in range(2):
+        is_filling = filling_bank.data if bank else not_filling_bank.result
+        is_target = not_filling_bank.result if bank else filling_bank.data
+        new_sequence = CombAnd.from_values(
+            [matcher_unit_inputs.new_sequence, is_target]
+        )
+        block.add_op(new_sequence)
+        is_gathering = CombOr.from_values([is_filling, new_sequence.result])
+        block.add_op(is_gathering)
+        is_running = CombAnd.from_values(
+            [is_stream_running.result, is_gathering.result]
+        )
+        block.add_op(is_running)
+        is_paused = CombXor.from_values([is_running.result, true.output])
+        block.add_op(is_paused)
+        # The stream may also complete as the root of the new sequence arrives.
+        is_filling_end = CombAnd.from_values([is_filling, is_ending.result])
+        block.add_op(is_filling_end)
+        is_root_end = CombAnd.from_values(
+            [new_sequence.result, matcher_unit_inputs.stream_completed]
+        )
+        block.add_op(is_root_end)
+        stream_completed = CombOr.from_values(
+            [is_filling_end.result, is_root_end.result]
+        )
+        block.add_op(stream_completed)
+        bank_inputs.append(
+            replace(
+                matcher_unit_inputs,
+                is_stream_paused=is_paused.result,
+                new_sequence=new_sequence.result,
+                stream_completed=stream_completed.result,
+            )
+        )
+
+    next_filling_bank = CombXor.from_values(
+        [filling_bank.data, matcher_unit_inputs.new_sequence]
+    )
+    block.add_op(next_filling_bank)
+    filling_bank.replace_operand(0, next_filling_bank.result)
+    next_is_started = CombOr.from_values(
+        [is_started.data, matcher_unit_inputs.new_sequence]
+    )
+    block.add_op(next_is_started)
+    is_started.replace_operand(0, next_is_started.result)
+
+    return _BankControl(
+        filling_bank, is_pending, is_started, deciding_bank, bank_inputs
+    )
+
+
+def select_deciding_bank(
+    block: Block, control: _BankControl, bank_ctxs: list[DagBufferCtx]
+) -> list[SSAValue]:
+    """Provides the FSM inputs of both banks to the FSM, from the deciding bank."""
+    inputs: list[SSAValue] = []
+    for bank_0, bank_1 in zip(bank_ctxs[0].fsm_inputs(), bank_ctxs[1].fsm_inputs()):
+        muxer = CombMux.from_values(control.deciding_bank.data, bank_1, bank_0)
+        block.add_op(muxer)
+        inputs.append(muxer.result)
+    return inputs
+
+
+def update_bank_control(
+    block: Block,
+    control: _BankControl,
+    new_sequence: SSAValue,
+    match_result: SSAValue,
+) -> Tuple[SSAValue, SSAValue]:
+    """
+    Moves the FSM to the latest attempt once it decided on the pending one.
+    Returns whether the FSM must be reset, and whether the unit is ready to
+    start a new attempt.
+    """
+    true = HwConstant.from_attr(IntegerAttr.from_int_and_width(1, 1))
+    block.add_op(true)
+    is_unknown = HwSumIs.from_variant(match_result, "unknown")
+    block.add_op(is_unknown)
+    is_known = CombXor.from_values([is_unknown.output, true.output])
+    block.add_op(is_known)
+    not_started = CombXor.from_values([control.is_started.data, true.output])
+    block.add_op(not_started)
+    is_decided = CombOr.from_values([is_known.result, not_started.result])
+    block.add_op(is_decided)
+
+    # Once decided, the FSM switches to the latest attempt, which is still
+    # pending if a new sequence starts on the bank it decided on.
+    is_waiting = CombOr.from_values([control.is_pending.data, new_sequence])
+    block.add_op(is_waiting)
+    switch = CombAnd.from_values([is_decided.result, is_waiting.result])
+    block.add_op(switch)
+    stays_pending = CombAnd.from_values([control.is_pending.data, new_sequence])
+    block.add_op(stays_pending)
+    pending_muxer = CombMux.from_values(
+        is_decided.result, stays_pending.result, is_waiting.result
+    )
+    block.add_op(pending_muxer)
+    control.is_pending.replace_operand(0, pending_muxer.result)
+    next_deciding_bank = CombXor.from_values(
+        [control.filling_bank.input, pending_muxer.result]
+    )
+    block.add_op(next_deciding_bank)
+    control.deciding_bank.replace_operand(0, next_deciding_bank.result)
+
+    not_pending = CombXor.from_values([control.is_pending.data, true.output])
+    block.add_op(not_pending)
+    ready = CombOr.from_values([not_pending.result, is_decided.result])
+    block.add_op(ready)
+    return switch.result, ready.result
+
+
 def insert_module_output(
     block: Block,
     fsm_output: SSAValue,
     matcher_unit_inputs: MatcherUnitInputs,
     matcher_unit_name: str,
+    bound_offsets: list[SSAValue] | None = None,
+    ready: SSAValue | None = None,
 ):
+    if bound_offsets is None:
+        bound_offsets = []
     # Construct next input_op
     true = HwConstant.from_attr(IntegerAttr.from_int_and_width(1, 1))
     block.add_op(true)
@@ -304,19 +1679,27 @@ def insert_module_output(
     block.add_op(is_stream_running)
     false = HwConstant.from_attr(IntegerAttr.from_int_and_width(0, 1))
     block.add_op(false)
-    output_register = SeqCompregCe.new(
-        "output_" + matcher_unit_name,
-        matcher_unit_inputs.input_op.typ,
-        matcher_unit_inputs.input_op,
-        matcher_unit_inputs.clock,
-        is_stream_running.result,
-        false.output,
-        matcher_unit_inputs.input_op,
-    )
-    block.add_op(output_register)
+    output_registers: list[SeqCompregCe] = []
+    input_ops = [matcher_unit_inputs.input_op] + matcher_unit_inputs.extra_input_ops
+    for index, input_op in enumerate(input_ops):
+        output_register = SeqCompregCe.new(
+            "output_" + matcher_unit_name + (f"_{index}" if index else ""),
+            input_op.typ,
+            input_op,
+            matcher_unit_inputs.clock,
+            is_stream_running.result,
+            false.output,
+            input_op,
+        )
+        block.add_op(output_register)
+        output_registers.append(output_register)
 
     # Yield output.
-    output = HwOutput.from_outputs([output_register.data, fsm_output])
+    outputs = [output_registers[0].data, fsm_output] + bound_offsets
+    if ready:
+        outputs.append(ready)
+    outputs += [x.data for x in output_registers[1:]]
+    output = HwOutput.from_outputs(outputs)
     block.add_op(output)
 
 
@@ -325,16 +1708,58 @@ def generate_matcher_unit(
     enc_ctx: EncodingContext,
     op_ctx: OperationContext,
     matcher_unit_name: str,
-) -> Tuple[HwModule, FsmMachine]:
-    hw_module_block = Block(
-        arg_types=[
-            i1,  # clock
-            HwOperation.from_encoding_ctx(enc_ctx),  # input_op
-            i1,  # is_stream_paused
-            i1,  # new_sequence
-            i1,  # stream_completed
-        ]
-    )
+    options: MatcherUnitOptions | None = None,
+    filler_templates: FillerTemplateCache | None = None,
+) -> MatcherUnit:
+    """
+    Generates the matcher unit of a pattern and the FSM it instantiates.
+    `filler_templates` can be shared by the units of a chip to build the DAG
+    buffer nodes of the same shape only once.
+
+    If the DAG buffer is double-buffered, the unit has an additional `reset`
+    input, and an additional `ready` output telling whether a new sequence can
+    start. A new sequence may start while the FSM still decides on the previous
+    attempt, whose bank stops gathering. The result of an attempt is then only
+    reported until the FSM moves on to the next one.
+
+    If the unit receives several operations per cycle, the operations following
+    `input_op` are provided as additional `input_op_{k}` inputs, followed by a
+    `root_slot` input giving the index of the root among them on a new
+    sequence. They are forwarded as additional `output_op_{k}` outputs.
+    """
+    if options is None:
+        options = MatcherUnitOptions()
+    stream_width = options.stream_width
+    assert stream_width >= 1 and stream_width & (stream_width - 1) == 0
+    if not filler_templates:
+        filler_templates = FillerTemplateCache(f"{matcher_unit_name}_filler")
+    known_filler_modules = len(filler_templates.modules)
+
+    arg_types: list[Attribute] = [
+        i1,  # clock
+        HwOperation.from_encoding_ctx(enc_ctx),  # input_op
+        i1,  # is_stream_paused
+        i1,  # new_sequence
+        i1,  # stream_completed
+    ]
+    arg_names = [
+        "clock",
+        "input_op",
+        "is_stream_paused",
+        "new_sequence",
+        "stream_completed",
+    ]
+    if options.double_buffered:
+        arg_types.append(i1)
+        arg_names.append("reset")
+    extra_inputs_start = len(arg_types)
+    if stream_width != 1:
+        for index in range(1, stream_width):
+            arg_types.append(HwOperation.from_encoding_ctx(enc_ctx))
+            arg_names.append(f"input_op_{index}")
+        arg_types.append(IntegerType(int(math.log2(stream_width))))
+        arg_names.append("root_slot")
+    hw_module_block = Block(arg_types=arg_types)
 
     matcher_unit_inputs = MatcherUnitInputs(
         hw_module_block.args[0],
@@ -343,35 +1768,65 @@ def generate_matcher_unit(
         hw_module_block.args[3],
         hw_module_block.args[4],
     )
+    if stream_width != 1:
+        matcher_unit_inputs.extra_input_ops = list(
+            hw_module_block.args[extra_inputs_start:-1]
+        )
+        matcher_unit_inputs.root_slot = hw_module_block.args[-1]
 
-    dag_buffer_node_sum_type = HwSumType.from_variants(
-        {
-            "unknown": i1,  # dummy i1
-            "located_at": IntegerType(enc_ctx.operand_offset_width),
-            "found": matcher_unit_inputs.input_op.typ,
-            "never": i1,  # dummy i1
-        }
-    )
-
-    # First step: generate the DAG buffer.
+    # First step: generate the DAG buffer, only storing what the FSM reads.
     dag_span, dag_span_ctx = compute_usage_graph(pdli_region)
-    dag_buffer_ctx = create_filler(
-        dag_span,
-        hw_module_block,
-        matcher_unit_inputs,
-        matcher_unit_name,
-        dag_buffer_node_sum_type,
-        enc_ctx,
+    liveness = compute_dag_buffer_liveness(
+        pdli_region,
+        dag_span_ctx,
+        options.accumulate_offsets,
+        options.report_bound_offsets,
     )
+    sharing = (
+        compute_dag_buffer_sharing(pdli_region, dag_span_ctx)
+        if options.share_equal_nodes
+        else DagBufferSharing()
+    )
+    bank_control: _BankControl | None = None
+    if options.double_buffered:
+        bank_control = create_bank_control(
+            hw_module_block,
+            matcher_unit_inputs,
+            hw_module_block.args[5],
+            matcher_unit_name,
+        )
+        bank_ctxs = [
+            create_filler(
+                dag_span,
+                hw_module_block,
+                bank_inputs,
+                f"{matcher_unit_name}_bank_{bank}",
+                enc_ctx,
+                options,
+                liveness,
+                sharing,
+                filler_templates,
+            )
+            for bank, bank_inputs in enumerate(bank_control.bank_inputs)
+        ]
+        dag_buffer_ctx = bank_ctxs[0]
+        inputs = select_deciding_bank(hw_module_block, bank_control, bank_ctxs)
+    else:
+        dag_buffer_ctx = create_filler(
+            dag_span,
+            hw_module_block,
+            matcher_unit_inputs,
+            matcher_unit_name,
+            enc_ctx,
+            options,
+            liveness,
+            sharing,
+            filler_templates,
+        )
+        inputs = dag_buffer_ctx.fsm_inputs()
 
     # Then, generate the FSM and instanciate it.
-    status_sum_type = HwSumType.from_variants(
-        {
-            "unknown": i1,  # dummy i1
-            "success": i1,  # dummy i1
-            "failure": i1,  # dummy i1
-        }
-    )
+    status_sum_type = match_status_sum_type(pattern_count(pdli_region))
 
     fsm_name = f"{matcher_unit_name}_fsm"
     fsm = generate_fsm(
@@ -380,38 +1835,66 @@ def generate_matcher_unit(
         dag_buffer_ctx,
         enc_ctx,
         fsm_name,
-        dag_buffer_node_sum_type,
         status_sum_type,
+        options.report_bound_offsets,
     )
 
-    inputs = list(map(lambda x: x.data, dag_buffer_ctx.nodes))
     fsm_inst = FsmHwInstance.new(
         f"{fsm_name}_inst",
         fsm_name,
         inputs,
         matcher_unit_inputs.clock,
         matcher_unit_inputs.new_sequence,
-        [status_sum_type],
+        list(fsm.function_type.outputs.data),
     )
     hw_module_block.add_op(fsm_inst)
 
     # Finally, yield module output.
-    assert len(fsm_inst.outputs) == 1
-    insert_module_output(hw_module_block, fsm_inst.outputs[0], matcher_unit_inputs, matcher_unit_name)
+    match_result: SSAValue = fsm_inst.outputs[0]
+    bound_offsets = list(fsm_inst.outputs[1:])
+    if options.early_failure:
+        # With two banks, the root is read from the bank the FSM decides on.
+        root_node = dag_buffer_ctx.span_to_dag[dag_span]
+        root_index = dag_buffer_ctx.nodes.index(root_node)
+        match_result = insert_early_failure(
+            hw_module_block,
+            pdli_region,
+            dag_span_ctx,
+            replace(root_node, data=inputs[root_index]),
+            match_result,
+        )
+    ready: SSAValue | None = None
+    if bank_control:
+        switch, ready = update_bank_control(
+            hw_module_block,
+            bank_control,
+            matcher_unit_inputs.new_sequence,
+            match_result,
+        )
+        fsm_inst.replace_operand(len(inputs) + 1, switch)
+    insert_module_output(
+        hw_module_block,
+        match_result,
+        matcher_unit_inputs,
+        matcher_unit_name,
+        bound_offsets,
+        ready,
+    )
 
     # Build the hardware module
-    return (
+    return MatcherUnit(
         HwModule.from_block(
             matcher_unit_name,
             hw_module_block,
-            [
-                "clock",
-                "input_op",
-                "is_stream_paused",
-                "new_sequence",
-                "stream_completed",
-            ],
-            ["output_op", "match_result"],
+            arg_names,
+            ["output_op", "match_result"]
+            + [f"bound_offset_{x}" for x in range(len(bound_offsets))]
+            + (["ready"] if ready else [])
+            + [f"output_op_{x}" for x in range(1, stream_width)],
         ),
         fsm,
+        filler_templates.modules[known_filler_modules:],
+        pattern_count(pdli_region),
+        options.double_buffered,
+        stream_width,
     )
@@ -0,0 +1,290 @@
+from typing import cast
+
+from xdsl.ir import Block, Region, SSAValue
+from xdsl.dialects.builtin import IntegerAttr, IntegerType, i1
+
+from dialects.fsm import FsmHwInstance
+from dialects.hw import HwConstant, HwModule
+from dialects.hw_op import HwOperation, HwOpGetOperandOffset, HwOpHasOperand
+from dialects.hw_sum import HwSumCreate
+from dialects.seq import SeqCompregCe
+from dialects.comb import *
+
+from lowering.pdli_to_fsm import (
+    DagBufferCtx,
+    DagBufferNode,
+    compute_dag_buffer_liveness,
+    generate_fsm,
+)
+from lowering.pdli_to_matcher_unit import (
+    MatcherUnit,
+    MatcherUnitInputs,
+    dag_buffer_node_sum_type,
+    insert_early_failure,
+    insert_module_output,
+    match_status_sum_type,
+    stored_input_op,
+)
+from lowering.pdli_merge import pattern_count
+from analysis.pattern_dag_span import OperationSpan, compute_usage_graph
+from encoder import EncodingContext
+
+import math
+
+"""
+Generation of window matcher units, an alternative to the gatherer of
+`generate_matcher_unit` for small windows and shallow patterns.
+
+Instead of chasing `located_at` distances in one register per DAG buffer node,
+the unit shifts the operations following the root into a window of `N`
+registers. Once the window is full, the distance of every node from the root
+is the sum of the operand offsets along its path, and its operation is read
+from the window with muxers. The DAG buffer is thus purely combinational, and
+the pattern FSM is the same as the one of the gatherer.
+"""
+
+
+def _constant(block: Block, value: int, width: int) -> SSAValue:
+    constant = HwConstant.from_attr(IntegerAttr.from_int_and_width(value, width))
+    block.add_op(constant)
+    return constant.output
+
+
+def _select_window_op(
+    block: Block, index: SSAValue, window_ops: list[SSAValue]
+) -> SSAValue:
+    """
+    Selects the operation of the window at `index` with a tree of muxers over
+    the bits of the index. Indices past the end select the last operation.
+    """
+    index_width = cast(IntegerType, index.typ).width.data
+    values = window_ops + [window_ops[-1]] * (2**index_width - len(window_ops))
+    for bit in range(index_width):
+        is_bit_set = CombExtract.from_values(index, 1, bit)
+        block.add_op(is_bit_set)
+        selected: list[SSAValue] = []
+        for pair in range(0, len(values), 2):
+            muxer = CombMux.from_values(
+                is_bit_set.output, values[pair + 1], values[pair]
+            )
+            block.add_op(muxer)
+            selected.append(muxer.result)
+        values = selected
+    return values[0]
+
+
+def generate_window_matcher(
+    pdli_region: Region,
+    enc_ctx: EncodingContext,
+    matcher_unit_name: str,
+    window: int,
+    early_failure: bool = False,
+) -> MatcherUnit:
+    """
+    Generates a window matcher unit of a pattern, giving each attempt `window`
+    operations including the root, and the FSM it instantiates.
+
+    The unit has the interface of the units of `generate_matcher_unit`, so it
+    can be chained the same way. It decides once it received `window`
+    operations since the root, regardless of `stream_completed`, so `window`
+    should match the window the chain gives to attempts.
+    """
+    assert window >= 1
+    input_op_type = HwOperation.from_encoding_ctx(enc_ctx)
+    hw_module_block = Block(arg_types=[i1, input_op_type, i1, i1, i1])
+    matcher_unit_inputs = MatcherUnitInputs(
+        hw_module_block.args[0],
+        hw_module_block.args[1],
+        hw_module_block.args[2],
+        hw_module_block.args[3],
+        hw_module_block.args[4],
+    )
+    block = hw_module_block
+    clock = matcher_unit_inputs.clock
+    new_sequence = matcher_unit_inputs.new_sequence
+
+    true = _constant(block, 1, 1)
+    false = _constant(block, 0, 1)
+    is_stream_running = CombXor.from_values(
+        [matcher_unit_inputs.is_stream_paused, true]
+    )
+    block.add_op(is_stream_running)
+
+    # The window is full once `window` operations were received since the root,
+    # it then stops shifting so the root stays in its last register. The count
+    # stays at zero until the first root, so the unit never decides on the
+    # operations it holds at power-on.
+    count_width = math.ceil(math.log2(window + 1))
+    count_register = SeqCompregCe.new(
+        f"{matcher_unit_name}_window_count",
+        IntegerType(count_width),
+        _constant(block, 0, count_width),  # input is defined later
+        clock,
+        is_stream_running.result,
+        false,
+        _constant(block, 0, count_width),
+    )
+    block.add_op(count_register)
+    is_full = CombICmp.from_values(
+        count_register.data, _constant(block, window, count_width), ICmpPredicate.EQ
+    )
+    block.add_op(is_full)
+    is_idle = CombICmp.from_values(
+        count_register.data, _constant(block, 0, count_width), ICmpPredicate.EQ
+    )
+    block.add_op(is_idle)
+    is_holding = CombOr.from_values([is_full.output, is_idle.output])
+    block.add_op(is_holding)
+    incremented = CombAdd.from_values(
+        [count_register.data, _constant(block, 1, count_width)]
+    )
+    block.add_op(incremented)
+    saturated = CombMux.from_values(
+        is_holding.result, count_register.data, incremented.result
+    )
+    block.add_op(saturated)
+    next_count = CombMux.from_values(
+        new_sequence, _constant(block, 1, count_width), saturated.result
+    )
+    block.add_op(next_count)
+    count_register.replace_operand(0, next_count.result)
+
+    is_filling = CombXor.from_values([is_full.output, true])
+    block.add_op(is_filling)
+    is_shifting = CombOr.from_values([new_sequence, is_filling.result])
+    block.add_op(is_shifting)
+    should_shift = CombAnd.from_values([is_stream_running.result, is_shifting.result])
+    block.add_op(should_shift)
+    window_ops: list[SSAValue] = []
+    shifted_op = matcher_unit_inputs.input_op
+    for position in range(window):
+        window_register = SeqCompregCe.new(
+            f"{matcher_unit_name}_window_{position}",
+            input_op_type,
+            shifted_op,
+            clock,
+            should_shift.result,
+            false,
+            shifted_op,
+        )
+        block.add_op(window_register)
+        window_ops.append(window_register.data)
+        shifted_op = window_register.data
+
+    # Then, compute the DAG buffer from the window. Once full, the operation at
+    # distance `d` from the root is in register `window - 1 - d`.
+    dag_span, dag_span_ctx = compute_usage_graph(pdli_region)
+    liveness = compute_dag_buffer_liveness(pdli_region, dag_span_ctx, False)
+    distance_width = math.ceil(
+        math.log2(window + 2**enc_ctx.operand_offset_width)
+    )
+    index_width = max(1, math.ceil(math.log2(window)))
+    last_index = _constant(block, window - 1, distance_width)
+    window_size = _constant(block, window, distance_width)
+    offset_padding = _constant(
+        block, 0, distance_width - enc_ctx.operand_offset_width
+    )
+    distance_one = _constant(block, 1, distance_width)
+
+    ctx = DagBufferCtx()
+
+    def build_node(
+        span: OperationSpan, is_present: SSAValue, distance: SSAValue
+    ) -> DagBufferNode:
+        sum_type = dag_buffer_node_sum_type(
+            input_op_type, enc_ctx, liveness.stored_operands_of(span)
+        )
+        window_index = CombSub.from_values(last_index, distance)
+        block.add_op(window_index)
+        index = CombExtract.from_values(window_index.result, index_width, 0)
+        block.add_op(index)
+        node_op = _select_window_op(block, index.output, window_ops)
+
+        found = HwSumCreate.from_data(
+            sum_type, "found", stored_input_op(block, node_op, sum_type)
+        )
+        block.add_op(found)
+        never = HwSumCreate.from_data(sum_type, "never", true)
+        block.add_op(never)
+        unknown = HwSumCreate.from_data(sum_type, "unknown", false)
+        block.add_op(unknown)
+        present_muxer = CombMux.from_values(is_present, found.output, never.output)
+        block.add_op(present_muxer)
+        full_muxer = CombMux.from_values(
+            is_full.output, present_muxer.result, unknown.output
+        )
+        block.add_op(full_muxer)
+        node = DagBufferNode(full_muxer.result)
+
+        for operand, operand_span in span.operands.items():
+            defining_op = operand_span.defining_op
+            if not defining_op.used:
+                continue
+            # Operands are located `offset + 1` operations after their user.
+            has_operand = HwOpHasOperand.from_operand(node_op, operand)
+            block.add_op(has_operand)
+            offset = HwOpGetOperandOffset.from_operand(node_op, operand)
+            block.add_op(offset)
+            padded_offset = CombConcat.from_values([offset_padding, offset.output])
+            block.add_op(padded_offset)
+            operand_distance = CombAdd.from_values(
+                [distance, padded_offset.output, distance_one]
+            )
+            block.add_op(operand_distance)
+            is_in_window = CombICmp.from_values(
+                operand_distance.result, window_size, ICmpPredicate.ULT
+            )
+            block.add_op(is_in_window)
+            is_operand_present = CombAnd.from_values(
+                [is_present, has_operand.output, is_in_window.output]
+            )
+            block.add_op(is_operand_present)
+            node.store_operands_at[operand] = build_node(
+                defining_op, is_operand_present.result, operand_distance.result
+            )
+
+        ctx.nodes.append(node)
+        ctx.span_to_dag[span] = node
+        return node
+
+    root_node = build_node(dag_span, true, _constant(block, 0, distance_width))
+
+    # Finally, generate the FSM and instantiate it.
+    status_sum_type = match_status_sum_type(pattern_count(pdli_region))
+    fsm_name = f"{matcher_unit_name}_fsm"
+    fsm = generate_fsm(
+        pdli_region, dag_span_ctx, ctx, enc_ctx, fsm_name, status_sum_type
+    )
+    fsm_inst = FsmHwInstance.new(
+        f"{fsm_name}_inst",
+        fsm_name,
+        ctx.fsm_inputs(),
+        clock,
+        new_sequence,
+        list(fsm.function_type.outputs.data),
+    )
+    block.add_op(fsm_inst)
+
+    match_result: SSAValue = fsm_inst.outputs[0]
+    if early_failure:
+        match_result = insert_early_failure(
+            block, pdli_region, dag_span_ctx, root_node, match_result
+        )
+    insert_module_output(block, match_result, matcher_unit_inputs, matcher_unit_name)
+
+    return MatcherUnit(
+        HwModule.from_block(
+            matcher_unit_name,
+            block,
+            [
+                "clock",
+                "input_op",
+                "is_stream_paused",
+                "new_sequence",
+                "stream_completed",
+            ],
+            ["output_op", "match_result"],
+        ),
+        fsm,
+        pattern_count=pattern_count(pdli_region),
+    )
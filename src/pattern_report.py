@@ -0,0 +1,116 @@
+from xdsl.ir import MLContext
+from xdsl.dialects.arith import Arith
+from xdsl.dialects.builtin import Builtin
+from xdsl.parser import Parser
+from xdsl.pattern_rewriter import PatternRewriteWalker, GreedyRewritePatternApplier
+from subprocess import Popen, PIPE
+
+from dialects.pdl_interp import PdlInterp
+from dialects.pdl import Pdl
+
+from analysis.pattern_dag_span import compute_usage_graph
+from analysis.span_metrics import compute_span_metrics
+from encoder import EncodingContext
+from lowering.pdli_switchify import (
+    MergeSwitchCascades,
+    SwitchifyPdlInterp,
+    remove_unreachable_blocks,
+)
+
+from utils import UnsupportedPatternFeature
+
+"""
+Reports the span tree cost of every pattern of a library, without generating
+hardware. Patterns that may not fit in the `N` operations given to a matcher
+unit are flagged.
+
+Usage: python pattern_report.py [--bound N] [--offset-width W] FILE.pdll...
+"""
+
+MIN_PYTHON = (3, 10)
+
+MLIR_PDLL = "./mlir-pdll"
+MLIR_OPT = "./mlir-opt"
+
+import argparse
+import sys
+
+if sys.version_info < MIN_PYTHON:
+    sys.exit("Python %s.%s or later is required.\n" % MIN_PYTHON)
+
+arg_parser = argparse.ArgumentParser(description="Span tree cost of PDLL patterns.")
+arg_parser.add_argument("patterns", nargs="+", help="PDLL files to analyze")
+arg_parser.add_argument(
+    "--bound", type=int, default=8, help="amount of matcher units N in a chain"
+)
+arg_parser.add_argument("--opcode-width", type=int, default=4)
+arg_parser.add_argument("--offset-width", type=int, default=4)
+arg_parser.add_argument("--max-operands", type=int, default=2)
+args = arg_parser.parse_args()
+
+enc_ctx = EncodingContext(args.opcode_width, args.offset_width, args.max_operands)
+
+context = MLContext()
+
+context.register_dialect(Arith)
+context.register_dialect(Builtin)
+context.register_dialect(Pdl)
+context.register_dialect(PdlInterp)
+
+
+def load_matcher(pattern_file: str):
+    mlir_opt_process = Popen(
+        [MLIR_OPT, "-mlir-print-op-generic", "--convert-pdl-to-pdl-interp"],
+        stdin=PIPE,
+        stdout=PIPE,
+    )
+    mlir_pdll_process = Popen(
+        [MLIR_PDLL, pattern_file, "-x=mlir"], stdout=mlir_opt_process.stdin
+    )
+    mlir_opt_process.stdin.close()  # de-duplicate stdin handle # type: ignore
+    pdl_interp_src = mlir_opt_process.stdout.read().decode()  # type: ignore
+    mlir_pdll_process.wait()
+
+    pdl_interp_data = Parser(context, pdl_interp_src).parse_module()
+    walker = PatternRewriteWalker(
+        GreedyRewritePatternApplier([SwitchifyPdlInterp()]),
+        walk_regions_first=True,
+        apply_recursively=True,
+        walk_reverse=False,
+    )
+    walker.rewrite_module(pdl_interp_data)
+    walker = PatternRewriteWalker(
+        GreedyRewritePatternApplier([MergeSwitchCascades()]),
+        walk_regions_first=True,
+        apply_recursively=True,
+        walk_reverse=False,
+    )
+    walker.rewrite_module(pdl_interp_data)
+    matcher_func = pdl_interp_data.regions[0].ops.first
+    remove_unreachable_blocks(matcher_func.regions[0])  # type: ignore
+    return matcher_func
+
+
+may_exceed = 0
+never_fit = 0
+unsupported = 0
+for pattern_file in args.patterns:
+    matcher_func = load_matcher(pattern_file)
+    try:
+        _, dag_span_ctx = compute_usage_graph(matcher_func.regions[0])  # type: ignore
+    except UnsupportedPatternFeature as e:
+        unsupported += 1
+        print(f"{pattern_file}: unsupported feature {e.culprit}")
+        continue
+    metrics = compute_span_metrics(dag_span_ctx, enc_ctx)
+    if metrics.never_fits(args.bound):
+        never_fit += 1
+    elif metrics.may_exceed(args.bound):
+        may_exceed += 1
+    print(f"{pattern_file}: {metrics.format(args.bound)}")
+
+print(
+    f"{len(args.patterns)} pattern files, {never_fit} never fit and"
+    f" {may_exceed} may exceed N = {args.bound}, {unsupported} unsupported",
+    file=sys.stderr,
+)
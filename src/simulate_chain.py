@@ -0,0 +1,55 @@
+from analysis.chain_simulation import compare_chain_schemes
+from lowering.matcher_chain import fifo_depth_for_cycle_bound
+
+"""
+Compares the stall cycles of the lock-step and decoupled chains of matcher
+units on a synthetic stream, where each attempt is decided after a random
+amount of cycles up to the cycle bound of the FSM.
+
+Usage: python simulate_chain.py [--units N] [--window W] [--bound B]
+                                [--length L] [--fifo-depth D] [--seed S]
+"""
+
+MIN_PYTHON = (3, 10)
+
+import argparse
+import random
+import sys
+
+if sys.version_info < MIN_PYTHON:
+    sys.exit("Python %s.%s or later is required.\n" % MIN_PYTHON)
+
+arg_parser = argparse.ArgumentParser(description="Chain stall simulation.")
+arg_parser.add_argument("--units", type=int, default=8, help="matcher units")
+arg_parser.add_argument(
+    "--window", type=int, help="operations per attempt, defaults to the units"
+)
+arg_parser.add_argument(
+    "--bound", type=int, default=8, help="FSM cycle bound after the window"
+)
+arg_parser.add_argument(
+    "--length", type=int, default=10000, help="operations in the stream"
+)
+arg_parser.add_argument(
+    "--fifo-depth", type=int, help="defaults to the depth derived from the bound"
+)
+arg_parser.add_argument("--seed", type=int, default=0, help="random seed")
+args = arg_parser.parse_args()
+
+window = args.window or args.units
+fifo_depth = args.fifo_depth or fifo_depth_for_cycle_bound(args.bound)
+# Invalid parameters exit with an error instead of reporting a meaningless
+# comparison.
+if args.units < 1 or not 1 <= window <= args.units:
+    arg_parser.error("the window must be between one and the amount of units")
+if args.bound < 0 or args.length < 1 or fifo_depth < 1:
+    arg_parser.error("the bound, length and FIFO depth must be positive")
+
+generator = random.Random(args.seed)
+latencies = [generator.randint(0, args.bound) for _ in range(args.length)]
+
+print(
+    compare_chain_schemes(
+        args.units, window, args.length, lambda root: latencies[root], fifo_depth
+    ).format()
+)